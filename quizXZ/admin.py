@@ -2,7 +2,28 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Quiz, Question, Choice, QuizUser
+from .models import Quiz, Question, Choice, QuizUser, Answer, QuizResult, GradingJob, Draft
+from . import regrade
+from . import signals
+
+
+class ContentAdmin(admin.ModelAdmin):
+    """Invalidate the cached content of the quizzes an admin page changed again after its transaction commits."""
+
+    def changeform_view(self, *args, **kwargs):
+        """Add or change an object and its inlines."""
+        with signals.content_changes():
+            return super(ContentAdmin, self).changeform_view(*args, **kwargs)
+
+    def delete_view(self, *args, **kwargs):
+        """Delete an object."""
+        with signals.content_changes():
+            return super(ContentAdmin, self).delete_view(*args, **kwargs)
+
+    def changelist_view(self, *args, **kwargs):
+        """List the objects and run actions, such as deleting the selected ones, on them."""
+        with signals.content_changes():
+            return super(ContentAdmin, self).changelist_view(*args, **kwargs)
 
 
 class ChoiceInline(admin.StackedInline):
@@ -17,18 +38,32 @@ class QuizUserInline(admin.TabularInline):
     model = QuizUser
 
 
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionAdmin(ContentAdmin):
     """Display the Choices inline in the Question admin."""
 
     inlines = [ChoiceInline, ]
 
 
-class QuizAdmin(admin.ModelAdmin):
-    """Display the QuizUser inline in the Quiz admin."""
+class QuizAdmin(ContentAdmin):
+    """Display the QuizUser inline in the Quiz admin and re-grade selected quizzes."""
 
     inlines = [QuizUserInline, ]
+    actions = ['regrade_quizzes']
+
+    def regrade_quizzes(self, request, queryset):
+        """Score every attempt at the selected quizzes again with their current choice points."""
+        updated = 0
+        for quiz_id in queryset.values_list('id', flat=True):
+            counts = regrade.regrade(quiz_id)
+            updated = updated + counts['updated'] + counts['created']
+        self.message_user(request, "Re-graded %d quizzes, %d results changed." % (queryset.count(), updated))
+    regrade_quizzes.short_description = "Re-grade the selected quizzes"
 
 
 admin.site.register(Quiz, QuizAdmin)
 admin.site.register(Question, QuestionAdmin)
-admin.site.register(Choice)
+admin.site.register(Choice, ContentAdmin)
+admin.site.register(Answer)
+admin.site.register(QuizResult)
+admin.site.register(GradingJob)
+admin.site.register(Draft)
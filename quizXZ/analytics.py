@@ -0,0 +1,113 @@
+"""analytics.py for the quiz system."""
+from django.core.cache import cache
+from django.db.models import Count
+
+from models import Question, Choice, QuizUser, AnswerPattern, QuizResult
+import answerkey
+import caching
+import patterns
+
+# Seconds the analytics of a quiz are cached; editing the quiz clears them.
+ANALYTICS_TIMEOUT = 60
+
+
+def median(distribution):
+    """Return the median of a sorted list of (value, count) pairs."""
+    size = sum(count for value, count in distribution)
+    if not size:
+        return None
+    middle = []
+    seen = 0
+    for value, count in distribution:
+        for position in ((size - 1) // 2, size // 2):
+            if seen <= position < seen + count:
+                middle.append(value)
+        seen = seen + count
+    return sum(middle) / float(len(middle))
+
+
+def histogram(distribution, total):
+    """Group a score distribution into one bin per whole point from 0 to total."""
+    bins = [{'low': low, 'high': low + 1, 'count': 0} for low in range(int(total) + 1)]
+    for value, count in distribution:
+        bins[min(int(value), len(bins) - 1)]['count'] += count
+    bins[-1]['high'] = bins[-1]['low']
+    return bins
+
+
+def quiz_stats(quiz_id):
+    """Return the analytics of a quiz computed with GROUP BY aggregates and the answer patterns.
+
+    The result holds the number of attempts, the score distribution,
+    histogram, mean and median from the stored results, and for every
+    question its percent correct (attempts that selected exactly its
+    correct choices), its mean points and how often each of its choices
+    was picked. The per-question figures come from the AnswerPattern rows,
+    one per distinct selection of a question, scored with the current
+    points of the choices, so neither the number of queries nor the rows
+    read grow with the number of attempts; only the score distribution is
+    still aggregated over the stored results.
+    """
+    key = answerkey.get(quiz_id)
+    attempts = QuizUser.objects.filter(quiz_id=quiz_id).count()
+
+    distribution = [(score, count) for score, count in QuizResult.objects.filter(quiz_id=quiz_id).values_list(
+        'score').annotate(count=Count('id')).order_by('score')]
+    graded = sum(count for score, count in distribution)
+    mean = sum(score * count for score, count in distribution) / float(graded) if graded else None
+
+    questions = []
+    by_id = {}
+    for question_id, text in Question.objects.filter(quiz_id=quiz_id).order_by('id').values_list('id', 'text'):
+        question = {'id': question_id, 'text': text, 'answered': 0, 'full_marks': 0, 'points': 0,
+                    'correct_choices': key.correct.get(question_id, 0), 'choices': []}
+        questions.append(question)
+        by_id[question_id] = question
+    choices = list(Choice.objects.filter(question__quiz_id=quiz_id).order_by('question_id', 'id').values_list(
+        'id', 'text', 'question_id', 'point'))
+    points = dict((choice_id, point) for choice_id, text, question_id, point in choices)
+    picks = {}
+    for question_id, selected, count in AnswerPattern.objects.filter(
+            question__quiz_id=quiz_id, attempts__gt=0).values_list('question_id', 'choices', 'attempts'):
+        # Choices deleted since are left out, as their answers were.
+        selected = [choice_id for choice_id in patterns.choice_ids(selected) if choice_id in points]
+        if not selected:
+            continue
+        for choice_id in selected:
+            picks[choice_id] = picks.get(choice_id, 0) + count
+        tally = [sum(1 for choice_id in selected if points[choice_id] == point) for point in (2, 1, 0)]
+        question = by_id[question_id]
+        question['answered'] += count
+        question['points'] += answerkey.question_score(*tally) * count
+        if tally[1:] == [0, 0] and tally[0] == question['correct_choices']:
+            question['full_marks'] += count
+    for choice_id, text, question_id, point in choices:
+        by_id[question_id]['choices'].append({
+            'id': choice_id, 'text': text, 'point': point, 'picks': picks.get(choice_id, 0),
+            'percent': 100.0 * picks.get(choice_id, 0) / attempts if attempts else 0})
+    for question in questions:
+        question['percent_correct'] = 100.0 * question['full_marks'] / attempts if attempts else 0
+        question['mean_points'] = float(question['points']) / attempts if attempts else 0
+        del question['points']
+
+    return {
+        'quiz_id': int(quiz_id),
+        'attempts': attempts,
+        'graded': graded,
+        'total': key.total,
+        'mean': mean,
+        'median': median(distribution),
+        'distribution': [{'score': score, 'count': count} for score, count in distribution],
+        'histogram': histogram(distribution, key.total),
+        'questions': questions,
+    }
+
+
+def cached_stats(quiz_id):
+    """Return quiz_stats of the quiz, from the cache when it was computed in the last ANALYTICS_TIMEOUT seconds."""
+    key = 'quiz:%s:analytics:%s' % (quiz_id, caching.quiz_version(quiz_id))
+    stats = cache.get(key)
+    if stats is None:
+        stats = quiz_stats(quiz_id)
+        cache.set(key, stats, ANALYTICS_TIMEOUT)
+    return stats
@@ -0,0 +1,134 @@
+"""answerkey.py for the quiz system."""
+import threading
+from collections import OrderedDict
+
+from models import Choice
+import caching
+
+# Number of quizzes whose answer keys are kept in memory by each process.
+CACHE_SIZE = 256
+
+# Keep IN (...) lists under SQLite's limit on query parameters.
+CHUNK_SIZE = 500
+
+
+def chunks(ids):
+    """Split a collection of ids into sorted lists of at most CHUNK_SIZE ids."""
+    ids = sorted(ids)
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+
+def question_score(numCorrect, numPartial, numWrong):
+    """Apply the grading rule to the selections made on one question.
+
+    Any wrong selection zeroes the question, otherwise every correct
+    selection is worth one point and each partial selection halves it.
+    """
+    if numWrong > 0:
+        return 0
+    question_point = numCorrect
+    for i in range(0, numPartial):
+        question_point = question_point * 0.5
+    return question_point
+
+
+class AnswerKey(object):
+    """Immutable answer key of one quiz.
+
+    points maps each choice id to its (question_id, point), correct maps each
+    question id to its number of correct choices and total is the number of
+    correct choices in the quiz.
+    """
+
+    __slots__ = ('quiz_id', 'version', 'points', 'correct', 'total')
+
+    def __init__(self, quiz_id, choices, version=None):
+        """Build the key from (choice_id, question_id, point) rows."""
+        points = {}
+        correct = {}
+        for choice_id, question_id, point in choices:
+            points[choice_id] = (question_id, point)
+            correct.setdefault(question_id, 0)
+            if point == 2:
+                correct[question_id] += 1
+        object.__setattr__(self, 'quiz_id', quiz_id)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'points', points)
+        object.__setattr__(self, 'correct', correct)
+        object.__setattr__(self, 'total', sum(correct.values()))
+
+    def __setattr__(self, name, value):
+        """Refuse to change the key once it is built."""
+        raise AttributeError("AnswerKey is immutable")
+
+    def __contains__(self, choice_id):
+        """Return whether the choice belongs to the quiz."""
+        return choice_id in self.points
+
+    def grade(self, selections):
+        """Grade the selected choice ids; ids that are not in the quiz are ignored."""
+        points = self.points
+        tallies = {}
+        for selection in set(selections):
+            if selection in points:
+                question_id, point = points[selection]
+                if point in (0, 1, 2):
+                    tallies.setdefault(question_id, [0, 0, 0])[point] += 1
+        point = 0
+        for numWrong, numPartial, numCorrect in tallies.values():
+            point = point + question_score(numCorrect, numPartial, numWrong)
+        return {'score': point, 'total': self.total}
+
+
+_keys = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_many(quiz_ids):
+    """Return a dict mapping each quiz id to its answer key.
+
+    Keys are kept in a per-process LRU cache and checked against the quiz's
+    content version in the default cache. That cache is shared by the worker
+    processes (see CACHES in settings.py), so a key changed in any process
+    is rebuilt. All missing keys are built with one query per chunk of
+    quizzes.
+    """
+    quiz_ids = set(int(quiz_id) for quiz_id in quiz_ids)
+    versions = caching.quiz_versions(quiz_ids)
+    keys = {}
+    with _lock:
+        for quiz_id in quiz_ids:
+            key = _keys.get(quiz_id)
+            if key is not None and key.version == versions[quiz_id]:
+                del _keys[quiz_id]
+                _keys[quiz_id] = key
+                keys[quiz_id] = key
+    missing = quiz_ids.difference(keys)
+    if missing:
+        rows = dict((quiz_id, []) for quiz_id in missing)
+        for quiz_chunk in chunks(missing):
+            choices = Choice.objects.filter(question__quiz_id__in=quiz_chunk).values_list(
+                'id', 'question_id', 'point', 'question__quiz_id')
+            for choice_id, question_id, point, quiz_id in choices:
+                rows[quiz_id].append((choice_id, question_id, point))
+        with _lock:
+            for quiz_id in missing:
+                key = AnswerKey(quiz_id, rows[quiz_id], versions[quiz_id])
+                _keys.pop(quiz_id, None)
+                _keys[quiz_id] = key
+                keys[quiz_id] = key
+            while len(_keys) > CACHE_SIZE:
+                _keys.popitem(last=False)
+    return keys
+
+
+def get(quiz_id):
+    """Return the answer key of the quiz."""
+    return get_many([quiz_id])[int(quiz_id)]
+
+
+def invalidate(quiz_id):
+    """Drop the quiz's answer key from this process's cache."""
+    with _lock:
+        _keys.pop(int(quiz_id), None)
@@ -0,0 +1,13 @@
+"""apps.py for the quiz system."""
+from django.apps import AppConfig
+
+
+class QuizXZConfig(AppConfig):
+    """App config that connects the quiz system's signal handlers and checks."""
+
+    name = 'quizXZ'
+
+    def ready(self):
+        """Import the signal handlers and checks so they are connected."""
+        import checks
+        import signals
@@ -0,0 +1,242 @@
+"""bank.py for the quiz system."""
+import csv
+import json
+
+from django.db import transaction
+
+from models import Quiz, Question, Choice
+from generator import Generator
+from reports import Echo
+import counters
+import signals
+
+FORMATS = ('jsonl', 'csv')
+CSV_COLUMNS = ['quiz', 'subject', 'difficulty', 'question', 'choice', 'point']
+
+# Quizzes parsed and inserted at a time on import, and read at a time on export.
+BATCH_SIZE = 100
+
+DIFFICULTIES = [level for level, name in Quiz.diffLevels]
+POINTS = [point for point, value in Choice.pointTypes]
+
+
+class InvalidBank(Exception):
+    """Raised when an imported quiz bank cannot be read; the message names the offending line."""
+
+
+def guess_format(filename, default='jsonl'):
+    """Return the format matching the file name's extension, or default."""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def text(value, field, line):
+    """Return value as stripped text that fits the model field, or raise InvalidBank."""
+    if isinstance(value, str):
+        try:
+            value = value.decode('utf-8')
+        except UnicodeDecodeError:
+            raise InvalidBank("Line %d: %s is not UTF-8 text." % (line, field.name))
+    if not isinstance(value, basestring):
+        raise InvalidBank("Line %d: %s must be text." % (line, field.name))
+    value = value.strip()
+    if len(value) > field.max_length:
+        raise InvalidBank("Line %d: %s is longer than %d characters." % (line, field.name, field.max_length))
+    return value
+
+
+def number(value, allowed, name, line):
+    """Return value as an int that is one of allowed, or raise InvalidBank."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidBank("Line %d: %s must be a number." % (line, name))
+    if value not in allowed:
+        raise InvalidBank("Line %d: %s must be one of %s." % (line, name, allowed))
+    return value
+
+
+def clean_quiz(data, line):
+    """Check a parsed quiz and return it as a (quiz, [(question text, [(choice text, point)])]) pair."""
+    if not isinstance(data, dict):
+        raise InvalidBank("Line %d: expected a quiz object." % line)
+    name = text(data.get('name'), Quiz._meta.get_field('name'), line)
+    if not name:
+        raise InvalidBank("Line %d: the quiz has no name." % line)
+    quiz = Quiz(name=name, subject=text(data.get('subject', ''), Quiz._meta.get_field('subject'), line),
+                difficulty=number(data.get('difficulty', 0), DIFFICULTIES, 'difficulty', line))
+    questions = []
+    for question in data.get('questions') or []:
+        if not isinstance(question, dict):
+            raise InvalidBank("Line %d: expected a question object." % line)
+        choices = []
+        for choice in question.get('choices') or []:
+            if not isinstance(choice, dict):
+                raise InvalidBank("Line %d: expected a choice object." % line)
+            choices.append((text(choice.get('text'), Choice._meta.get_field('text'), line),
+                            number(choice.get('point', 0), POINTS, 'point', line)))
+        questions.append((text(question.get('text'), Question._meta.get_field('text'), line), choices))
+    return quiz, questions
+
+
+def read_jsonl(lines):
+    """Yield (line number, quiz dict) for every quiz in JSON Lines input, one quiz per line."""
+    for line, row in enumerate(lines, 1):
+        if not row.strip():
+            continue
+        try:
+            yield line, json.loads(row)
+        except ValueError as e:
+            raise InvalidBank("Line %d: %s" % (line, e))
+
+
+def read_csv(lines):
+    """Yield (line number, quiz dict) for every quiz in CSV input with a header of CSV_COLUMNS.
+
+    Consecutive rows with the same quiz, subject and difficulty belong to one
+    quiz, and consecutive rows of a quiz with the same question text to one
+    question. A row with an empty choice adds a question without choices,
+    and a row with an empty question a quiz without questions.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    if [column.strip().lower() for column in header] != CSV_COLUMNS:
+        raise InvalidBank("Line 1: expected the columns %s." % ','.join(CSV_COLUMNS))
+    quiz = None
+    start = None
+    for row in reader:
+        line = reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) != len(CSV_COLUMNS):
+            raise InvalidBank("Line %d: expected %d columns." % (line, len(CSV_COLUMNS)))
+        name, subject, difficulty, question, choice, point = row
+        if quiz is None or (quiz['name'], quiz['subject'], quiz['difficulty']) != (name, subject, difficulty):
+            if quiz is not None:
+                yield start, quiz
+            quiz = {'name': name, 'subject': subject, 'difficulty': difficulty, 'questions': []}
+            start = line
+        if not question.strip():
+            continue
+        if not quiz['questions'] or quiz['questions'][-1]['text'] != question:
+            quiz['questions'].append({'text': question, 'choices': []})
+        if choice.strip():
+            quiz['questions'][-1]['choices'].append({'text': choice, 'point': point})
+    if quiz is not None:
+        yield start, quiz
+
+
+def insert(loader, batch):
+    """Insert a batch of cleaned quizzes with their questions and choices and return the new quiz ids.
+
+    Quizzes are saved a row at a time so their ids come back from the
+    inserts, and their post_save signal moves each to a new content version.
+    Their questions and then their choices go in with bulk_create, which
+    sends no signals, so every counter is set here. The questions are read
+    back in quiz and id order; nothing else can add questions to quizzes
+    that are not committed yet.
+    """
+    quiz_ids = []
+    new_questions = []
+    for quiz, questions in batch:
+        quiz.num_questions = len(questions)
+        quiz.max_total = sum(counters.correct(point) for question, choices in questions for choice, point in choices)
+        quiz.save()
+        quiz_ids.append(quiz.id)
+        new_questions.extend(Question(quiz_id=quiz.id, text=question, num_choices=len(choices),
+                                      num_correct=sum(counters.correct(point) for choice, point in choices))
+                             for question, choices in questions)
+    loader.bulk_create(Question, new_questions)
+    question_ids = iter(Question.objects.filter(quiz_id__in=quiz_ids).order_by('quiz_id', 'id').values_list(
+        'id', flat=True))
+    new_choices = []
+    for quiz, questions in sorted(batch, key=lambda pair: pair[0].id):
+        for question, choices in questions:
+            question_id = next(question_ids)
+            new_choices.extend(Choice(question_id=question_id, text=choice, point=point) for choice, point in choices)
+    loader.bulk_create(Choice, new_choices)
+    return quiz_ids
+
+
+def import_bank(lines, format='jsonl', batch_size=BATCH_SIZE):
+    """Import the quizzes in lines, a file or any iterable of lines, in the given format.
+
+    Returns the number of quizzes, questions and choices created. The input
+    is parsed as it is read and inserted batch_size quizzes at a time, with
+    one bulk_create each for the questions and the choices of a batch, all
+    in one transaction, so either every quiz is imported or, on an
+    InvalidBank error, none is.
+    """
+    if format not in FORMATS:
+        raise InvalidBank("Unknown format %r." % format)
+    read = read_jsonl if format == 'jsonl' else read_csv
+    loader = Generator(batch_size=1000)
+    created = {'quizzes': 0, 'questions': 0, 'choices': 0}
+    quiz_ids = []
+    with signals.content_changes(), transaction.atomic():
+        batch = []
+        for line, data in read(lines):
+            quiz, questions = clean_quiz(data, line)
+            batch.append((quiz, questions))
+            created['quizzes'] += 1
+            created['questions'] += len(questions)
+            created['choices'] += sum(len(choices) for question, choices in questions)
+            if len(batch) >= batch_size:
+                quiz_ids.extend(insert(loader, batch))
+                batch = []
+        if batch:
+            quiz_ids.extend(insert(loader, batch))
+    return created
+
+
+def export_quizzes(quiz_ids=None, batch_size=BATCH_SIZE):
+    """Yield a dict for every quiz, with its questions and choices, in id order.
+
+    Three queries read batch_size quizzes at a time, so memory does not grow
+    with the size of the bank.
+    """
+    after = 0
+    while True:
+        quizzes = Quiz.objects.filter(id__gt=after, archived=False).order_by('id')
+        if quiz_ids is not None:
+            quizzes = quizzes.filter(id__in=quiz_ids)
+        quizzes = list(quizzes.values_list('id', 'name', 'subject', 'difficulty')[:batch_size])
+        if not quizzes:
+            break
+        ids = [row[0] for row in quizzes]
+        choices = {}
+        for question_id, choice, point in Choice.objects.filter(question__quiz_id__in=ids).order_by(
+                'question_id', 'id').values_list('question_id', 'text', 'point'):
+            choices.setdefault(question_id, []).append({'text': choice, 'point': point})
+        questions = {}
+        for question_id, quiz_id, question in Question.objects.filter(quiz_id__in=ids).order_by(
+                'quiz_id', 'id').values_list('id', 'quiz_id', 'text'):
+            questions.setdefault(quiz_id, []).append({'text': question, 'choices': choices.get(question_id, [])})
+        for quiz_id, name, subject, difficulty in quizzes:
+            yield {'name': name, 'subject': subject, 'difficulty': difficulty,
+                   'questions': questions.get(quiz_id, [])}
+        after = ids[-1]
+
+
+def export_bank(format='jsonl', quiz_ids=None, batch_size=BATCH_SIZE):
+    """Yield the quizzes, with their questions and choices, as lines of JSON Lines or CSV."""
+    if format not in FORMATS:
+        raise InvalidBank("Unknown format %r." % format)
+    if format == 'jsonl':
+        for quiz in export_quizzes(quiz_ids, batch_size):
+            yield json.dumps(quiz, sort_keys=True) + '\n'
+        return
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for quiz in export_quizzes(quiz_ids, batch_size):
+        head = [quiz['name'].encode('utf-8'), quiz['subject'].encode('utf-8'), quiz['difficulty']]
+        for question in quiz['questions'] or [{'text': '', 'choices': []}]:
+            for choice in question['choices'] or [{'text': '', 'point': ''}]:
+                yield writer.writerow(head + [question['text'].encode('utf-8'),
+                                              choice['text'].encode('utf-8'), choice['point']])
@@ -0,0 +1,193 @@
+"""benchmark.py for the quiz system."""
+import os
+import pickle
+import resource
+import time
+import traceback
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from models import Quiz, Choice, QuizUser
+from generator import Generator
+import caching
+
+# Number of quizzes, questions per quiz, choices per question, users, and
+# users taking each quiz.
+DEFAULT_SIZE = {
+    'quizzes': 10,
+    'questions': 20,
+    'choices': 4,
+    'users': 50,
+    'attempts': 25,
+}
+
+PASSWORD = 'benchmark'
+
+# Ratios against the baseline above which an endpoint counts as a regression.
+# Latency must also grow by more than LATENCY_SLACK_MS so that noise on very
+# fast endpoints is not reported.
+LATENCY_TOLERANCE = 1.5
+LATENCY_SLACK_MS = 5
+QUERY_TOLERANCE = 1.0
+MEMORY_TOLERANCE = 1.5
+MEMORY_SLACK_KB = 2048
+
+
+def seed(size, seed_value=0):
+    """Fill the database with generated quizzes, users and attempts of the given size.
+
+    Each quiz except the last is taken by size['attempts'] users; the last
+    one is left untaken so it can be submitted. Returns the admin user, a
+    student and the untaken quiz.
+    """
+    generator = Generator(seed_value)
+    admin = User.objects.create(username='bench_admin', password=make_password(PASSWORD),
+                                is_superuser=True, is_staff=True)
+    user_ids = generator.users(size['users'], 'bench_user', PASSWORD)
+    shape = dict(questions=(size['questions'], size['questions']), choices=(size['choices'], size['choices']))
+    generator.quizzes(size['quizzes'] - 1, user_ids=user_ids,
+                      attempts=(size['attempts'], size['attempts']), **shape)
+    generator.quizzes(1, **shape)
+    student = User.objects.get(id=user_ids[0])
+    return admin, student, Quiz.objects.order_by('-id').first()
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a list of numbers."""
+    values = sorted(values)
+    if not values:
+        return 0
+    rank = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def measure(client, method, url, data=None, repeat=10, rollback=False):
+    """Request the url repeat times and return its latency and query count.
+
+    The first request warms the caches and is not timed. With rollback each
+    request runs in a transaction that is rolled back, so a submission can
+    be repeated.
+    """
+    timings = []
+    queries = 0
+    for i in range(repeat + 1):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                start = time.time()
+                response = getattr(client, method)(url, data or {})
+                if hasattr(response, 'streaming_content'):
+                    for chunk in response.streaming_content:
+                        pass
+                elapsed = time.time() - start
+            if rollback:
+                transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise AssertionError("%s returned %d" % (url, response.status_code))
+        if i > 0:
+            timings.append(elapsed * 1000)
+            queries = max(queries, len(captured))
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'queries': queries,
+    }
+
+
+def isolated(function, *args, **kwargs):
+    """Call function in a forked child and return its result dict with the memory the call needed.
+
+    The peak resident memory of the process only grows, so measured in one
+    process it would be set by the seeding and be the same for every
+    endpoint. A fresh child starts with a small peak, and its growth while
+    the function runs is recorded as memory_kb. The parent waits for the
+    child, so the child can use the parent's database connection; it leaves
+    with os._exit so the connection is not closed under the parent.
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_end)
+            start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            result = function(*args, **kwargs)
+            result['memory_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start
+            with os.fdopen(write_end, 'wb') as f:
+                pickle.dump(result, f)
+            status = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+    os.close(write_end)
+    with os.fdopen(read_end, 'rb') as f:
+        data = f.read()
+    pid, status = os.waitpid(pid, 0)
+    if status != 0:
+        raise AssertionError("The benchmark child process failed with status %d." % status)
+    return pickle.loads(data)
+
+
+def run(size=None, repeat=10, seed_value=0):
+    """Seed the current database and measure the main quiz endpoints.
+
+    Returns a dict with the size used and, for every endpoint, its p50 and
+    p95 latency in milliseconds, its query count and the peak memory in KB
+    it needed, each endpoint measured in a process of its own. The run uses
+    a private cache so the generated quizzes never reach the site's cache.
+    """
+    size = dict(DEFAULT_SIZE, **(size or {}))
+    with override_settings(CACHES=caching.PRIVATE_CACHES):
+        admin, student, untaken = seed(size, seed_value)
+        attempt = QuizUser.objects.order_by('id').first()
+        taken = None
+        if attempt is not None:
+            student, taken = attempt.user, attempt.quiz_id
+        picks = list(Choice.objects.filter(question__quiz=untaken).values_list('id', flat=True)[::size['choices']])
+
+        results = {}
+        client = Client()
+        client.login(username=student.username, password=PASSWORD)
+        results['quizzes'] = isolated(measure, client, 'get', reverse('quizzes'), repeat=repeat)
+        results['questions'] = isolated(
+            measure, client, 'get', reverse('questions', kwargs={'quiz_id': untaken.id}), repeat=repeat)
+        results['save_userchoice'] = isolated(
+            measure, client, 'post', reverse('save_userchoice', kwargs={'quiz_id': untaken.id}),
+            {'userchoice': picks}, repeat=repeat, rollback=True)
+        if taken:
+            results['report'] = isolated(
+                measure, client, 'get', reverse('report', kwargs={'user_id': student.id, 'quiz_id': taken}),
+                repeat=repeat)
+        results['my_report'] = isolated(measure, client, 'get', reverse('my_report'), repeat=repeat)
+        client.login(username=admin.username, password=PASSWORD)
+        results['users_report'] = isolated(measure, client, 'get', reverse('users_report'), repeat=repeat)
+        results['users_report_csv'] = isolated(
+            measure, client, 'get', reverse('users_report'), {'format': 'csv'}, repeat=repeat)
+    return {'size': size, 'repeat': repeat, 'endpoints': results}
+
+
+def compare(current, baseline, latency_tolerance=LATENCY_TOLERANCE, query_tolerance=QUERY_TOLERANCE,
+            memory_tolerance=MEMORY_TOLERANCE):
+    """Return a list of messages for every endpoint that regressed against the baseline.
+
+    Memory must also grow by more than MEMORY_SLACK_KB, and is not compared
+    with baselines written before it was measured per endpoint.
+    """
+    regressions = []
+    for name, before in sorted(baseline.get('endpoints', {}).items()):
+        after = current['endpoints'].get(name)
+        if after is None:
+            continue
+        if after['queries'] > before['queries'] * query_tolerance:
+            regressions.append("%s: %d queries, baseline %d" % (name, after['queries'], before['queries']))
+        if after['p95_ms'] > max(before['p95_ms'] * latency_tolerance, before['p95_ms'] + LATENCY_SLACK_MS):
+            regressions.append("%s: p95 %.1f ms, baseline %.1f ms" % (name, after['p95_ms'], before['p95_ms']))
+        if 'memory_kb' in before and after['memory_kb'] > max(
+                before['memory_kb'] * memory_tolerance, before['memory_kb'] + MEMORY_SLACK_KB):
+            regressions.append("%s: %d KB of memory, baseline %d KB" % (name, after['memory_kb'], before['memory_kb']))
+    return regressions
@@ -0,0 +1,100 @@
+"""caching.py for the quiz system."""
+import time
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from models import Question, Choice, QuizUser
+
+QUESTIONS_TIMEOUT = 60 * 60
+
+# Seconds a user's taken quiz ids are cached; new and deleted attempts clear them.
+TAKEN_TIMEOUT = 60 * 60
+
+# A cache of their own for the tests and the benchmark, which clear the cache
+# and fill it with quizzes that are not the site's. The quiz ids and versions
+# they cache would otherwise collide with the live quizzes' keys.
+PRIVATE_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quizXZ-private',
+    }
+}
+
+
+# The content versions are how processes learn that a quiz changed, and the
+# taken quiz ids decide which quizzes a user is offered, so the default cache
+# must be shared by every worker process (see CACHES in settings.py).
+def version_key(quiz_id):
+    """Return the cache key holding the content version of the quiz."""
+    return 'quiz:%s:version' % quiz_id
+
+
+def quiz_version(quiz_id):
+    """Return the current content version of the quiz, starting a new one if the cache has none."""
+    version = cache.get(version_key(quiz_id))
+    if version is None:
+        # A fresh start value so that fragments cached under a version that
+        # was evicted are never mistaken for current ones.
+        version = int(time.time() * 1000)
+        cache.add(version_key(quiz_id), version, None)
+        version = cache.get(version_key(quiz_id), version)
+    return version
+
+
+def quiz_versions(quiz_ids):
+    """Return a dict mapping each quiz id to its current content version."""
+    quiz_ids = list(quiz_ids)
+    found = cache.get_many([version_key(quiz_id) for quiz_id in quiz_ids])
+    versions = {}
+    for quiz_id in quiz_ids:
+        version = found.get(version_key(quiz_id))
+        if version is None:
+            version = quiz_version(quiz_id)
+        versions[quiz_id] = version
+    return versions
+
+
+def bump_quiz_version(quiz_id):
+    """Move the quiz to a new content version so its cached fragments are no longer used."""
+    try:
+        cache.incr(version_key(quiz_id))
+    except ValueError:
+        quiz_version(quiz_id)
+
+
+def rendered_questions(quiz):
+    """Return the rendered question block of the quiz, from the cache when it is current."""
+    key = 'quiz:%s:questions:%s' % (quiz.id, quiz_version(quiz.id))
+    html = cache.get(key)
+    if html is None:
+        questions = Question.objects.filter(quiz_id=quiz.id).order_by('id').prefetch_related(
+            Prefetch('choice_set', queryset=Choice.objects.order_by('id')))
+        html = render_to_string('questionBlock.html', {'questions': questions})
+        cache.set(key, html, QUESTIONS_TIMEOUT)
+    return mark_safe(html)
+
+
+def taken_key(user_id):
+    """Return the cache key holding the ids of the quizzes the user has taken."""
+    return 'user:%s:taken' % user_id
+
+
+def taken_quiz_ids(user_id):
+    """Return the frozenset of ids of the quizzes the user has taken, from the cache when it holds them."""
+    taken = cache.get(taken_key(user_id))
+    if taken is None:
+        taken = frozenset(QuizUser.objects.filter(user_id=user_id).values_list('quiz_id', flat=True))
+        cache.set(taken_key(user_id), taken, TAKEN_TIMEOUT)
+    return taken
+
+
+def forget_taken_quizzes(user_id):
+    """Drop the cached taken quiz ids of the user so they are read again.
+
+    Called after the user's attempts change rather than updating the cached
+    set, so two processes changing it at once cannot lose a quiz.
+    """
+    cache.delete(taken_key(user_id))
@@ -0,0 +1,22 @@
+"""checks.py for the quiz system."""
+from django.conf import settings
+from django.core import checks
+
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@checks.register()
+def shared_cache_check(app_configs, **kwargs):
+    """Warn when the default cache is not shared by the worker processes.
+
+    The quiz content versions live in the default cache, and a change made
+    in one process only reaches the others through it.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PER_PROCESS_CACHES:
+        return [checks.Warning(
+            "The default cache %s keeps one store per process, so quiz changes "
+            "made in one worker process are not seen by the others." % backend,
+            hint="Use a cache shared by every process, such as memcached or the file cache.",
+            obj='CACHES', id='quizXZ.W001')]
+    return []
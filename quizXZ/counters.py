@@ -0,0 +1,94 @@
+"""counters.py for the quiz system."""
+from django.db import transaction
+from django.db.models import Count, F, Sum, Case, When, IntegerField
+
+from models import Quiz, Question, Choice, QuizUser
+from answerkey import chunks
+
+QUIZ_COUNTERS = Quiz.counter_fields
+QUESTION_COUNTERS = Question.counter_fields
+
+
+def correct(point):
+    """Return 1 if a choice with this point is a correct choice, otherwise 0."""
+    return 1 if point == 2 else 0
+
+
+def question_added(quiz_id, sign=1):
+    """Count a question added to the quiz, or removed from it with sign -1."""
+    Quiz.objects.filter(id=quiz_id).update(num_questions=F('num_questions') + sign)
+
+
+def choice_added(question_id, point, sign=1):
+    """Count a choice with the point added to the question, or removed from it with sign -1."""
+    Question.objects.filter(id=question_id).update(
+        num_choices=F('num_choices') + sign, num_correct=F('num_correct') + sign * correct(point))
+    if correct(point):
+        Quiz.objects.filter(question__id=question_id).update(max_total=F('max_total') + sign)
+
+
+def attempt_added(quiz_id, sign=1):
+    """Count an attempt at the quiz, or one removed with sign -1."""
+    Quiz.objects.filter(id=quiz_id).update(num_attempts=F('num_attempts') + sign)
+
+
+def actual_counts(quiz_ids):
+    """Count the questions, choices and attempts of the quizzes with GROUP BY queries.
+
+    Returns two dicts mapping quiz ids and question ids to tuples of
+    QUIZ_COUNTERS and QUESTION_COUNTERS values.
+    """
+    quizzes = dict((quiz_id, [0, 0, 0]) for quiz_id in quiz_ids)
+    for quiz_id, count in Question.objects.filter(quiz_id__in=quiz_ids).values_list('quiz_id').annotate(
+            count=Count('id')).order_by():
+        quizzes[quiz_id][0] = count
+    for quiz_id, count in QuizUser.objects.filter(quiz_id__in=quiz_ids).values_list('quiz_id').annotate(
+            count=Count('id')).order_by():
+        quizzes[quiz_id][1] = count
+    questions = dict((question_id, (0, 0)) for question_id in Question.objects.filter(
+        quiz_id__in=quiz_ids).values_list('id', flat=True))
+    for question_id, quiz_id, count, num_correct in Choice.objects.filter(
+            question__quiz_id__in=quiz_ids).values_list('question_id', 'question__quiz_id').annotate(
+            count=Count('id'), num_correct=Sum(Case(When(point=2, then=1), default=0,
+                                                    output_field=IntegerField()))).order_by():
+        questions[question_id] = (count, num_correct)
+        quizzes[quiz_id][2] += num_correct
+    return dict((quiz_id, tuple(counts)) for quiz_id, counts in quizzes.items()), questions
+
+
+def recount(quiz_ids, repair=True):
+    """Compare the stored counters of the quizzes and their questions with the actual counts.
+
+    Returns a list of (model name, id, stored counters, actual counters)
+    for every row that was wrong. With repair the wrong rows are fixed,
+    with one UPDATE per distinct set of actual counts in each chunk of
+    quizzes, so fixing freshly bulk-created quizzes stays cheap.
+    """
+    mismatches = []
+    for quiz_chunk in chunks(set(quiz_ids)):
+        with transaction.atomic():
+            quizzes, questions = actual_counts(quiz_chunk)
+            wrong = []
+            for row in Quiz.objects.filter(id__in=quiz_chunk).values_list('id', *QUIZ_COUNTERS):
+                if row[1:] != quizzes[row[0]]:
+                    wrong.append(('quiz', row[0], row[1:], quizzes[row[0]]))
+            for row in Question.objects.filter(quiz_id__in=quiz_chunk).values_list('id', *QUESTION_COUNTERS):
+                if row[1:] != questions[row[0]]:
+                    wrong.append(('question', row[0], row[1:], questions[row[0]]))
+            if repair:
+                fix(wrong)
+        mismatches.extend(wrong)
+    return mismatches
+
+
+def fix(mismatches):
+    """Store the actual counters of the mismatched rows, grouping rows with the same counts into one UPDATE."""
+    groups = {}
+    for model, row_id, stored, actual in mismatches:
+        groups.setdefault((model, actual), []).append(row_id)
+    for (model, actual), ids in groups.items():
+        if model == 'quiz':
+            Quiz.objects.filter(id__in=ids).update(**dict(zip(QUIZ_COUNTERS, actual)))
+        else:
+            for id_chunk in chunks(ids):
+                Question.objects.filter(id__in=id_chunk).update(**dict(zip(QUESTION_COUNTERS, actual)))
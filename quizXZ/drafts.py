@@ -0,0 +1,69 @@
+"""drafts.py for the quiz system."""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from models import Draft
+
+# Seconds between the autosaves of a page; changes made in between are sent together.
+AUTOSAVE_INTERVAL = 15
+
+
+def pack(choice_ids):
+    """Pack a collection of choice ids into the sorted comma separated text stored in a draft."""
+    return ','.join(str(choice_id) for choice_id in sorted(set(int(choice_id) for choice_id in choice_ids)))
+
+
+def unpack(text):
+    """Return the set of choice ids packed in a draft's text."""
+    return set(int(choice_id) for choice_id in text.split(',') if choice_id)
+
+
+def selections(user_id, quiz_id):
+    """Return the set of choice ids in the user's draft of the quiz, empty if there is none."""
+    for text in Draft.objects.filter(user_id=user_id, quiz_id=quiz_id).values_list('choices', flat=True):
+        return unpack(text)
+    return set()
+
+
+def store(user_id, quiz_id, selected, previous=None):
+    """Store selected as the user's draft of the quiz, writing nothing if it equals previous."""
+    if previous is not None and set(selected) == previous:
+        return
+    text = pack(selected)
+    if Draft.objects.filter(user_id=user_id, quiz_id=quiz_id).update(choices=text, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            Draft.objects.create(user_id=user_id, quiz_id=quiz_id, choices=text)
+    except IntegrityError:
+        # Created by a concurrent request since the update above.
+        Draft.objects.filter(user_id=user_id, quiz_id=quiz_id).update(choices=text, updated_at=timezone.now())
+
+
+def save_page(user_id, quiz_id, page_choice_ids, selected):
+    """Replace the selections among page_choice_ids in the user's draft with selected and return the draft.
+
+    Selections on other pages are kept. The draft is only written when it
+    changed.
+    """
+    previous = selections(user_id, quiz_id)
+    draft = previous.difference(page_choice_ids).union(selected)
+    store(user_id, quiz_id, draft, previous)
+    return draft
+
+
+def apply(user_id, quiz_id, add, remove):
+    """Add and remove choice ids in the user's draft of the quiz and return (draft, whether it was written).
+
+    An autosave costs one indexed read and, only when the draft changed,
+    one write of the single packed row.
+    """
+    previous = selections(user_id, quiz_id)
+    draft = previous.difference(remove).union(add)
+    store(user_id, quiz_id, draft, previous)
+    return draft, draft != previous
+
+
+def discard(user_id, quiz_id):
+    """Delete the user's draft of the quiz."""
+    Draft.objects.filter(user_id=user_id, quiz_id=quiz_id).delete()
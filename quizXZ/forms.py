@@ -1,6 +1,6 @@
 """forms.py for the quiz system."""
 from django import forms
-from django.forms import ModelForm
+from django.forms import ModelForm, inlineformset_factory
 from models import Quiz, Question, Choice, QuizUser
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm, SetPasswordForm
@@ -77,9 +77,23 @@ class ChoiceForm(ModelForm):
         """Specifies the model used, fields used and widgets."""
 
         model = Choice
-        fields = ('text', 'point', 'question', 'users',)
+        fields = ('text', 'point', 'question',)
         widgets = {
             'text': forms.TextInput(attrs={'placeholder': 'Your Choice Text'}),
             'question': forms.HiddenInput(),
-            'users': forms.HiddenInput(),
         }
+
+
+# Formset of a question's choices for the bulk question editor: its existing
+# choices plus empty forms for new ones.
+ChoiceFormSet = inlineformset_factory(
+    Question, Choice, fields=('text', 'point',), extra=4, can_delete=True,
+    widgets={'text': forms.TextInput(attrs={'placeholder': 'Your Choice Text'})})
+
+
+class QuizBankForm(forms.Form):
+    """Form for uploading a quiz bank file."""
+
+    bank = forms.FileField(label='Quiz Bank File')
+    format = forms.ChoiceField(label='Format', choices=(('', 'From the file name'), ('jsonl', 'JSON Lines'), ('csv', 'CSV')),
+                               required=False)
@@ -0,0 +1,212 @@
+"""generator.py for the quiz system."""
+import random
+import re
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from models import Quiz, Question, Choice, QuizUser, Answer, QuizResult
+from answerkey import AnswerKey
+import caching
+import counters
+import patterns
+
+DIFFICULTIES = [level for level, name in Quiz.diffLevels]
+POINTS = [point for point, value in Choice.pointTypes]
+
+
+def parse_range(spec):
+    """Parse 'N' or 'MIN-MAX' into a (min, max) tuple of ints."""
+    parts = str(spec).split('-')
+    if len(parts) == 1:
+        low = high = int(parts[0])
+    elif len(parts) == 2:
+        low, high = int(parts[0]), int(parts[1])
+    else:
+        raise ValueError("Expected N or MIN-MAX, got %r" % spec)
+    if low < 0 or high < low:
+        raise ValueError("Invalid range %r" % spec)
+    return low, high
+
+
+def parse_weights(spec):
+    """Parse 'point:weight,...' (e.g. '0:2,1:1,2:1') into a list of (point, weight) tuples."""
+    weights = []
+    for item in str(spec).split(','):
+        point, weight = item.split(':')
+        if int(point) not in POINTS:
+            raise ValueError("Point %s is not one of %s" % (point, POINTS))
+        weights.append((int(point), float(weight)))
+    if not weights or sum(weight for point, weight in weights) <= 0:
+        raise ValueError("Invalid point weights %r" % spec)
+    return weights
+
+
+class Generator(object):
+    """Writes synthetic quizzes, users and attempts in batches with bulk_create.
+
+    All random choices come from one seeded random.Random, so the same seed
+    and options produce the same data on an empty database.
+    """
+
+    def __init__(self, seed=0, batch_size=1000):
+        """Set up the random source and the number of rows inserted per query."""
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.pending = {}
+
+    def bulk_create(self, model, objects):
+        """Insert the objects batch_size rows at a time."""
+        for i in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(objects[i:i + self.batch_size])
+
+    def add(self, obj):
+        """Queue an object for insertion, inserting its model's queue once it holds batch_size rows."""
+        queue = self.pending.setdefault(type(obj), [])
+        queue.append(obj)
+        if len(queue) >= self.batch_size:
+            type(obj).objects.bulk_create(queue)
+            del queue[:]
+
+    def flush(self):
+        """Insert every queued object."""
+        for model, queue in self.pending.items():
+            if queue:
+                model.objects.bulk_create(queue)
+                del queue[:]
+
+    def created_ids(self, model, after, columns=('id',)):
+        """Return the given columns of the model's rows with an id above after, in id order."""
+        rows = model.objects.filter(id__gt=after).order_by('id')
+        if columns == ('id',):
+            return list(rows.values_list('id', flat=True))
+        return list(rows.values_list(*columns))
+
+    def last_id(self, model):
+        """Return the largest id of the model's rows, or 0."""
+        last = model.objects.order_by('-id').values_list('id', flat=True).first()
+        return last or 0
+
+    def pick_point(self, weights):
+        """Pick a point value according to the weights."""
+        target = self.rng.random() * sum(weight for point, weight in weights)
+        for point, weight in weights:
+            target = target - weight
+            if target < 0:
+                return point
+        return weights[-1][0]
+
+    def next_user_number(self, prefix):
+        """Return the number following the highest existing username made of prefix and a number, or 0."""
+        pattern = re.compile(r'^%s(\d+)$' % re.escape(prefix))
+        highest = -1
+        for username in User.objects.filter(username__startswith=prefix).values_list(
+                'username', flat=True).iterator():
+            match = pattern.match(username)
+            if match:
+                highest = max(highest, int(match.group(1)))
+        return highest + 1
+
+    def users(self, count, prefix='student', password='password'):
+        """Create count users named prefix0, prefix1, ... and return their ids.
+
+        Numbering continues after the users already named that way, so
+        running the generator again on the same database adds new users.
+        """
+        hashed = make_password(password)
+        after = self.last_id(User)
+        first = self.next_user_number(prefix)
+        for start in range(first, first + count, self.batch_size):
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(username='%s%d' % (prefix, i), password=hashed)
+                    for i in range(start, min(start + self.batch_size, first + count))])
+        return self.created_ids(User, after)
+
+    def quizzes(self, count, questions=(5, 20), choices=(2, 5), points=((0, 2), (1, 1), (2, 1)),
+                user_ids=(), attempts=(0, 0), picks=(1, 2)):
+        """Create count quizzes with their questions, choices and simulated attempts.
+
+        questions, choices, attempts and picks are (min, max) ranges of the
+        questions per quiz, choices per question, users taking each quiz and
+        choices each user selects per question. points are (point, weight)
+        pairs; every question gets at least one correct choice. Each attempt
+        writes the QuizUser row, its Answer rows and the QuizResult.
+        Quizzes are written a tenth of batch_size at a time, each group in
+        its own transaction, and attempt rows are inserted batch_size at a
+        time, so memory stays bounded however much is generated.
+        Returns a dict of the number of rows created per table.
+        """
+        created = {'quizzes': 0, 'questions': 0, 'choices': 0, 'attempts': 0, 'selections': 0}
+        user_ids = list(user_ids)
+        step = max(1, self.batch_size // 10)
+        for start in range(0, count, step):
+            with transaction.atomic():
+                size = min(step, count - start)
+                after = self.last_id(Quiz)
+                self.bulk_create(Quiz, [
+                    Quiz(name='Quiz %d' % (start + i), subject='Subject %d' % self.rng.randint(1, 20),
+                         difficulty=self.rng.choice(DIFFICULTIES))
+                    for i in range(size)])
+                quiz_ids = self.created_ids(Quiz, after)
+
+                after = self.last_id(Question)
+                self.bulk_create(Question, [
+                    Question(quiz_id=quiz_id, text='Question %d of quiz %d' % (i, quiz_id))
+                    for quiz_id in quiz_ids for i in range(self.rng.randint(*questions))])
+                question_rows = self.created_ids(Question, after, ('id', 'quiz_id'))
+
+                after = self.last_id(Choice)
+                new_choices = []
+                for question_id, quiz_id in question_rows:
+                    values = [self.pick_point(points) for i in range(self.rng.randint(*choices))]
+                    if values and 2 not in values:
+                        values[self.rng.randrange(len(values))] = 2
+                    new_choices.extend(Choice(question_id=question_id, text='Choice %d' % i, point=point)
+                                       for i, point in enumerate(values))
+                self.bulk_create(Choice, new_choices)
+                choice_rows = self.created_ids(Choice, after, ('id', 'question_id', 'point'))
+
+                by_question = {}
+                for choice_id, question_id, point in choice_rows:
+                    by_question.setdefault(question_id, []).append((choice_id, question_id, point))
+                by_quiz = dict((quiz_id, []) for quiz_id in quiz_ids)
+                for question_id, quiz_id in question_rows:
+                    by_quiz[quiz_id].append(by_question.get(question_id, []))
+
+                taken = []
+                for quiz_id in quiz_ids:
+                    key = AnswerKey(quiz_id, [row for rows in by_quiz[quiz_id] for row in rows])
+                    takers = min(self.rng.randint(*attempts), len(user_ids))
+                    for user_id in self.rng.sample(user_ids, takers):
+                        picked = []
+                        for rows in by_quiz[quiz_id]:
+                            if rows:
+                                number = min(self.rng.randint(*picks), len(rows))
+                                picked.extend(row[:2] for row in self.rng.sample(rows, number))
+                        result = key.grade(choice_id for choice_id, question_id in picked)
+                        self.add(QuizResult(quiz_id=quiz_id, user_id=user_id,
+                                            score=result['score'], total=result['total']))
+                        taken.append((quiz_id, user_id, picked))
+                        created['attempts'] += 1
+                        created['selections'] += len(picked)
+
+                after = self.last_id(QuizUser)
+                self.bulk_create(QuizUser, [QuizUser(quiz_id=quiz_id, user_id=user_id)
+                                            for quiz_id, user_id, picked in taken])
+                for attempt_id, (quiz_id, user_id, picked) in zip(self.created_ids(QuizUser, after), taken):
+                    for choice_id, question_id in picked:
+                        self.add(Answer(attempt_id=attempt_id, question_id=question_id, choice_id=choice_id))
+                self.flush()
+                # bulk_create sends no post_save signals.
+                counters.recount(quiz_ids)
+                patterns.rebuild(question_id for question_id, quiz_id in question_rows)
+                cache.delete_many([caching.taken_key(user_id) for user_id in set(
+                    user_id for quiz_id, user_id, picked in taken)])
+
+            created['quizzes'] += len(quiz_ids)
+            created['questions'] += len(question_rows)
+            created['choices'] += len(choice_rows)
+        return created
@@ -0,0 +1,158 @@
+"""gradebook.py for the quiz system."""
+import csv
+import multiprocessing
+
+from django.db import connections
+from django.db.models import Count
+
+from models import Quiz, QuizUser
+import answerkey
+import regrade
+
+# Parquet output is optional and needs pyarrow.
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ('csv', 'parquet')
+COLUMNS = ['quiz_id', 'quiz', 'user_id', 'username', 'score', 'total']
+
+# Attempts graded per task handed to a worker process.
+TASK_SIZE = 20000
+
+# Answer keys of the quizzes being graded, built once by the parent process
+# and inherited by the workers it forks.
+_keys = {}
+
+
+def attempt_counts(quiz_ids):
+    """Return a dict mapping each quiz id to its number of attempts, counted with GROUP BY queries."""
+    counts = dict((quiz_id, 0) for quiz_id in quiz_ids)
+    for quiz_chunk in answerkey.chunks(counts):
+        counts.update(QuizUser.objects.filter(quiz_id__in=quiz_chunk).values_list('quiz_id').annotate(
+            count=Count('id')).order_by())
+    return counts
+
+
+def tasks(counts, task_size=TASK_SIZE):
+    """Split the quizzes of attempt_counts into lists of quiz ids with about task_size attempts each.
+
+    The biggest quizzes come first. Quizzes are never split, so a worker
+    reads the answers of each of its quizzes with one query.
+    """
+    task = []
+    size = 0
+    for quiz_id in sorted(counts, key=lambda quiz_id: (-counts[quiz_id], quiz_id)):
+        if task and size + counts[quiz_id] > task_size:
+            yield task
+            task = []
+            size = 0
+        task.append(quiz_id)
+        size = size + counts[quiz_id]
+    if task:
+        yield task
+
+
+def grade_quizzes(quiz_ids):
+    """Grade every attempt at the quizzes and return (quiz_id, user_id, username, score, total) rows.
+
+    Runs in a worker process; the answer keys come from the parent's
+    snapshot and the answers are read with the worker's own connection.
+    """
+    report = []
+    for quiz_id in quiz_ids:
+        key = _keys[quiz_id]
+        attempts = list(QuizUser.objects.filter(quiz_id=quiz_id).order_by('id').values_list(
+            'id', 'user_id', 'user__username'))
+        rows = regrade.selections(quiz_id)
+        grade = regrade.grade_arrays if regrade.numpy is not None else regrade.grade_lists
+        scores = grade(key, [attempt_id for attempt_id, user_id, username in attempts], rows)
+        for (attempt_id, user_id, username), point in zip(attempts, scores):
+            report.append((quiz_id, user_id, username, point, key.total))
+    return report
+
+
+def results(counts, processes=None, task_size=TASK_SIZE):
+    """Yield (number of attempts, rows) for every task of grade_quizzes, in task order.
+
+    counts maps the ids of the quizzes to grade to their attempt_counts.
+    The answer keys of all the quizzes are built first, then the tasks are
+    spread over a pool of processes (one per core by default). With one
+    process the tasks are graded in this process.
+    """
+    _keys.clear()
+    _keys.update(answerkey.get_many(list(counts)))
+    work = list(tasks(counts, task_size))
+    if processes == 1:
+        for task in work:
+            report = grade_quizzes(task)
+            yield len(report), report
+        return
+    # The workers are forked; each must open its own connection rather than share ours.
+    connections.close_all()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for report in pool.imap(grade_quizzes, work):
+            yield len(report), report
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class CsvWriter(object):
+    """Write gradebook rows to a CSV file as they arrive."""
+
+    def __init__(self, f):
+        """Write the header."""
+        self.writer = csv.writer(f)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        """Write a list of rows."""
+        self.writer.writerows([[unicode(value).encode('utf-8') for value in row] for row in rows])
+
+    def close(self):
+        """Nothing is buffered."""
+
+
+class ParquetWriter(object):
+    """Write gradebook rows to a Parquet file, one row group per batch of rows."""
+
+    def __init__(self, f):
+        """Open the Parquet writer with the gradebook schema."""
+        self.schema = pyarrow.schema([
+            ('quiz_id', pyarrow.int64()), ('quiz', pyarrow.string()), ('user_id', pyarrow.int64()),
+            ('username', pyarrow.string()), ('score', pyarrow.float64()), ('total', pyarrow.int64())])
+        self.writer = pyarrow.parquet.ParquetWriter(f, self.schema)
+
+    def write(self, rows):
+        """Write a list of rows as one row group."""
+        if rows:
+            columns = zip(*rows)
+            self.writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+                schema=self.schema))
+
+    def close(self):
+        """Write the file footer."""
+        self.writer.close()
+
+
+def writer(f, format='csv'):
+    """Return a CsvWriter or ParquetWriter for the file."""
+    if format == 'parquet':
+        if pyarrow is None:
+            raise ValueError("Writing Parquet needs pyarrow.")
+        return ParquetWriter(f)
+    return CsvWriter(f)
+
+
+def quiz_names(quiz_ids):
+    """Return a dict mapping each quiz id to its name."""
+    names = {}
+    for quiz_chunk in answerkey.chunks(quiz_ids):
+        names.update(Quiz.objects.filter(id__in=quiz_chunk).values_list('id', 'name'))
+    return names
@@ -0,0 +1,125 @@
+"""grading.py for the quiz system."""
+import datetime
+import os
+import socket
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from models import GradingJob
+import scoring
+
+# With GRADING_ASYNC a submission only stores the answers and queues a
+# GradingJob; the result is written by a grade_worker process, or by the
+# report page if it is opened before a worker gets to the job.
+ASYNC = getattr(settings, 'GRADING_ASYNC', False)
+
+# Number of jobs a worker claims and grades at a time.
+BATCH_SIZE = 100
+
+# Jobs left running for longer than this (a worker that died) are queued again.
+STALE_AFTER = datetime.timedelta(minutes=10)
+
+# Seconds between the checks of a running grade_worker for stale jobs.
+REQUEUE_INTERVAL = 60
+
+# Jobs that failed this many times are left failed.
+MAX_TRIES = 3
+
+
+def worker_name():
+    """Return a name for the current worker thread that is unique across hosts and processes."""
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), threading.current_thread().ident)
+
+
+def enqueue(user_id, quiz_id):
+    """Queue the grading of the user's attempt at the quiz."""
+    return GradingJob.objects.create(user_id=user_id, quiz_id=quiz_id)
+
+
+def claim(worker, limit=BATCH_SIZE):
+    """Mark up to limit of the oldest pending jobs as running for the worker and return them.
+
+    The jobs are claimed with one UPDATE that only matches jobs that are
+    still pending, so workers racing for the same jobs never share one.
+    """
+    ids = list(GradingJob.objects.filter(status=GradingJob.PENDING).order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    GradingJob.objects.filter(id__in=ids, status=GradingJob.PENDING).update(
+        status=GradingJob.RUNNING, worker=worker, updated_at=timezone.now())
+    return list(GradingJob.objects.filter(id__in=ids, status=GradingJob.RUNNING, worker=worker))
+
+
+def run(jobs):
+    """Grade the claimed jobs and store their results, returning (graded, failed) counts.
+
+    The jobs are scored together in one pass with score_many. If that fails
+    they are graded again one at a time, so only the jobs that fail on
+    their own are marked failed, or pending again while they have tries
+    left.
+    """
+    if not jobs:
+        return 0, 0
+    try:
+        grade(jobs)
+    except Exception:
+        graded = 0
+        for job in jobs:
+            try:
+                grade([job])
+            except Exception:
+                retry(job, traceback.format_exc())
+            else:
+                graded = graded + 1
+        return graded, len(jobs) - graded
+    return len(jobs), 0
+
+
+def grade(jobs):
+    """Score the jobs with score_many and save their results and status in one transaction."""
+    results = scoring.score_many((job.user_id, job.quiz_id) for job in jobs)
+    with transaction.atomic():
+        for job in jobs:
+            scoring.save_result(job.user_id, job.quiz_id, results[(job.user_id, job.quiz_id)])
+        GradingJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=GradingJob.DONE, error='', updated_at=timezone.now())
+
+
+def retry(job, error):
+    """Record a failed try of the job, leaving it failed once it has used MAX_TRIES."""
+    status = GradingJob.FAILED if job.tries + 1 >= MAX_TRIES else GradingJob.PENDING
+    GradingJob.objects.filter(id=job.id).update(
+        status=status, tries=job.tries + 1, error=error, updated_at=timezone.now())
+
+
+def work(worker=None, limit=BATCH_SIZE):
+    """Claim and grade one batch of pending jobs, returning the (graded, failed) counts.
+
+    Both are 0 only when no job was pending.
+    """
+    return run(claim(worker or worker_name(), limit))
+
+
+def requeue_stale(stale_after=STALE_AFTER):
+    """Queue again the jobs left running for longer than stale_after, returning how many."""
+    return GradingJob.objects.filter(
+        status=GradingJob.RUNNING, updated_at__lt=timezone.now() - stale_after).update(
+        status=GradingJob.PENDING, worker='', updated_at=timezone.now())
+
+
+def finish(user_id, quiz_id):
+    """Grade the user's attempt now if its job is still pending.
+
+    Used by the report page so a student never waits for the queue. Returns
+    True if the job was graded here.
+    """
+    claimed = GradingJob.objects.filter(user_id=user_id, quiz_id=quiz_id, status=GradingJob.PENDING).update(
+        status=GradingJob.RUNNING, worker=worker_name(), updated_at=timezone.now())
+    if not claimed:
+        return False
+    graded, failed = run(list(GradingJob.objects.filter(user_id=user_id, quiz_id=quiz_id)))
+    return graded > 0
@@ -0,0 +1,52 @@
+"""Backfill QuizResult rows for attempts that were made before results were stored."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from quizXZ.models import QuizUser, QuizResult
+from quizXZ import scoring
+
+
+class Command(BaseCommand):
+    """Create the missing QuizResult rows and optionally check stored results against live scoring."""
+
+    help = "Create QuizResult rows for QuizUser attempts that have none and check them against live scoring."
+
+    def add_arguments(self, parser):
+        """Add the --check and --batch-size options."""
+        parser.add_argument('--check', action='store_true', default=False,
+                            help="Compare every stored result with live scoring and report mismatches.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of attempts to score and insert at a time.")
+
+    def handle(self, *args, **options):
+        """Backfill in batches, then check if asked to."""
+        batch_size = options['batch_size']
+        stored = set(QuizResult.objects.values_list('user_id', 'quiz_id'))
+        pairs = [pair for pair in QuizUser.objects.order_by('id').values_list('user_id', 'quiz_id')
+                 if pair not in stored]
+        created = 0
+        for i in range(0, len(pairs), batch_size):
+            batch = pairs[i:i + batch_size]
+            results = scoring.score_many(batch)
+            with transaction.atomic():
+                QuizResult.objects.bulk_create([
+                    QuizResult(user_id=user_id, quiz_id=quiz_id,
+                               score=results[(user_id, quiz_id)]['score'],
+                               total=results[(user_id, quiz_id)]['total'])
+                    for user_id, quiz_id in batch])
+            created = created + len(batch)
+        self.stdout.write("Created %d quiz results." % created)
+
+        if options['check']:
+            mismatches = 0
+            rows = list(QuizResult.objects.order_by('id').values_list('user_id', 'quiz_id', 'score', 'total'))
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                live = scoring.score_many((user_id, quiz_id) for user_id, quiz_id, point, total in batch)
+                for user_id, quiz_id, point, total in batch:
+                    expected = live[(user_id, quiz_id)]
+                    if expected['score'] != point or expected['total'] != total:
+                        mismatches = mismatches + 1
+                        self.stdout.write("Mismatch for user %d on quiz %d: stored %s / %s, live %s / %s" % (
+                            user_id, quiz_id, point, total, expected['score'], expected['total']))
+            self.stdout.write("Checked %d quiz results, %d mismatches." % (len(rows), mismatches))
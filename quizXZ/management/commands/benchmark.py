@@ -0,0 +1,54 @@
+"""Benchmark the main quiz request paths on a freshly seeded test database."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from quizXZ import benchmark
+
+
+class Command(BaseCommand):
+    """Seed a throwaway test database, time the endpoints and compare them with a baseline."""
+
+    help = ("Seed a test database of the given size, measure p50/p95 latency, query count and the "
+            "peak memory each quiz endpoint needs, write them to a JSON file and compare with a baseline.")
+
+    def add_arguments(self, parser):
+        """Add the size, repeat, output and baseline options."""
+        for name, default in sorted(benchmark.DEFAULT_SIZE.items()):
+            parser.add_argument('--%s' % name, type=int, default=default,
+                                help="Number of %s to seed (default %d)." % (name, default))
+        parser.add_argument('--repeat', type=int, default=10, help="Timed requests per endpoint.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the generated data.")
+        parser.add_argument('--output', default='bench_output.json', help="JSON file to write the results to.")
+        parser.add_argument('--baseline', default=None, help="JSON file of an earlier run to compare with.")
+
+    def handle(self, *args, **options):
+        """Run the benchmark in a test database and fail if it regressed against the baseline."""
+        size = dict((name, options[name]) for name in benchmark.DEFAULT_SIZE)
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            results = benchmark.run(size, options['repeat'], options['seed'])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        for name, result in sorted(results['endpoints'].items()):
+            self.stdout.write("%-18s p50 %8.2f ms  p95 %8.2f ms  %3d queries  %d KB" % (
+                name, result['p50_ms'], result['p95_ms'], result['queries'], result['memory_kb']))
+        self.stdout.write("Results written to %s." % options['output'])
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            if baseline.get('size') != results['size']:
+                self.stdout.write("Warning: the baseline was seeded with a different size: %s" % baseline.get('size'))
+            regressions = benchmark.compare(results, baseline)
+            if regressions:
+                raise CommandError("Regressions against %s:\n%s" % (options['baseline'], '\n'.join(regressions)))
+            self.stdout.write("No regressions against %s." % options['baseline'])
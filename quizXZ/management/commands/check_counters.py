@@ -0,0 +1,41 @@
+"""Check the question, choice and attempt counters stored on quizzes and questions."""
+from django.core.management.base import BaseCommand
+
+from quizXZ.models import Quiz, Question
+from quizXZ.answerkey import chunks
+from quizXZ import counters
+from quizXZ import patterns
+
+
+class Command(BaseCommand):
+    """Compare the denormalized counters with the actual counts and optionally repair them."""
+
+    help = ("Compare num_questions, num_attempts and max_total of every quiz and num_choices and num_correct "
+            "of every question with the actual counts, and fix them with --repair, which also counts the "
+            "answer patterns of the quizzes again.")
+
+    def add_arguments(self, parser):
+        """Add the --repair and --quiz options."""
+        parser.add_argument('--repair', action='store_true', default=False,
+                            help="Store the actual counts on the rows that are wrong and count the answer "
+                                 "patterns again.")
+        parser.add_argument('--quiz', type=int, action='append', dest='quizzes', default=None,
+                            help="Id of a quiz to check; repeat for several (default: every quiz).")
+
+    def handle(self, *args, **options):
+        """Check the quizzes a chunk at a time and report every wrong row."""
+        quiz_ids = options['quizzes']
+        if quiz_ids is None:
+            quiz_ids = list(Quiz.objects.order_by('id').values_list('id', flat=True))
+        mismatches = counters.recount(quiz_ids, options['repair'])
+        for model, row_id, stored, actual in mismatches:
+            fields = counters.QUIZ_COUNTERS if model == 'quiz' else counters.QUESTION_COUNTERS
+            self.stdout.write("%s %d: %s" % (model.capitalize(), row_id, ', '.join(
+                '%s %d should be %d' % (field, old, new)
+                for field, old, new in zip(fields, stored, actual) if old != new)))
+        self.stdout.write("Checked %d quizzes, %d rows %s." % (
+            len(quiz_ids), len(mismatches), 'repaired' if options['repair'] else 'wrong'))
+        if options['repair']:
+            for quiz_chunk in chunks(quiz_ids):
+                patterns.rebuild(Question.objects.filter(quiz_id__in=quiz_chunk).values_list('id', flat=True))
+            self.stdout.write("Counted the answer patterns of %d quizzes again." % len(quiz_ids))
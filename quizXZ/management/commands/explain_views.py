@@ -0,0 +1,147 @@
+"""Print the query plan of every query the quiz views run."""
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test import RequestFactory
+
+from quizXZ.models import Quiz, Question, Choice, QuizUser
+from quizXZ import caching, views
+
+
+class RecordingCursor(CursorWrapper):
+    """Cursor that keeps the SQL and parameters of every query it runs."""
+
+    def __init__(self, cursor, db, log):
+        """Wrap the cursor and append (sql, params) to log for every query."""
+        super(RecordingCursor, self).__init__(cursor, db)
+        self.log = log
+
+    def execute(self, sql, params=None):
+        """Record and run the query."""
+        self.log.append((sql, params))
+        return super(RecordingCursor, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        """Record and run the query."""
+        self.log.append((sql, None))
+        return super(RecordingCursor, self).executemany(sql, param_list)
+
+
+class record_queries(object):
+    """Context manager that collects the (sql, params) of the queries run on a connection."""
+
+    def __init__(self, db):
+        """Start with an empty log."""
+        self.db = db
+        self.log = []
+
+    def __enter__(self):
+        """Make the connection hand out recording cursors."""
+        self.force_debug_cursor = self.db.force_debug_cursor
+        self.db.force_debug_cursor = True
+        self.db.make_debug_cursor = lambda cursor: RecordingCursor(cursor, self.db, self.log)
+        return self.log
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Restore the connection's own cursors."""
+        del self.db.make_debug_cursor
+        self.db.force_debug_cursor = self.force_debug_cursor
+
+
+class Command(BaseCommand):
+    """Run each view against the current database and EXPLAIN the queries it makes."""
+
+    help = "Print EXPLAIN QUERY PLAN output for the queries of every quiz view and flag full table scans."
+
+    def add_arguments(self, parser):
+        """Add the --username option."""
+        parser.add_argument('--username', default=None,
+                            help="Superuser to run the views as (default: the first superuser with a quiz left to take).")
+
+    def handle(self, *args, **options):
+        """Call every view inside a rolled back transaction and explain its queries."""
+        # report and the analytics read an attempt that has been made, while
+        # the quiz-taking views only run their queries on a quiz the user has
+        # not taken yet, so by default the views run as the first superuser
+        # with a quiz left to take.
+        users = User.objects.filter(is_superuser=True).order_by('id')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        answerable = Quiz.objects.filter(archived=False, question__choice__isnull=False).order_by('id')
+        user = next((candidate for candidate in users if answerable.exclude(quizuser__user=candidate).exists()),
+                    users.first())
+        if user is None:
+            raise CommandError("No superuser to run the views as.")
+        quizuser = (QuizUser.objects.filter(user=user).order_by('id').first() or
+                    QuizUser.objects.order_by('id').first())
+        quiz = quizuser.quiz if quizuser else Quiz.objects.order_by('id').first()
+        if quiz is None:
+            raise CommandError("No quiz to run the views against.")
+        fresh = answerable.exclude(quizuser__user=user).first()
+        if fresh is None:
+            self.stderr.write("%s has taken every quiz with choices, so the quiz-taking views run few queries." % user)
+            fresh = quiz
+        question = Question.objects.filter(quiz=quiz).order_by('id').first()
+        quiz_id = str(quiz.id)
+        question_id = str(question.id) if question else '0'
+        fresh_id = str(fresh.id)
+        choice = Choice.objects.filter(question__quiz=fresh).order_by('id').first()
+        choice_id = choice.id if choice else 0
+        taker_id = str(quizuser.user_id if quizuser else user.id)
+
+        factory = RequestFactory()
+        calls = [
+            ('quizzes', factory.get('/'), views.quizzes, {}),
+            ('questions', factory.get('/'), views.questions, {'quiz_id': fresh_id}),
+            ('save_userchoice', factory.post('/', {'userchoice': choice_id}), views.save_userchoice,
+             {'quiz_id': fresh_id}),
+            ('take_quiz', factory.get('/'), views.take_quiz, {'quiz_id': fresh_id}),
+            ('autosave', factory.post('/', json.dumps({'add': [choice_id]}), content_type='application/json'),
+             views.autosave, {'quiz_id': fresh_id}),
+            ('report', factory.get('/'), views.report, {'user_id': taker_id, 'quiz_id': quiz_id}),
+            ('my_report', factory.get('/'), views.my_report, {}),
+            ('users_report', factory.get('/'), views.users_report, {}),
+            ('quiz_analytics', factory.get('/'), views.quiz_analytics, {'quiz_id': quiz_id}),
+            ('create_quiz', factory.get('/'), views.create_quiz, {}),
+            ('quiz_list', factory.get('/'), views.quiz_list, {}),
+            ('create_question', factory.get('/'), views.create_question, {'quiz_id': quiz_id}),
+            ('question_list', factory.get('/'), views.question_list, {'quiz_id': quiz_id}),
+            ('edit_question', factory.get('/'), views.edit_question, {'quiz_id': quiz_id, 'question_id': question_id}),
+            ('create_choice', factory.get('/'), views.create_choice, {'quiz_id': quiz_id, 'question_id': question_id}),
+            ('choice_list', factory.get('/'), views.choice_list, {'quiz_id': quiz_id, 'question_id': question_id}),
+        ]
+        scans = 0
+        for name, request, view, kwargs in calls:
+            request.user = user
+            with transaction.atomic():
+                with record_queries(connection) as queries:
+                    view(request, **kwargs)
+                transaction.set_rollback(True)
+            # Taken quiz ids cached inside the transaction may include the
+            # rolled back attempt of save_userchoice.
+            caching.forget_taken_quizzes(user.id)
+            self.stdout.write("== %s (%d queries)" % (name, len(queries)))
+            seen = set()
+            for sql, params in queries:
+                if not sql.startswith('SELECT') or sql in seen:
+                    continue
+                seen.add(sql)
+                self.stdout.write(sql)
+                for line in self.explain(sql, params):
+                    if line.startswith('SCAN') and 'INDEX' not in line:
+                        scans = scans + 1
+                        line = line + "    <-- full table scan"
+                    self.stdout.write("    " + line)
+        self.stdout.write("%d full table scans." % scans)
+
+    def explain(self, sql, params):
+        """Return the plan of the query as lines of text."""
+        cursor = connection.cursor()
+        if connection.vendor == 'sqlite':
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute("EXPLAIN " + sql, params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
@@ -0,0 +1,29 @@
+"""Export quizzes with their questions and choices as JSON Lines or CSV."""
+from django.core.management.base import BaseCommand
+
+from quizXZ import bank
+
+
+class Command(BaseCommand):
+    """Stream the quiz bank to a file or standard output."""
+
+    help = "Export quizzes, questions and choices as JSON Lines (one quiz per line) or CSV."
+
+    def add_arguments(self, parser):
+        """Add the --output, --format and --quiz options."""
+        parser.add_argument('--output', default='-', help="File to write, or - for standard output.")
+        parser.add_argument('--format', choices=bank.FORMATS, default=None,
+                            help="Format to write (default: from the output's extension, else jsonl).")
+        parser.add_argument('--quiz', type=int, action='append', dest='quizzes', default=None,
+                            help="Id of a quiz to export; repeat for several (default: every quiz).")
+
+    def handle(self, *args, **options):
+        """Write the bank line by line."""
+        format = options['format'] or bank.guess_format(options['output'])
+        if options['output'] == '-':
+            for line in bank.export_bank(format, options['quizzes']):
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'wb') as output:
+            for line in bank.export_bank(format, options['quizzes']):
+                output.write(line.encode('utf-8') if isinstance(line, unicode) else line)
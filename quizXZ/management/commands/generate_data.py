@@ -0,0 +1,46 @@
+"""Generate a synthetic dataset of quizzes, users and attempts."""
+from django.core.management.base import BaseCommand, CommandError
+
+from quizXZ.generator import Generator, parse_range, parse_weights
+
+
+class Command(BaseCommand):
+    """Fill the database with generated quizzes, questions, choices, users and attempts."""
+
+    help = ("Generate quizzes with questions and choices, students, and simulated attempts using "
+            "bulk_create in batches. The same --seed gives the same data.")
+
+    def add_arguments(self, parser):
+        """Add the size, distribution and seed options."""
+        parser.add_argument('--quizzes', type=int, default=10, help="Number of quizzes.")
+        parser.add_argument('--questions', default='5-20', help="Questions per quiz, N or MIN-MAX.")
+        parser.add_argument('--choices', default='2-5', help="Choices per question, N or MIN-MAX.")
+        parser.add_argument('--points', default='0:2,1:1,2:1',
+                            help="Relative weights of the choice points, as point:weight pairs.")
+        parser.add_argument('--users', type=int, default=100, help="Number of students.")
+        parser.add_argument('--user-prefix', default='student', help="Prefix of the students' usernames.")
+        parser.add_argument('--password', default='password', help="Password of every generated student.")
+        parser.add_argument('--attempts', default='0-50', help="Students taking each quiz, N or MIN-MAX.")
+        parser.add_argument('--picks', default='1-2', help="Choices each student selects per question.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows inserted per query.")
+
+    def handle(self, *args, **options):
+        """Generate the users, then the quizzes and their attempts."""
+        try:
+            questions = parse_range(options['questions'])
+            choices = parse_range(options['choices'])
+            attempts = parse_range(options['attempts'])
+            picks = parse_range(options['picks'])
+            points = parse_weights(options['points'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        generator = Generator(options['seed'], options['batch_size'])
+        user_ids = generator.users(options['users'], options['user_prefix'], options['password'])
+        self.stdout.write("Created %d users." % len(user_ids))
+        created = generator.quizzes(options['quizzes'], questions, choices, points, user_ids, attempts, picks)
+        self.stdout.write("Created %(quizzes)d quizzes, %(questions)d questions, %(choices)d choices, "
+                          "%(attempts)d attempts and %(selections)d selections." % created)
@@ -0,0 +1,59 @@
+"""Grade every student on every quiz with a pool of processes and write the gradebook to a file."""
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quizXZ.models import Quiz
+from quizXZ import gradebook
+
+
+class Command(BaseCommand):
+    """Score all attempts offline across processes and write them as CSV or Parquet."""
+
+    help = ("Grade every attempt at the given quizzes (default: every quiz) from the stored answers, "
+            "spread over a pool of processes, and write one row per student and quiz.")
+
+    def add_arguments(self, parser):
+        """Add the --output, --format, --processes, --task-size and --quiz options."""
+        parser.add_argument('--output', default=None,
+                            help="File to write (default gradebook.csv or gradebook.parquet).")
+        parser.add_argument('--format', choices=gradebook.FORMATS, default='csv', help="Output format.")
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help="Number of worker processes (default: one per core).")
+        parser.add_argument('--task-size', type=int, default=gradebook.TASK_SIZE,
+                            help="About how many attempts a worker grades per task.")
+        parser.add_argument('--quiz', type=int, action='append', dest='quizzes', default=None,
+                            help="Id of a quiz to grade; repeat for several.")
+
+    def handle(self, *args, **options):
+        """Grade the quizzes, writing rows as the workers finish and reporting throughput."""
+        if options['processes'] < 1 or options['task_size'] < 1:
+            raise CommandError("--processes and --task-size must be at least 1.")
+        if options['format'] == 'parquet' and gradebook.pyarrow is None:
+            raise CommandError("Writing Parquet needs pyarrow.")
+        quiz_ids = options['quizzes']
+        if quiz_ids is None:
+            quiz_ids = list(Quiz.objects.filter(archived=False).order_by('id').values_list('id', flat=True))
+        names = gradebook.quiz_names(quiz_ids)
+        missing = set(quiz_ids).difference(names)
+        if missing:
+            raise CommandError("Quiz %d does not exist." % min(missing))
+        counts = gradebook.attempt_counts(quiz_ids)
+        total = sum(counts.values())
+        output = options['output'] or 'gradebook.%s' % options['format']
+
+        start = time.time()
+        graded = 0
+        with open(output, 'wb') as f:
+            out = gradebook.writer(f, options['format'])
+            for count, rows in gradebook.results(counts, options['processes'], options['task_size']):
+                out.write([(quiz_id, names[quiz_id], user_id, username, point, quiz_total)
+                           for quiz_id, user_id, username, point, quiz_total in rows])
+                graded = graded + count
+                elapsed = time.time() - start
+                self.stdout.write("Graded %d/%d attempts, %.0f per second." % (
+                    graded, total, graded / elapsed if elapsed else 0))
+            out.close()
+        self.stdout.write("Wrote %d rows for %d quizzes to %s in %.1f seconds." % (
+            graded, len(quiz_ids), output, time.time() - start))
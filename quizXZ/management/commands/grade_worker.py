@@ -0,0 +1,71 @@
+"""Grade queued quiz submissions in the background."""
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from quizXZ import grading
+
+
+class Command(BaseCommand):
+    """Run worker threads that claim pending GradingJob rows and store their results."""
+
+    help = "Grade the submissions queued with GRADING_ASYNC. Run more processes to grade faster."
+
+    def add_arguments(self, parser):
+        """Add the --threads, --batch-size, --poll-interval and --once options."""
+        parser.add_argument('--threads', type=int, default=1,
+                            help="Number of worker threads in this process.")
+        parser.add_argument('--batch-size', type=int, default=grading.BATCH_SIZE,
+                            help="Number of jobs a thread claims and grades at a time.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Grade every pending job and exit instead of waiting for more.")
+
+    def handle(self, *args, **options):
+        """Start the worker threads and wait for them, queueing stale jobs again every REQUEUE_INTERVAL seconds."""
+        self.graded = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.requeue()
+        threads = [threading.Thread(target=self.work, args=(options,)) for i in range(max(1, options['threads']))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        checked = time.time()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+                if time.time() - checked >= grading.REQUEUE_INTERVAL:
+                    self.requeue()
+                    checked = time.time()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write("Graded %d submissions, %d failed tries." % (self.graded, self.failed))
+
+    def requeue(self):
+        """Queue again the jobs left running by workers that died."""
+        requeued = grading.requeue_stale()
+        if requeued:
+            self.stdout.write("Queued %d stale jobs again." % requeued)
+
+    def work(self, options):
+        """Grade batches of jobs until the queue is empty (with --once) or forever."""
+        worker = grading.worker_name()
+        try:
+            while True:
+                graded, failed = grading.work(worker, options['batch_size'])
+                with self.lock:
+                    self.graded = self.graded + graded
+                    self.failed = self.failed + failed
+                if not graded and not failed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        finally:
+            connection.close()
@@ -0,0 +1,36 @@
+"""Import quizzes with their questions and choices from a JSON Lines or CSV file."""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quizXZ import bank
+
+
+class Command(BaseCommand):
+    """Load a quiz bank file in one transaction with bulk inserts."""
+
+    help = ("Import quizzes, questions and choices from a JSON Lines file (one quiz per line) or a CSV "
+            "file with the columns %s. Nothing is imported if any line is invalid." % ','.join(bank.CSV_COLUMNS))
+
+    def add_arguments(self, parser):
+        """Add the file argument and the --format and --batch-size options."""
+        parser.add_argument('file', help="File to import, or - for standard input.")
+        parser.add_argument('--format', choices=bank.FORMATS, default=None,
+                            help="Format of the file (default: from its extension, else jsonl).")
+        parser.add_argument('--batch-size', type=int, default=bank.BATCH_SIZE,
+                            help="Number of quizzes inserted at a time.")
+
+    def handle(self, *args, **options):
+        """Import the file and report what was created."""
+        format = options['format'] or bank.guess_format(options['file'])
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        stream = sys.stdin if options['file'] == '-' else open(options['file'], 'rb')
+        try:
+            created = bank.import_bank(stream, format, options['batch_size'])
+        except bank.InvalidBank as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write("Imported %(quizzes)d quizzes, %(questions)d questions and %(choices)d choices." % created)
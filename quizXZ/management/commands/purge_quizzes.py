@@ -0,0 +1,34 @@
+"""Remove archived quizzes together with their questions, choices and attempts."""
+from django.core.management.base import BaseCommand, CommandError
+
+from quizXZ.models import Quiz
+from quizXZ import purge
+
+
+class Command(BaseCommand):
+    """Purge archived quizzes with batched set-based deletes."""
+
+    help = ("Delete archived quizzes with their questions, choices, answers and attempts, a batch of rows "
+            "at a time. Run it from cron when QUIZ_PURGE_ASYNC is set.")
+
+    def add_arguments(self, parser):
+        """Add the --quiz and --batch-size options."""
+        parser.add_argument('--quiz', type=int, action='append', dest='quizzes', default=None,
+                            help="Id of a quiz to archive and purge; repeat for several (default: every archived quiz).")
+        parser.add_argument('--batch-size', type=int, default=purge.BATCH_SIZE,
+                            help="Number of rows deleted at a time.")
+
+    def handle(self, *args, **options):
+        """Purge the quizzes and report what was deleted."""
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        quiz_ids = options['quizzes']
+        if quiz_ids is None:
+            quiz_ids = list(Quiz.objects.filter(archived=True).order_by('id').values_list('id', flat=True))
+        for quiz_id in quiz_ids:
+            if not purge.archive(quiz_id):
+                raise CommandError("Quiz %d does not exist." % quiz_id)
+            deleted = purge.purge(quiz_id, options['batch_size'])
+            self.stdout.write("Purged quiz %d: %s." % (quiz_id, ', '.join(
+                '%d %s' % (count, table) for table, count in sorted(deleted.items()))))
+        self.stdout.write("Purged %d quizzes." % len(quiz_ids))
@@ -0,0 +1,34 @@
+"""Score stored attempts again after the answer key of a quiz changed."""
+from django.core.management.base import BaseCommand, CommandError
+
+from quizXZ.models import Quiz
+from quizXZ import regrade
+
+
+class Command(BaseCommand):
+    """Re-grade every attempt at the given quizzes and update their stored results."""
+
+    help = ("Score every attempt at a quiz again with its current choice points and update the stored "
+            "results. Uses NumPy when it is installed.")
+
+    def add_arguments(self, parser):
+        """Add the --quiz and --batch-size options."""
+        parser.add_argument('--quiz', type=int, action='append', dest='quizzes', default=None,
+                            help="Id of a quiz to re-grade; repeat for several (default: every quiz).")
+        parser.add_argument('--batch-size', type=int, default=regrade.BATCH_SIZE,
+                            help="Number of answers read at a time.")
+
+    def handle(self, *args, **options):
+        """Re-grade the quizzes and report how many results changed."""
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        quiz_ids = options['quizzes']
+        if quiz_ids is None:
+            quiz_ids = list(Quiz.objects.filter(archived=False).order_by('id').values_list('id', flat=True))
+        for quiz_id in quiz_ids:
+            if not Quiz.objects.filter(id=quiz_id).exists():
+                raise CommandError("Quiz %d does not exist." % quiz_id)
+            counts = regrade.regrade(quiz_id, options['batch_size'])
+            self.stdout.write("Re-graded quiz %d: %d attempts, %d results updated, %d created." % (
+                quiz_id, counts['attempts'], counts['updated'], counts['created']))
+        self.stdout.write("Re-graded %d quizzes." % len(quiz_ids))
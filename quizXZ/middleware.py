@@ -0,0 +1,167 @@
+"""middleware.py for the quiz system."""
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger('quizXZ.querystats')
+
+# A view is flagged when one request runs more than QUERY_STATS_MAX_QUERIES
+# queries, or repeats the same query shape more than
+# QUERY_STATS_MAX_REPEATS times (the signature of a query per row).
+MAX_QUERIES = getattr(settings, 'QUERY_STATS_MAX_QUERIES', 30)
+MAX_REPEATS = getattr(settings, 'QUERY_STATS_MAX_REPEATS', 10)
+
+# Recording the queries makes every query slower, so only this fraction of
+# requests is measured: all of them under DEBUG, none otherwise unless
+# QUERY_STATS_SAMPLE_RATE is set.
+SAMPLE_RATE = getattr(settings, 'QUERY_STATS_SAMPLE_RATE', 1.0 if settings.DEBUG else 0.0)
+
+PARAMS = re.compile(r" - PARAMS = .*$", re.S)
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def query_shape(sql):
+    """Return the SQL with its parameters and literals replaced, so that queries differing only in values match."""
+    return LITERALS.sub('?', PARAMS.sub('', sql))
+
+
+class ViewStats(object):
+    """Per-view totals of the requests served by every worker process.
+
+    The totals are counters in the default cache, which every process
+    shares, so the query_stats page shows the whole site rather than the
+    process that served it. Increments are atomic with memcached; the file
+    cache can lose one when two processes add to the same view at once.
+    """
+
+    views_key = 'querystats:views'
+    # Counters added up per request; the times are kept in microseconds
+    # because the cache only increments integers.
+    fields = ('requests', 'flagged', 'total_us', 'db_us', 'queries', 'duplicates')
+    totals = fields + ('max_queries',)
+
+    def key(self, view, field):
+        """Return the cache key of one total of the view."""
+        return 'querystats:%s:%s' % (hashlib.md5(view.encode('utf-8')).hexdigest(), field)
+
+    def add(self, record):
+        """Add one request record to its view's totals."""
+        view = record['view']
+        views = cache.get(self.views_key) or []
+        if view not in views:
+            # A view lost to a concurrent registration is added again by its next request.
+            cache.set(self.views_key, sorted(set(views) | set([view])), None)
+        values = {
+            'requests': 1,
+            'flagged': 1 if record['flagged'] else 0,
+            'total_us': int(round(record['total_ms'] * 1000)),
+            'db_us': int(round(record['db_ms'] * 1000)),
+            'queries': record['queries'],
+            'duplicates': record['duplicates'],
+        }
+        for field, value in values.items():
+            if value:
+                self.incr(self.key(view, field), value)
+        key = self.key(view, 'max_queries')
+        if record['queries'] > (cache.get(key) or 0):
+            cache.set(key, record['queries'], None)
+
+    def incr(self, key, value):
+        """Add value to the counter at key, starting it if the cache has none."""
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            if not cache.add(key, value, None):
+                cache.incr(key, value)
+
+    def summary(self):
+        """Return the totals of every view with averages, slowest views first."""
+        views = cache.get(self.views_key) or []
+        found = cache.get_many([self.key(view, field) for view in views for field in self.totals])
+        rows = []
+        for view in views:
+            row = dict((field, found.get(self.key(view, field), 0)) for field in self.totals)
+            if not row['requests']:
+                continue
+            row['view'] = view
+            row['total_ms'] = row.pop('total_us') / 1000.0
+            row['db_ms'] = row.pop('db_us') / 1000.0
+            row['avg_ms'] = row['total_ms'] / row['requests']
+            row['avg_db_ms'] = row['db_ms'] / row['requests']
+            row['avg_queries'] = float(row['queries']) / row['requests']
+            rows.append(row)
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def clear(self):
+        """Forget every total."""
+        views = cache.get(self.views_key) or []
+        cache.delete_many([self.key(view, field) for view in views for field in self.totals])
+        cache.delete(self.views_key)
+
+
+view_stats = ViewStats()
+
+
+class QueryStatsMiddleware(object):
+    """Measure the wall time, database time and queries of a sample of the requests.
+
+    The numbers are sent back in a Server-Timing header, logged as one JSON
+    line on the quizXZ.querystats logger (at WARNING when the view is
+    flagged) and added to the per-view totals shown by the query_stats view.
+    Queries run while a StreamingHttpResponse is consumed (the CSV and quiz
+    bank exports) happen after process_response and are not counted.
+    """
+
+    def process_request(self, request):
+        """Start the clock and make the connection record its queries, for SAMPLE_RATE of the requests."""
+        if SAMPLE_RATE < 1 and random.random() >= SAMPLE_RATE:
+            return
+        request._querystats_start = time.time()
+        request._querystats_view = None
+        request._querystats_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        request._querystats_first = len(connection.queries_log)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Remember which view handles the request."""
+        request._querystats_view = '%s.%s' % (view_func.__module__, getattr(
+            view_func, '__name__', view_func.__class__.__name__))
+
+    def process_response(self, request, response):
+        """Add the timings to the response, the log and the per-view totals."""
+        if not hasattr(request, '_querystats_start'):
+            return response
+        connection.force_debug_cursor = request._querystats_debug_cursor
+        queries = list(connection.queries_log)[request._querystats_first:]
+        total_ms = (time.time() - request._querystats_start) * 1000
+        db_ms = sum(float(query['time']) for query in queries) * 1000
+        shapes = {}
+        for query in queries:
+            shape = query_shape(query['sql'])
+            shapes[shape] = shapes.get(shape, 0) + 1
+        record = {
+            'view': request._querystats_view or request.path,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 3),
+            'db_ms': round(db_ms, 3),
+            'queries': len(queries),
+            'duplicates': len(queries) - len(set(query['sql'] for query in queries)),
+            'max_repeats': max(shapes.values()) if shapes else 0,
+        }
+        record['flagged'] = record['queries'] > MAX_QUERIES or record['max_repeats'] > MAX_REPEATS
+        view_stats.add(record)
+        if record['flagged']:
+            logger.warning(json.dumps(record, sort_keys=True))
+        else:
+            logger.info(json.dumps(record, sort_keys=True))
+        response['Server-Timing'] = 'total;dur=%.3f, db;dur=%.3f;desc="%d queries, %d duplicates"' % (
+            total_ms, db_ms, record['queries'], record['duplicates'])
+        return response
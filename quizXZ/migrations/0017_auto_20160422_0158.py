@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Schema of the quiz models as of 0017_auto_20160422_0158, the last migration applied
+# to the shipped database. It stands in for the original 0001-0017 migrations so a
+# fresh database can be migrated; databases that already applied 0017 skip it.
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Choice',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('text', models.CharField(default=b'', max_length=300)),
+                ('point', models.IntegerField(default=0, choices=[(0, 0), (1, 0.5), (2, 1)])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Question',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('text', models.CharField(default=b'', max_length=500)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Quiz',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(default=b'', max_length=20)),
+                ('subject', models.CharField(default=b'', max_length=200, blank=True)),
+                ('difficulty', models.IntegerField(default=0, blank=True, choices=[(0, b'easy'), (1, b'medium'), (2, b'hard')])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuizUser',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('quiz', models.ForeignKey(to='quizXZ.Quiz')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='users',
+            field=models.ManyToManyField(to=settings.AUTH_USER_MODEL, through='quizXZ.QuizUser', blank=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='quiz',
+            field=models.ForeignKey(to='quizXZ.Quiz'),
+        ),
+        migrations.AddField(
+            model_name='choice',
+            name='question',
+            field=models.ForeignKey(to='quizXZ.Question'),
+        ),
+        migrations.AddField(
+            model_name='choice',
+            name='users',
+            field=models.ManyToManyField(to=settings.AUTH_USER_MODEL, blank=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='quizuser',
+            unique_together=set([('user', 'quiz')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quizXZ', '0017_auto_20160422_0158'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizResult',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.FloatField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('submitted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('quiz', models.ForeignKey(to='quizXZ.Quiz')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='quizresult',
+            unique_together=set([('user', 'quiz')]),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+CHOICE_USERS_INDEX = 'quizXZ_choice_users_user_id_choice_id'
+
+
+def create_choice_users_index(apps, schema_editor):
+    """Index the choice-users table by (user, choice) for looking up a user's answers."""
+    through = apps.get_model('quizXZ', 'Choice')._meta.get_field('users').rel.through
+    schema_editor.execute(schema_editor.sql_create_index % {
+        'name': schema_editor.quote_name(CHOICE_USERS_INDEX),
+        'table': schema_editor.quote_name(through._meta.db_table),
+        'columns': ', '.join(schema_editor.quote_name(column) for column in ('user_id', 'choice_id')),
+        'extra': '',
+    })
+
+
+def delete_choice_users_index(apps, schema_editor):
+    """Drop the (user, choice) index of the choice-users table."""
+    through = apps.get_model('quizXZ', 'Choice')._meta.get_field('users').rel.through
+    schema_editor.execute(schema_editor.sql_delete_index % {
+        'name': schema_editor.quote_name(CHOICE_USERS_INDEX),
+        'table': schema_editor.quote_name(through._meta.db_table),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizXZ', '0018_quizresult'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quiz',
+            name='name',
+            field=models.CharField(default='', max_length=20, db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='question',
+            index_together=set([('quiz', 'text')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='choice',
+            index_together=set([('question', 'point'), ('question', 'text')]),
+        ),
+        migrations.RunPython(create_choice_users_index, delete_choice_users_index),
+    ]
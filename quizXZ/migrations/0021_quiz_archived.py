@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizXZ', '0020_gradingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='archived',
+            field=models.BooleanField(default=False, db_index=True),
+        ),
+    ]
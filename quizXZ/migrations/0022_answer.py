@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+CHOICE_USERS_INDEX = 'quizXZ_choice_users_user_id_choice_id'
+
+# Rows copied at a time between the choice-users table and the answer table.
+BATCH_SIZE = 1000
+
+
+def copy_choice_users(apps, schema_editor):
+    """Move every choice-user row to an Answer of the user's attempt at the choice's quiz.
+
+    Rows of a user who has no QuizUser row for the quiz never counted in
+    any report and are dropped.
+    """
+    Choice = apps.get_model('quizXZ', 'Choice')
+    QuizUser = apps.get_model('quizXZ', 'QuizUser')
+    Answer = apps.get_model('quizXZ', 'Answer')
+    ChoiceUser = Choice._meta.get_field('users').rel.through
+    after = 0
+    while True:
+        rows = list(ChoiceUser.objects.filter(id__gt=after).order_by('id').values_list(
+            'id', 'user_id', 'choice_id', 'choice__question_id', 'choice__question__quiz_id')[:BATCH_SIZE])
+        if not rows:
+            break
+        attempts = dict(((user_id, quiz_id), attempt_id) for attempt_id, user_id, quiz_id in QuizUser.objects.filter(
+            user_id__in=set(row[1] for row in rows)).values_list('id', 'user_id', 'quiz_id'))
+        Answer.objects.bulk_create([
+            Answer(attempt_id=attempts[(user_id, quiz_id)], question_id=question_id, choice_id=choice_id)
+            for row_id, user_id, choice_id, question_id, quiz_id in rows if (user_id, quiz_id) in attempts])
+        after = rows[-1][0]
+
+
+def copy_answers(apps, schema_editor):
+    """Move every Answer back to a choice-user row."""
+    Choice = apps.get_model('quizXZ', 'Choice')
+    Answer = apps.get_model('quizXZ', 'Answer')
+    ChoiceUser = Choice._meta.get_field('users').rel.through
+    after = 0
+    while True:
+        rows = list(Answer.objects.filter(id__gt=after).order_by('id').values_list(
+            'id', 'attempt__user_id', 'choice_id')[:BATCH_SIZE])
+        if not rows:
+            break
+        ChoiceUser.objects.bulk_create([
+            ChoiceUser(user_id=user_id, choice_id=choice_id) for row_id, user_id, choice_id in rows])
+        after = rows[-1][0]
+
+
+def delete_choice_users_index(apps, schema_editor):
+    """Drop the (user, choice) index of the choice-users table added in 0019."""
+    through = apps.get_model('quizXZ', 'Choice')._meta.get_field('users').rel.through
+    schema_editor.execute(schema_editor.sql_delete_index % {
+        'name': schema_editor.quote_name(CHOICE_USERS_INDEX),
+        'table': schema_editor.quote_name(through._meta.db_table),
+    })
+
+
+def create_choice_users_index(apps, schema_editor):
+    """Index the choice-users table by (user, choice) again."""
+    through = apps.get_model('quizXZ', 'Choice')._meta.get_field('users').rel.through
+    schema_editor.execute(schema_editor.sql_create_index % {
+        'name': schema_editor.quote_name(CHOICE_USERS_INDEX),
+        'table': schema_editor.quote_name(through._meta.db_table),
+        'columns': ', '.join(schema_editor.quote_name(column) for column in ('user_id', 'choice_id')),
+        'extra': '',
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizXZ', '0021_quiz_archived'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Answer',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('attempt', models.ForeignKey(to='quizXZ.QuizUser')),
+                ('choice', models.ForeignKey(to='quizXZ.Choice')),
+                ('question', models.ForeignKey(to='quizXZ.Question')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='answer',
+            unique_together=set([('attempt', 'choice')]),
+        ),
+        migrations.RunPython(copy_choice_users, copy_answers),
+        migrations.RunPython(delete_choice_users_index, create_choice_users_index),
+        migrations.RemoveField(
+            model_name='choice',
+            name='users',
+        ),
+    ]
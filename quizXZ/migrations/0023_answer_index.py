@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizXZ', '0022_answer'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='answer',
+            index_together=set([('question', 'attempt', 'choice')]),
+        ),
+    ]
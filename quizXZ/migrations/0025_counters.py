@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Case, When, IntegerField
+
+# Quizzes counted at a time.
+BATCH_SIZE = 500
+
+
+def fill_counters(apps, schema_editor):
+    """Set the counters of every quiz and question from the rows that exist."""
+    Quiz = apps.get_model('quizXZ', 'Quiz')
+    Question = apps.get_model('quizXZ', 'Question')
+    Choice = apps.get_model('quizXZ', 'Choice')
+    QuizUser = apps.get_model('quizXZ', 'QuizUser')
+    after = 0
+    while True:
+        quiz_ids = list(Quiz.objects.filter(id__gt=after).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not quiz_ids:
+            break
+        questions = dict(Question.objects.filter(quiz_id__in=quiz_ids).values_list('quiz_id').annotate(
+            count=Count('id')).order_by())
+        attempts = dict(QuizUser.objects.filter(quiz_id__in=quiz_ids).values_list('quiz_id').annotate(
+            count=Count('id')).order_by())
+        totals = {}
+        for question_id, quiz_id, count, num_correct in Choice.objects.filter(
+                question__quiz_id__in=quiz_ids).values_list('question_id', 'question__quiz_id').annotate(
+                count=Count('id'), num_correct=Sum(Case(When(point=2, then=1), default=0,
+                                                        output_field=IntegerField()))).order_by():
+            Question.objects.filter(id=question_id).update(num_choices=count, num_correct=num_correct)
+            totals[quiz_id] = totals.get(quiz_id, 0) + num_correct
+        for quiz_id in quiz_ids:
+            Quiz.objects.filter(id=quiz_id).update(num_questions=questions.get(quiz_id, 0),
+                                                   num_attempts=attempts.get(quiz_id, 0),
+                                                   max_total=totals.get(quiz_id, 0))
+        after = quiz_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizXZ', '0024_draft'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='num_questions',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='num_attempts',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='max_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='num_choices',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='num_correct',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations, models
+
+# Questions counted at a time.
+BATCH_SIZE = 500
+
+
+def fill_patterns(apps, schema_editor):
+    """Count the selections of every question by attempt from the answers that exist."""
+    Question = apps.get_model('quizXZ', 'Question')
+    Answer = apps.get_model('quizXZ', 'Answer')
+    AnswerPattern = apps.get_model('quizXZ', 'AnswerPattern')
+    after = 0
+    while True:
+        question_ids = list(Question.objects.filter(id__gt=after).order_by('id').values_list(
+            'id', flat=True)[:BATCH_SIZE])
+        if not question_ids:
+            break
+        counts = {}
+        for (attempt_id, question_id), rows in groupby(Answer.objects.filter(question_id__in=question_ids).order_by(
+                'question_id', 'attempt_id', 'choice_id').values_list(
+                'attempt_id', 'question_id', 'choice_id').iterator(), itemgetter(0, 1)):
+            pair = (question_id, ','.join(str(row[2]) for row in rows))
+            counts[pair] = counts.get(pair, 0) + 1
+        AnswerPattern.objects.bulk_create([
+            AnswerPattern(question_id=question_id, choices=choices, attempts=count)
+            for (question_id, choices), count in sorted(counts.items())])
+        after = question_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizXZ', '0025_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerPattern',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('choices', models.CharField(max_length=500)),
+                ('attempts', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(to='quizXZ.Question')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='answerpattern',
+            unique_together=set([('question', 'choices')]),
+        ),
+        migrations.RunPython(fill_patterns, migrations.RunPython.noop),
+    ]
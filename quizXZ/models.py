@@ -1,14 +1,33 @@
 """models.py for the quiz system."""
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
-class Quiz(models.Model):
+class CounterMixin(object):
+    """Leave the counter_fields out when an existing row is saved.
+
+    signals.py changes the counters with UPDATE ... SET n = n + 1 while the
+    admin and the views hold instances read earlier, so writing every
+    column would put the counts they read back. New rows are saved whole.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        """Save the row, without its counters unless it is new or update_fields names them."""
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields]
+        super(CounterMixin, self).save(*args, **kwargs)
+
+
+class Quiz(CounterMixin, models.Model):
     """Quiz model."""
 
     users = models.ManyToManyField(
         settings.AUTH_USER_MODEL, through="QuizUser", blank=True)
-    name = models.CharField(max_length=20, default="")
+    name = models.CharField(max_length=20, default="", db_index=True)
     diffLevels = (
         (0, "easy"),
         (1, "medium"),
@@ -16,17 +35,32 @@ class Quiz(models.Model):
     )
     subject = models.CharField(max_length=200, default="", blank=True)
     difficulty = models.IntegerField(choices=diffLevels, default=0, blank=True)
+    archived = models.BooleanField(default=False, db_index=True)
+    # Counters kept up to date by signals.py; check_counters repairs them.
+    num_questions = models.IntegerField(default=0, editable=False)
+    num_attempts = models.IntegerField(default=0, editable=False)
+    max_total = models.IntegerField(default=0, editable=False)
+    counter_fields = ('num_questions', 'num_attempts', 'max_total')
 
     def __str__(self):
         """To string method for the quiz model."""
         return self.name
 
 
-class Question(models.Model):
+class Question(CounterMixin, models.Model):
     """Question model."""
 
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
     text = models.CharField(max_length=500, default="")
+    # Counters kept up to date by signals.py; check_counters repairs them.
+    num_choices = models.IntegerField(default=0, editable=False)
+    num_correct = models.IntegerField(default=0, editable=False)
+    counter_fields = ('num_choices', 'num_correct')
+
+    class Meta:
+        """Index the questions of a quiz in text order."""
+
+        index_together = [('quiz', 'text')]
 
     def __str__(self):
         """To string method for the question model."""
@@ -37,7 +71,6 @@ class Choice(models.Model):
     """Choice model."""
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
-    users = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True)
     text = models.CharField(max_length=300, default="")
     pointTypes = (
         (0, 0),
@@ -46,18 +79,135 @@ class Choice(models.Model):
     )
     point = models.IntegerField(choices=pointTypes, default=0)
 
+    class Meta:
+        """Index the points of a question's choices for grading and its choices in text order."""
+
+        index_together = [('question', 'point'), ('question', 'text')]
+
     def __str__(self):
         """To string method for the choice model."""
         return self.text
 
 
 class QuizUser(models.Model):
-    """QuizUser model that specifies the ManyToMany relatinoship between Django User model and the Quiz model."""
+    """QuizUser model that specifies the ManyToMany relatinoship between Django User model and the Quiz model.
+
+    Each row is one attempt at the quiz, and the Answer rows of the attempt
+    hold the choices selected in it.
+    """
+
+    quiz = models.ForeignKey(Quiz)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL)
+
+    class Meta:
+        """Set the combined foreign keys to be unique."""
+
+        unique_together = ('user', 'quiz')
+
+
+class Answer(models.Model):
+    """Answer model that stores a choice selected in an attempt (a QuizUser row) at a quiz."""
+
+    attempt = models.ForeignKey(QuizUser)
+    question = models.ForeignKey(Question)
+    choice = models.ForeignKey(Choice)
+
+    class Meta:
+        """Set the combined foreign keys to be unique, which also indexes the answers of an attempt, and index
+        the answers of each question by attempt for the analytics."""
+
+        unique_together = ('attempt', 'choice')
+        index_together = [('question', 'attempt', 'choice')]
+
+
+class AnswerPattern(models.Model):
+    """AnswerPattern model that counts the attempts which selected exactly the same choices of a question.
+
+    choices holds the sorted ids of the selected choices, separated by
+    commas. patterns.py keeps the counts up to date as attempts are saved
+    and deleted, so the analytics read a row per distinct selection rather
+    than every answer.
+    """
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choices = models.CharField(max_length=500)
+    attempts = models.IntegerField(default=0)
+
+    class Meta:
+        """Set the question and its selected choices to be unique."""
+
+        unique_together = ('question', 'choices')
+
+
+class QuizResult(models.Model):
+    """QuizResult model that stores the score a user got on a quiz when it was submitted."""
+
+    quiz = models.ForeignKey(Quiz)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL)
+    score = models.FloatField(default=0)
+    total = models.IntegerField(default=0)
+    submitted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        """Set the combined foreign keys to be unique."""
+
+        unique_together = ('user', 'quiz')
+
+    def __str__(self):
+        """To string method for the quiz result model."""
+        return "%s / %s" % (self.score, self.total)
+
+
+class GradingJob(models.Model):
+    """GradingJob model that queues the grading of a submitted attempt for a grade_worker process."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    statuses = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    quiz = models.ForeignKey(Quiz)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL)
+    status = models.CharField(max_length=10, choices=statuses, default=PENDING)
+    worker = models.CharField(max_length=100, blank=True)
+    tries = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        """Set the combined foreign keys to be unique and index the queue order of each status."""
+
+        unique_together = ('user', 'quiz')
+        index_together = [('status', 'id')]
+
+    def __str__(self):
+        """To string method for the grading job model."""
+        return "%s: %s" % (self.id, self.status)
+
+
+class Draft(models.Model):
+    """Draft model that keeps the choices a user has selected so far in a quiz taken a page at a time.
+
+    choices holds the selected choice ids packed as sorted comma separated
+    text, so a draft is one row however many questions the quiz has.
+    """
 
     quiz = models.ForeignKey(Quiz)
     user = models.ForeignKey(settings.AUTH_USER_MODEL)
+    choices = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         """Set the combined foreign keys to be unique."""
 
         unique_together = ('user', 'quiz')
+
+    def __str__(self):
+        """To string method for the draft model."""
+        return "%s: %s" % (self.id, self.choices)
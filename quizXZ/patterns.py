@@ -0,0 +1,100 @@
+"""patterns.py for the quiz system."""
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from models import Answer, AnswerPattern
+from answerkey import chunks
+
+# (question, choices) pairs looked up per query; each pair is two
+# parameters, so this keeps a query under SQLite's limit.
+PAIRS_PER_QUERY = 400
+
+
+def pattern(choice_ids):
+    """Return the choices value of an AnswerPattern row for the selected choice ids."""
+    return ','.join(str(choice_id) for choice_id in sorted(choice_ids))
+
+
+def choice_ids(choices):
+    """Return the list of choice ids held in the choices value of an AnswerPattern row."""
+    return [int(choice_id) for choice_id in choices.split(',')]
+
+
+def tally(selections):
+    """Count the patterns of (attempt_id, question_id, choice_id) selections.
+
+    The selections of each attempt at each question must come one after
+    another, as they do in (question, attempt) order, so only the counts
+    are held in memory. Returns a dict mapping (question_id, choices) pairs
+    to the number of attempts that selected exactly those choices.
+    """
+    counts = {}
+    for (attempt_id, question_id), rows in groupby(selections, itemgetter(0, 1)):
+        pair = (question_id, pattern(choice_id for attempt_id, question_id, choice_id in rows))
+        counts[pair] = counts.get(pair, 0) + 1
+    return counts
+
+
+def add(counts, sign=1):
+    """Add the counts of a tally to the stored patterns, or take them away with sign -1.
+
+    Patterns that are stored already get an UPDATE ... SET attempts =
+    attempts + n per distinct n, so concurrent submissions cannot lose a
+    count; new patterns are inserted, and if another process inserted one
+    of them first they are added again as updates.
+    """
+    pairs = sorted(counts)
+    for start in range(0, len(pairs), PAIRS_PER_QUERY):
+        chunk = pairs[start:start + PAIRS_PER_QUERY]
+        match = Q()
+        for question_id, choices in chunk:
+            match = match | Q(question_id=question_id, choices=choices)
+        found = dict(((question_id, choices), pattern_id) for pattern_id, question_id, choices in
+                     AnswerPattern.objects.filter(match).values_list('id', 'question_id', 'choices'))
+        by_count = {}
+        for pair in chunk:
+            if pair in found:
+                by_count.setdefault(counts[pair], []).append(found[pair])
+        for count, ids in by_count.items():
+            AnswerPattern.objects.filter(id__in=ids).update(attempts=F('attempts') + sign * count)
+        missing = [pair for pair in chunk if pair not in found]
+        if missing and sign > 0:
+            try:
+                with transaction.atomic():
+                    AnswerPattern.objects.bulk_create([
+                        AnswerPattern(question_id=question_id, choices=choices, attempts=counts[question_id, choices])
+                        for question_id, choices in missing])
+            except IntegrityError:
+                add(dict((pair, counts[pair]) for pair in missing))
+
+
+def attempt_added(attempt_id, selections):
+    """Count the (question_id, choice_id) selections of a new attempt."""
+    add(tally((attempt_id, question_id, choice_id) for question_id, choice_id in sorted(selections)))
+
+
+def attempt_deleted(attempt_id):
+    """Take the selections of an attempt that is about to be deleted out of the counts."""
+    add(tally(Answer.objects.filter(attempt_id=attempt_id).order_by('question_id').values_list(
+        'attempt_id', 'question_id', 'choice_id')), -1)
+
+
+def rebuild(question_ids):
+    """Count the patterns of the questions again from their answers and replace the stored ones.
+
+    The answers are read in (question, attempt, choice) index order. Used
+    after choices are deleted, and to repair the counts after answers were
+    written some other way.
+    """
+    for question_chunk in chunks(set(question_ids)):
+        with transaction.atomic():
+            counts = tally(Answer.objects.filter(question_id__in=question_chunk).order_by(
+                'question_id', 'attempt_id', 'choice_id').values_list(
+                'attempt_id', 'question_id', 'choice_id').iterator())
+            AnswerPattern.objects.filter(question_id__in=question_chunk).delete()
+            AnswerPattern.objects.bulk_create([
+                AnswerPattern(question_id=question_id, choices=choices, attempts=count)
+                for (question_id, choices), count in sorted(counts.items())])
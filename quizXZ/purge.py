@@ -0,0 +1,72 @@
+"""purge.py for the quiz system."""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from models import Quiz, Question, Choice, QuizUser, Answer, AnswerPattern, QuizResult, GradingJob, Draft
+import caching
+import signals
+
+# With QUIZ_PURGE_ASYNC deleting a quiz only archives it, and the purge_quizzes
+# command removes it and its history later; otherwise the delete_quiz view
+# purges it straight away.
+ASYNC = getattr(settings, 'QUIZ_PURGE_ASYNC', False)
+
+# Rows removed per DELETE, each batch in its own transaction.
+BATCH_SIZE = 1000
+
+
+def archive(quiz_id):
+    """Hide the quiz from students and authors without deleting anything."""
+    archived = Quiz.objects.filter(id=quiz_id).update(archived=True)
+    signals.quiz_content_changed(quiz_id)
+    return archived
+
+
+def delete_batches(queryset, batch_size, before=None):
+    """Delete the rows of the queryset batch_size at a time and return how many were deleted.
+
+    Every batch is one SELECT of ids and one DELETE, run in its own
+    transaction so locks are held only briefly. The DELETE goes straight to
+    the database without loading the rows or sending signals; before, if
+    given, is called with the ids of each batch first.
+    """
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            if before is not None:
+                before(ids)
+            queryset.model.objects.filter(id__in=ids)._raw_delete(queryset.db)
+        deleted = deleted + len(ids)
+
+
+def forget_takers(ids):
+    """Drop the cached taken quiz ids of the users of a batch of QuizUser rows."""
+    user_ids = QuizUser.objects.filter(id__in=ids).values_list('user_id', flat=True)
+    cache.delete_many([caching.taken_key(user_id) for user_id in user_ids])
+
+
+def purge(quiz_id, batch_size=BATCH_SIZE):
+    """Delete the quiz with its questions, choices, answers, attempts and drafts using set-based batched deletes.
+
+    Dependents are removed before the rows they reference, so the quiz can
+    be purged a batch at a time while the rest of the site keeps running.
+    Returns a dict of the number of rows deleted per table.
+    """
+    deleted = {}
+    deleted['answers'] = delete_batches(Answer.objects.filter(question__quiz_id=quiz_id), batch_size)
+    deleted['results'] = delete_batches(QuizResult.objects.filter(quiz_id=quiz_id), batch_size)
+    deleted['grading jobs'] = delete_batches(GradingJob.objects.filter(quiz_id=quiz_id), batch_size)
+    deleted['drafts'] = delete_batches(Draft.objects.filter(quiz_id=quiz_id), batch_size)
+    deleted['attempts'] = delete_batches(QuizUser.objects.filter(quiz_id=quiz_id), batch_size, forget_takers)
+    deleted['answer patterns'] = delete_batches(AnswerPattern.objects.filter(question__quiz_id=quiz_id), batch_size)
+    deleted['choices'] = delete_batches(Choice.objects.filter(question__quiz_id=quiz_id), batch_size)
+    deleted['questions'] = delete_batches(Question.objects.filter(quiz_id=quiz_id), batch_size)
+    deleted['quizzes'] = delete_batches(Quiz.objects.filter(id=quiz_id), batch_size)
+    # The raw deletes send no post_delete signals.
+    signals.quiz_content_changed(quiz_id)
+    return deleted
+
@@ -0,0 +1,133 @@
+"""regrade.py for the quiz system."""
+from django.db import connection, transaction
+
+from models import Question, QuizUser, Answer, QuizResult
+import answerkey
+from answerkey import chunks
+
+# NumPy is optional: without it the selections are graded one attempt at a
+# time in Python, which gives the same scores more slowly.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Answer rows fetched from the database at a time.
+BATCH_SIZE = 10000
+
+SELECTIONS_SQL = """
+SELECT answer.attempt_id, answer.choice_id
+FROM %(answer)s answer
+INNER JOIN %(question)s question ON question.id = answer.question_id
+WHERE question.quiz_id = %%s
+"""
+
+
+def selections(quiz_id, batch_size=BATCH_SIZE):
+    """Return the (attempt_id, choice_id) pairs of every answer to the quiz, fetched batch_size rows at a time.
+
+    The rows are read straight from a cursor, and the (question, attempt,
+    choice) index covers the query, so no model instances are built. With
+    NumPy each batch becomes an int64 array as it arrives and the pairs are
+    returned as one array of two columns; otherwise as a list of tuples.
+    """
+    sql = SELECTIONS_SQL % {
+        'answer': connection.ops.quote_name(Answer._meta.db_table),
+        'question': connection.ops.quote_name(Question._meta.db_table),
+    }
+    cursor = connection.cursor()
+    cursor.execute(sql, [quiz_id])
+    batches = []
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        if numpy is not None:
+            batch = numpy.array(batch, dtype=numpy.int64)
+        batches.append(batch)
+    if numpy is None:
+        return [row for batch in batches for row in batch]
+    if not batches:
+        return numpy.zeros((0, 2), dtype=numpy.int64)
+    return numpy.concatenate(batches)
+
+
+def grade_arrays(key, attempt_ids, rows):
+    """Grade every attempt at once with NumPy array operations and return a list of scores.
+
+    The selections become a matrix with one cell per attempt and question,
+    holding how many correct, partial and wrong choices were selected; the
+    grading rule is then applied to whole arrays. attempt_ids must be
+    sorted.
+    """
+    choice_ids = numpy.asarray(sorted(key.points), dtype=numpy.int64)
+    questions = dict((question_id, i) for i, question_id in enumerate(sorted(key.correct)))
+    choice_question = numpy.asarray([questions[key.points[choice_id][0]] for choice_id in choice_ids.tolist()],
+                                    dtype=numpy.int64)
+    choice_point = numpy.asarray([key.points[choice_id][1] for choice_id in choice_ids.tolist()], dtype=numpy.int64)
+
+    attempt_ids = numpy.asarray(attempt_ids, dtype=numpy.int64)
+    if not len(rows) or not len(choice_ids) or not len(attempt_ids):
+        return [0] * len(attempt_ids)
+    picked = numpy.asarray(rows, dtype=numpy.int64)
+    column = numpy.minimum(numpy.searchsorted(choice_ids, picked[:, 1]), len(choice_ids) - 1)
+    attempt = numpy.minimum(numpy.searchsorted(attempt_ids, picked[:, 0]), len(attempt_ids) - 1)
+    # Choices no longer in the quiz and attempts made after attempt_ids was
+    # read are left out.
+    known = (choice_ids[column] == picked[:, 1]) & (attempt_ids[attempt] == picked[:, 0])
+    attempt = attempt[known]
+    column = column[known]
+    cell = attempt * len(questions) + choice_question[column]
+    point = choice_point[column]
+    size = len(attempt_ids) * len(questions)
+    shape = (len(attempt_ids), len(questions))
+    correct = numpy.bincount(cell[point == 2], minlength=size).reshape(shape)
+    partial = numpy.bincount(cell[point == 1], minlength=size).reshape(shape)
+    wrong = numpy.bincount(cell[point == 0], minlength=size).reshape(shape)
+    scores = numpy.where(wrong > 0, 0.0, correct * numpy.power(0.5, partial)).sum(axis=1)
+    return scores.tolist()
+
+
+def grade_lists(key, attempt_ids, rows):
+    """Grade every attempt with the answer key one attempt at a time and return a list of scores."""
+    picked = dict((attempt_id, []) for attempt_id in attempt_ids)
+    for attempt_id, choice_id in rows:
+        if attempt_id in picked:
+            picked[attempt_id].append(choice_id)
+    return [key.grade(picked[attempt_id])['score'] for attempt_id in attempt_ids]
+
+
+def regrade(quiz_id, batch_size=BATCH_SIZE):
+    """Score every attempt at the quiz again with its current answer key and store the changed results.
+
+    All the answers of the quiz are read in a few queries and graded
+    together. Results are written with one UPDATE per distinct new score
+    (per chunk of users), so the number of queries depends on the number
+    of distinct scores rather than on the number of attempts. Returns a
+    dict with the number of attempts and of results updated and created.
+    """
+    key = answerkey.get(quiz_id)
+    attempts = list(QuizUser.objects.filter(quiz_id=quiz_id).order_by('id').values_list('id', 'user_id'))
+    attempt_ids = [attempt_id for attempt_id, user_id in attempts]
+    rows = selections(quiz_id, batch_size)
+    grade = grade_arrays if numpy is not None else grade_lists
+    scores = grade(key, attempt_ids, rows)
+
+    stored = dict((user_id, (point, total)) for user_id, point, total in QuizResult.objects.filter(
+        quiz_id=quiz_id).values_list('user_id', 'score', 'total'))
+    changed = {}
+    missing = []
+    for (attempt_id, user_id), point in zip(attempts, scores):
+        if user_id not in stored:
+            missing.append(QuizResult(user_id=user_id, quiz_id=quiz_id, score=point, total=key.total))
+        elif stored[user_id] != (point, key.total):
+            changed.setdefault(point, []).append(user_id)
+
+    with transaction.atomic():
+        for point, user_ids in changed.items():
+            for user_chunk in chunks(user_ids):
+                QuizResult.objects.filter(quiz_id=quiz_id, user_id__in=user_chunk).update(
+                    score=point, total=key.total)
+        QuizResult.objects.bulk_create(missing, batch_size=answerkey.CHUNK_SIZE)
+    return {'attempts': len(attempts), 'updated': sum(len(user_ids) for user_ids in changed.values()),
+            'created': len(missing)}
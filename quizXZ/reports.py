@@ -0,0 +1,129 @@
+"""reports.py for the quiz system."""
+import csv
+import json
+
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+
+from models import QuizUser
+import scoring
+
+# Rows shown per page of the users report unless the page size is given.
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows read from the database at a time for the CSV export.
+EXPORT_CHUNK_SIZE = 1000
+
+COLUMNS = ('quiz__name', 'quiz_id', 'user__username', 'user_id', 'id')
+
+
+def get_filters(params):
+    """Return the quiz, subject and difficulty filters found in the GET parameters."""
+    filters = {}
+    if params.get('quiz', '').isdigit():
+        filters['quiz'] = params['quiz']
+    if params.get('subject'):
+        filters['subject'] = params['subject']
+    if params.get('difficulty', '').isdigit():
+        filters['difficulty'] = params['difficulty']
+    return filters
+
+
+def get_page_size(params):
+    """Return the page size from the GET parameters, between 1 and MAX_PAGE_SIZE."""
+    size = params.get('size', '')
+    if not size.isdigit() or int(size) < 1:
+        return PAGE_SIZE
+    return min(int(size), MAX_PAGE_SIZE)
+
+
+def encode_cursor(row):
+    """Encode the (quiz id, attempt id) position of an attempt row as an opaque cursor."""
+    return urlsafe_base64_encode(json.dumps([row[1], row[4]]).encode('utf-8'))
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor, returning None if it is not valid."""
+    try:
+        quiz_id, attempt_id = json.loads(urlsafe_base64_decode(cursor).decode('utf-8'))
+        return int(quiz_id), int(attempt_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def attempts(filters):
+    """Return the attempts matching the filters in (quiz id, attempt id) order.
+
+    The index on quiz_id holds the attempts in this order, so they are read
+    from the index instead of sorting every attempt.
+    """
+    quizusers = QuizUser.objects.all()
+    if 'quiz' in filters:
+        quizusers = quizusers.filter(quiz_id=filters['quiz'])
+    if 'subject' in filters:
+        quizusers = quizusers.filter(quiz__subject=filters['subject'])
+    if 'difficulty' in filters:
+        quizusers = quizusers.filter(quiz__difficulty=filters['difficulty'])
+    return quizusers.order_by('quiz_id', 'id').values_list(*COLUMNS)
+
+
+def read(filters, after, limit):
+    """Return a list of up to limit attempt rows following a cursor position, or from the start.
+
+    The rest of the cursor's quiz and the quizzes after it are read with
+    two queries, so each one starts its index scan at the cursor.
+    """
+    if after is None:
+        return list(attempts(filters)[:limit])
+    quiz_id, attempt_id = after
+    attempt_rows = list(attempts(filters).filter(quiz_id=quiz_id, id__gt=attempt_id)[:limit])
+    if len(attempt_rows) < limit:
+        attempt_rows.extend(attempts(filters).filter(quiz_id__gt=quiz_id)[:limit - len(attempt_rows)])
+    return attempt_rows
+
+
+def rows(attempt_rows):
+    """Return (quiz name, username, score, total) rows for a list of attempts, by quiz and then username."""
+    attempt_rows = sorted(attempt_rows, key=lambda row: (row[1], row[2]))
+    results = scoring.stored_scores((user_id, quiz_id) for name, quiz_id, username, user_id, attempt_id in attempt_rows)
+    report = []
+    for name, quiz_id, username, user_id, attempt_id in attempt_rows:
+        result = results[(user_id, quiz_id)]
+        report.append((name, username, result.get('score'), result.get('total')))
+    return report
+
+
+def page(filters, cursor=None, size=PAGE_SIZE):
+    """Return one page of report rows and the cursor of the next page (None on the last page).
+
+    The attempts of a quiz are shown in username order within each page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    attempt_rows = read(filters, after, size + 1)
+    next_cursor = None
+    if len(attempt_rows) > size:
+        attempt_rows = attempt_rows[:size]
+        next_cursor = encode_cursor(attempt_rows[-1])
+    return rows(attempt_rows), next_cursor
+
+
+class Echo(object):
+    """File-like object that hands back what is written, for csv.writer."""
+
+    def write(self, value):
+        """Return the value instead of storing it."""
+        return value
+
+
+def export_csv(filters):
+    """Yield the whole report as CSV lines, reading EXPORT_CHUNK_SIZE attempts at a time."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(['Quiz Name', 'User Name', 'Score', 'Total'])
+    after = None
+    while True:
+        attempt_rows = read(filters, after, EXPORT_CHUNK_SIZE)
+        if not attempt_rows:
+            break
+        for row in rows(attempt_rows):
+            yield writer.writerow([unicode(value).encode('utf-8') for value in row])
+        after = attempt_rows[-1][1], attempt_rows[-1][4]
@@ -0,0 +1,75 @@
+"""scoring.py for the quiz system."""
+from models import Answer, QuizResult
+import answerkey
+from answerkey import CHUNK_SIZE, chunks
+
+
+def score(user_id, quiz_id):
+    """Calculate the user's score for the quiz from its cached answer key."""
+    key = answerkey.get(quiz_id)
+    selections = Answer.objects.filter(
+        attempt__user_id=user_id, attempt__quiz_id=quiz_id).values_list('choice_id', flat=True)
+    return key.grade(selections)
+
+
+def score_many(pairs):
+    """Calculate scores for many (user_id, quiz_id) pairs at once.
+
+    Returns a dict mapping each pair to {'score': ..., 'total': ...}. The
+    answer keys come from the answer key cache and the selections of every
+    quiz involved are read in one pass (one query per CHUNK_SIZE quizzes),
+    so the number of queries does not grow with the number of pairs.
+    """
+    pairs = set((int(user_id), int(quiz_id)) for user_id, quiz_id in pairs)
+    if not pairs:
+        return {}
+    quiz_ids = set(quiz_id for user_id, quiz_id in pairs)
+    user_ids = set(user_id for user_id, quiz_id in pairs)
+
+    keys = answerkey.get_many(quiz_ids)
+    selections = {}
+    for quiz_chunk in chunks(quiz_ids):
+        picked = Answer.objects.filter(attempt__quiz_id__in=quiz_chunk)
+        if len(user_ids) <= CHUNK_SIZE:
+            picked = picked.filter(attempt__user_id__in=user_ids)
+        picked = picked.values_list('attempt__user_id', 'attempt__quiz_id', 'choice_id')
+        for user_id, quiz_id, choice_id in picked:
+            if (user_id, quiz_id) in pairs:
+                selections.setdefault((user_id, quiz_id), []).append(choice_id)
+    return dict((pair, keys[pair[1]].grade(selections.get(pair, ()))) for pair in pairs)
+
+
+def save_result(user_id, quiz_id, result=None):
+    """Store the user's result for the quiz as a QuizResult, scoring it first unless given."""
+    if result is None:
+        result = score(user_id, quiz_id)
+    QuizResult.objects.update_or_create(user_id=user_id, quiz_id=quiz_id, defaults={
+        'score': result['score'], 'total': result['total']})
+    return result
+
+
+def stored_scores(pairs):
+    """Return scores for (user_id, quiz_id) pairs from the stored QuizResult rows.
+
+    Pairs without a stored result (attempts made before results were stored)
+    are scored live with score_many.
+    """
+    pairs = set((int(user_id), int(quiz_id)) for user_id, quiz_id in pairs)
+    if not pairs:
+        return {}
+    quiz_ids = set(quiz_id for user_id, quiz_id in pairs)
+    user_ids = set(user_id for user_id, quiz_id in pairs)
+    results = {}
+    for quiz_chunk in chunks(quiz_ids):
+        stored = QuizResult.objects.filter(quiz_id__in=quiz_chunk)
+        if len(user_ids) <= CHUNK_SIZE:
+            stored = stored.filter(user_id__in=user_ids)
+        for user_id, quiz_id, point, total in stored.values_list('user_id', 'quiz_id', 'score', 'total'):
+            if (user_id, quiz_id) in pairs:
+                if point == int(point):
+                    point = int(point)
+                results[(user_id, quiz_id)] = {'score': point, 'total': total}
+    missing = pairs.difference(results)
+    if missing:
+        results.update(score_many(missing))
+    return results
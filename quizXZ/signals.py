@@ -0,0 +1,155 @@
+"""signals.py for the quiz system."""
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from models import Quiz, Question, Choice, QuizUser, QuizResult, GradingJob
+import answerkey
+import caching
+import counters
+import patterns
+
+# The ids of the quizzes changed inside the current thread's content_changes block.
+_changed = threading.local()
+
+
+def quiz_content_changed(quiz_id):
+    """Invalidate the cached question block and answer key of the quiz."""
+    caching.bump_quiz_version(quiz_id)
+    answerkey.invalidate(quiz_id)
+    quiz_ids = getattr(_changed, 'quiz_ids', None)
+    if quiz_ids is not None:
+        quiz_ids.add(quiz_id)
+
+
+@contextmanager
+def content_changes():
+    """Invalidate the cached content of every quiz changed in the block once more when the block ends.
+
+    The receivers below run inside the transaction that saves a change, so
+    another process can read the new version before the commit, build the
+    question block or answer key from the old rows and cache them under it.
+    Wrapped around a transaction, this moves those quizzes to yet another
+    version after the commit. Nested blocks leave the work to the outermost.
+    """
+    if getattr(_changed, 'quiz_ids', None) is not None:
+        yield
+        return
+    _changed.quiz_ids = set()
+    try:
+        yield
+    finally:
+        quiz_ids, _changed.quiz_ids = _changed.quiz_ids, None
+        for quiz_id in quiz_ids:
+            quiz_content_changed(quiz_id)
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    """Invalidate the cached content of a quiz that was saved or deleted."""
+    quiz_content_changed(instance.id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    """Invalidate the cached content of the quiz a question belongs to."""
+    quiz_content_changed(instance.quiz_id)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    """Invalidate the cached content of the quiz a choice belongs to.
+
+    Cascade deletes remove choices before their question, so the question
+    row is still there to look the quiz up.
+    """
+    for quiz_id in Question.objects.filter(id=instance.question_id).values_list('quiz_id', flat=True):
+        quiz_content_changed(quiz_id)
+
+
+@receiver(pre_delete, sender=QuizUser)
+def quizuser_deleting(sender, instance, **kwargs):
+    """Take the selections of an attempt out of the answer patterns before its answers are deleted."""
+    patterns.attempt_deleted(instance.id)
+
+
+@receiver(post_delete, sender=QuizUser)
+def quizuser_deleted(sender, instance, **kwargs):
+    """Forget a deleted attempt: its result, its grading job, the user's cached taken quiz ids and its count.
+
+    Results and grading jobs are unique per user and quiz, so leaving them
+    would stop the user from taking the quiz again.
+    """
+    QuizResult.objects.filter(user_id=instance.user_id, quiz_id=instance.quiz_id).delete()
+    GradingJob.objects.filter(user_id=instance.user_id, quiz_id=instance.quiz_id).delete()
+    caching.forget_taken_quizzes(instance.user_id)
+    counters.attempt_added(instance.quiz_id, -1)
+
+
+@receiver(post_save, sender=QuizUser)
+def quizuser_saved(sender, instance, created, **kwargs):
+    """Drop the cached taken quiz ids of a user who made a new attempt and count it on its quiz."""
+    if created:
+        caching.forget_taken_quizzes(instance.user_id)
+        counters.attempt_added(instance.quiz_id)
+
+
+@receiver(pre_save, sender=Question)
+def question_saving(sender, instance, **kwargs):
+    """Remember the quiz an existing question belonged to before it is saved."""
+    instance.saved_quiz_id = None
+    if instance.id is not None:
+        for quiz_id in Question.objects.filter(id=instance.id).values_list('quiz_id', flat=True):
+            instance.saved_quiz_id = quiz_id
+
+
+@receiver(post_save, sender=Question)
+def question_counted(sender, instance, created, **kwargs):
+    """Count a new question on its quiz, or recount both quizzes of a question that moved."""
+    if created:
+        counters.question_added(instance.quiz_id)
+    elif getattr(instance, 'saved_quiz_id', None) not in (None, instance.quiz_id):
+        counters.recount([instance.saved_quiz_id, instance.quiz_id])
+
+
+@receiver(post_delete, sender=Question)
+def question_uncounted(sender, instance, **kwargs):
+    """Count a deleted question off its quiz; its choices were counted off before it."""
+    counters.question_added(instance.quiz_id, -1)
+
+
+@receiver(pre_save, sender=Choice)
+def choice_saving(sender, instance, **kwargs):
+    """Remember the question and point of an existing choice before it is saved."""
+    instance.saved_point = None
+    if instance.id is not None:
+        for question_id, point in Choice.objects.filter(id=instance.id).values_list('question_id', 'point'):
+            instance.saved_point = (question_id, point)
+
+
+@receiver(post_save, sender=Choice)
+def choice_counted(sender, instance, created, **kwargs):
+    """Count a new choice on its question and quiz, moving the counts of a choice that changed."""
+    saved = getattr(instance, 'saved_point', None)
+    if created:
+        counters.choice_added(instance.question_id, instance.point)
+    elif saved is not None and saved != (instance.question_id, instance.point):
+        counters.choice_added(saved[0], saved[1], -1)
+        counters.choice_added(instance.question_id, instance.point)
+
+
+@receiver(post_delete, sender=Choice)
+def choice_uncounted(sender, instance, **kwargs):
+    """Count a deleted choice off its question and quiz."""
+    counters.choice_added(instance.question_id, instance.point, -1)
+
+
+@receiver(post_delete, sender=Choice)
+def choice_unpicked(sender, instance, **kwargs):
+    """Count the answer patterns of the question of a deleted choice again; its answers were deleted before it."""
+    patterns.rebuild([instance.question_id])
@@ -0,0 +1,55 @@
+"""submission.py for the quiz system."""
+from django.db import IntegrityError, transaction
+
+from models import Answer, QuizUser, Draft
+import answerkey
+import caching
+import grading
+import patterns
+import scoring
+
+
+class InvalidSubmission(Exception):
+    """Raised when a quiz submission cannot be saved; the message is shown to the user."""
+
+
+def submit(user, quiz, selections):
+    """Save the user's selections for the quiz together with the attempt and its result.
+
+    Every selection must be a choice in the quiz's answer key, and the QuizUser row, its Answer rows and the QuizResult row
+    are written in one transaction with a single bulk insert for the answers,
+    which are also counted in the answer patterns.
+    The user's draft of the quiz is deleted in the same transaction.
+    With grading.ASYNC a GradingJob is queued instead of the QuizResult and
+    None is returned.
+
+    A second attempt at the quiz raises InvalidSubmission; any other
+    database error is left to propagate.
+    """
+    if not all(str(selection).isdigit() for selection in selections):
+        raise InvalidSubmission('Invalid Input!')
+    selected = set(int(selection) for selection in selections)
+    key = answerkey.get(quiz.id)
+    if not all(choice_id in key for choice_id in selected):
+        raise InvalidSubmission('Invalid Input!')
+
+    try:
+        with transaction.atomic():
+            attempt = QuizUser.objects.create(quiz=quiz, user=user)
+            Answer.objects.bulk_create([
+                Answer(attempt_id=attempt.id, question_id=key.points[choice_id][0], choice_id=choice_id)
+                for choice_id in sorted(selected)])
+            patterns.attempt_added(attempt.id, [(key.points[choice_id][0], choice_id) for choice_id in selected])
+            Draft.objects.filter(user_id=user.id, quiz_id=quiz.id).delete()
+            if grading.ASYNC:
+                grading.enqueue(user.id, quiz.id)
+                result = None
+            else:
+                result = key.grade(selected)
+                scoring.save_result(user.id, quiz.id, result)
+    except IntegrityError:
+        if not QuizUser.objects.filter(quiz_id=quiz.id, user_id=user.id).exists():
+            raise
+        raise InvalidSubmission('You have taken this quiz before!!!')
+    caching.forget_taken_quizzes(user.id)
+    return result
@@ -0,0 +1,60 @@
+      // Send the boxes checked and unchecked since the last autosave every
+      // {{autosave_interval}} seconds; a box changed twice is sent once.
+      var autosaveUrl = "/{{quiz.id}}/autosave/";
+      var pending = {};
+
+      function autosaveRequest(method, body, done) {
+        var request = new XMLHttpRequest();
+        request.open(method, autosaveUrl);
+        request.setRequestHeader("Content-Type", "application/json");
+        request.setRequestHeader("X-CSRFToken", document.getElementsByName("csrfmiddlewaretoken")[0].value);
+        request.onload = function () { done(request.status, request.responseText); };
+        request.onerror = function () { done(0, ""); };
+        request.send(body);
+      }
+
+      function autosave() {
+        var change = {add: [], remove: []};
+        for (var id in pending) {
+          (pending[id] ? change.add : change.remove).push(parseInt(id, 10));
+        }
+        if (!change.add.length && !change.remove.length) {
+          return;
+        }
+        var sent = pending;
+        pending = {};
+        autosaveRequest("POST", JSON.stringify(change), function (status) {
+          if (status == 0 || status >= 500) {
+            // Keep the change for the next autosave unless the box was changed again.
+            for (var id in sent) {
+              if (!(id in pending)) {
+                pending[id] = sent[id];
+              }
+            }
+          }
+        });
+      }
+
+      window.addEventListener("load", function () {
+        var form = document.getElementById("quizForm");
+        form.addEventListener("change", function (event) {
+          if (event.target.name == "userchoice") {
+            pending[event.target.value] = event.target.checked;
+          }
+        });
+        form.addEventListener("submit", function () { pending = {}; });
+        {% if restore %}
+        autosaveRequest("GET", null, function (status, text) {
+          if (status == 200) {
+            var saved = JSON.parse(text).choices;
+            var boxes = document.getElementsByName("userchoice");
+            for (var i = 0; i < boxes.length; i++) {
+              if (!(boxes[i].value in pending) && saved.indexOf(parseInt(boxes[i].value, 10)) >= 0) {
+                boxes[i].checked = true;
+              }
+            }
+          }
+        });
+        {% endif %}
+        setInterval(autosave, {{autosave_interval}} * 1000);
+      });
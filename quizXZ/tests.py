@@ -1,11 +1,62 @@
 """tests.py for the quiz system."""
+import csv
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
-
-from models import Quiz, Question, Choice, QuizUser
+from django.db import IntegrityError, connection, reset_queries
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, TestCase, override_settings
+from unittest import skipUnless
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from models import Quiz, Question, Choice, QuizUser, Answer, AnswerPattern, QuizResult, GradingJob, Draft
 from django.contrib.auth.models import User
 
 from forms import LoginForm, SignupForm, QuizForm, QuestionForm, ChoiceForm
+import analytics
+import answerkey
+import bank
+import benchmark
+import caching
+import checks
+import counters
+import drafts
+from generator import Generator
+import gradebook
+import grading
+import middleware
+from middleware import QueryStatsMiddleware, MAX_REPEATS, view_stats
+import patterns
+import purge
+import regrade
+import reports
+import scoring
+import signals
+import submission
+import views
+
+private_cache = override_settings(CACHES=caching.PRIVATE_CACHES)
+
+
+def setUpModule():
+    """Give the tests their own cache so that clearing it leaves the site's cache alone, and quiet the logs."""
+    private_cache.enable()
+    logging.disable(logging.WARNING)
+
+
+def tearDownModule():
+    """Go back to the site's cache and logs."""
+    private_cache.disable()
+    logging.disable(logging.NOTSET)
 
 
 class QuizModelTests(TestCase):
@@ -202,6 +253,21 @@ class QuestionViewTests(TestCase):
         self.assertEqual(resp.context['quizID'], self.quiz.id)
         self.assertIn(self.question, resp.context['lists'])
 
+    def test_question_list_scoped(self):
+        """Testing that only the questions of the current quiz are listed, a page at a time."""
+        other_quiz = Quiz.objects.create(name="Algorithms", subject="CS340")
+        other_question = Question.objects.create(text="What is a heap?", quiz=other_quiz)
+        for i in range(views.PAGE_SIZE):
+            Question.objects.create(text="Question %02d" % i, quiz=self.quiz)
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(
+            reverse('question_list', kwargs={'quiz_id': self.quiz.id}))
+        self.assertNotIn(other_question, resp.context['lists'])
+        self.assertEqual(views.PAGE_SIZE, len(resp.context['lists']))
+        resp = self.client.get(
+            reverse('question_list', kwargs={'quiz_id': self.quiz.id}), {'page': 2})
+        self.assertEqual([self.question], list(resp.context['lists']))
+
     def test_add_question(self):
         """Testing whether superuser can successfully add questions to the database."""
         self.client.login(username='dxu', password='yilun')
@@ -324,6 +390,18 @@ class ChoiceViewTests(TestCase):
         self.assertEqual(resp.context['questionID'], self.question.id)
         self.assertIn(self.choice, resp.context['lists'])
 
+    def test_choice_list_scoped(self):
+        """Testing that only the choices of the current question are listed."""
+        other_question = Question.objects.create(text="What is SQL?", quiz=self.quiz)
+        other_choice = Choice.objects.create(text="A query language", question=other_question, point=2)
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(
+            reverse('choice_list', kwargs={'quiz_id': self.quiz.id, 'question_id': self.question.id}))
+        self.assertEqual([self.choice], list(resp.context['lists']))
+        resp = self.client.get(
+            reverse('create_choice', kwargs={'quiz_id': self.quiz.id, 'question_id': other_question.id}))
+        self.assertEqual([other_choice], list(resp.context['lists']))
+
     def test_add_choice(self):
         """Testing whether superuser can successfully add choices to the database."""
         self.client.login(username='dxu', password='yilun')
@@ -458,6 +536,7 @@ class QuizSystemViewTests(TestCase):
 
     def setUp(self):
         """Set up for testing the quiz taking methods in view."""
+        cache.clear()
         self.user = User.objects.create_user(
             'dxu', 'dxu@cs.brynmawr.edu', 'yilun')
         self.user2 = User.objects.create_user(
@@ -524,6 +603,22 @@ class QuizSystemViewTests(TestCase):
         self.assertEqual(resp.context['title'], 'Quizzes')
         self.assertEqual(resp.context['quiz'], self.quiz)
 
+    def test_questions_query_count(self):
+        """Test that rendering the questions takes the same number of queries however many questions there are."""
+        self.client.login(username='dxu', password='yilun')
+        cache.clear()
+        caching.taken_quiz_ids(self.user.id)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('questions', kwargs={'quiz_id': self.quiz.id}))
+        for i in range(10):
+            question = Question.objects.create(text="Question %d" % i, quiz=self.quiz)
+            for j in range(4):
+                Choice.objects.create(text="Choice %d" % j, question=question, point=j % 3)
+        with CaptureQueriesContext(connection) as many:
+            resp = self.client.get(reverse('questions', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual(len(few), len(many))
+        self.assertContains(resp, "Question 9")
+
     def test_questions_taken(self):
         """Test whether the invalidAttempt page is shown for the current user if the quiz has already been taken before."""
         self.client.login(username='dxu', password='yilun')
@@ -543,7 +638,7 @@ class QuizSystemViewTests(TestCase):
             'quiz_id': self.quiz.id}), {'userchoice': (self.choice2.id, self.choice3.id)}, follow=True)
         self.assertEqual(resp.status_code, 200)
         self.assertTemplateUsed(resp, 'report.html')
-        userchoi_exist = Choice.objects.filter(users=self.user.id).exists()
+        userchoi_exist = Answer.objects.filter(attempt__user=self.user.id).exists()
         self.assertTrue(userchoi_exist)
 
     def test_questions_taken(self):
@@ -558,6 +653,21 @@ class QuizSystemViewTests(TestCase):
         self.assertEqual(
             resp.context['message'], 'You have taken this quiz before!!!')
 
+    def test_save_userchoice_integrity_error(self):
+        """Test that a database error other than a second attempt is not reported as one."""
+        self.client.login(username='dxu', password='yilun')
+        save_result = scoring.save_result
+
+        def fail(user_id, quiz_id, result=None):
+            raise IntegrityError('NOT NULL constraint failed')
+        scoring.save_result = fail
+        try:
+            self.assertRaises(IntegrityError, self.client.post, reverse('save_userchoice', kwargs={
+                'quiz_id': self.quiz.id}), {'userchoice': (self.choice2.id, self.choice3.id)})
+        finally:
+            scoring.save_result = save_result
+        self.assertFalse(QuizUser.objects.filter(user=self.user).exists())
+
     def test_report_half(self):
         """Test that the scores calculation is partially correct and the correct informations are being passed to the template."""
         self.client.login(username='dxu', password='yilun')
@@ -626,6 +736,83 @@ class QuizSystemViewTests(TestCase):
         self.assertEqual(
             zip([self.quiz.name], [self.user2.username], [0.5], [1]), resp.context['reports'])
 
+    def test_save_userchoice_result(self):
+        """Test that submitting a quiz stores its result along with the attempt."""
+        self.client.login(username='dxu', password='yilun')
+        self.client.post(reverse('save_userchoice', kwargs={
+            'quiz_id': self.quiz.id}), {'userchoice': (self.choice2.id, self.choice3.id)})
+        result = QuizResult.objects.get(user=self.user, quiz=self.quiz)
+        self.assertEqual(result.score, 0.5)
+        self.assertEqual(result.total, 1)
+
+    def test_taken_quiz_ids(self):
+        """Test that the cached taken quiz ids follow submissions and deleted attempts."""
+        self.client.login(username='dxu', password='yilun')
+        self.assertEqual(frozenset(), caching.taken_quiz_ids(self.user.id))
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('quizzes'))
+        self.assertEqual([self.quiz], list(resp.context['quizzes']))
+        self.assertFalse(any('quizXZ_quizuser' in query['sql'] for query in queries))
+        self.client.post(reverse('save_userchoice', kwargs={
+            'quiz_id': self.quiz.id}), {'userchoice': self.choice3.id})
+        self.assertIsNone(cache.get(caching.taken_key(self.user.id)))
+        self.assertEqual(frozenset([self.quiz.id]), caching.taken_quiz_ids(self.user.id))
+        resp = self.client.get(reverse('quizzes'))
+        self.assertEqual([], list(resp.context['quizzes']))
+        QuizUser.objects.filter(user=self.user).delete()
+        self.assertEqual(frozenset(), caching.taken_quiz_ids(self.user.id))
+        QuizUser.objects.create(user=self.user, quiz=self.quiz)
+        self.assertEqual(frozenset([self.quiz.id]), caching.taken_quiz_ids(self.user.id))
+
+    def test_save_userchoice_other_quiz(self):
+        """Test that choices from another quiz are rejected and nothing is saved."""
+        other_quiz = Quiz.objects.create(name="Algorithms", subject="CS340")
+        other_question = Question.objects.create(text="What is a heap?", quiz=other_quiz)
+        other_choice = Choice.objects.create(text="A tree", question=other_question, point=2)
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.post(reverse('save_userchoice', kwargs={
+            'quiz_id': self.quiz.id}), {'userchoice': (self.choice3.id, other_choice.id)})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTemplateUsed(resp, 'invalidAttempt.html')
+        self.assertEqual(resp.context['message'], 'Invalid Input!')
+        self.assertFalse(QuizUser.objects.filter(user=self.user).exists())
+        self.assertFalse(Answer.objects.filter(attempt__user=self.user.id).exists())
+
+    def test_save_userchoice_query_count(self):
+        """Test that the number of queries for a submission does not depend on the number of answers."""
+        choices = [Choice.objects.create(text="Choice %d" % i, question=self.question, point=2)
+                   for i in range(10)]
+        answerkey.get(self.quiz.id)
+        self.client.login(username='dxu', password='yilun')
+        with CaptureQueriesContext(connection) as one:
+            self.client.post(reverse('save_userchoice', kwargs={
+                'quiz_id': self.quiz.id}), {'userchoice': choices[0].id})
+        self.client.login(username='xzhang', password='lexie')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(reverse('save_userchoice', kwargs={
+                'quiz_id': self.quiz.id}), {'userchoice': [choice.id for choice in choices]})
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(10, Answer.objects.filter(attempt__user=self.user3.id).count())
+
+    def test_explain_views(self):
+        """Test that explain_views prints a query plan for every view without saving anything."""
+        self.user2.save()
+        QuizUser.objects.create(user=self.user2, quiz=self.quiz)
+        fresh = Quiz.objects.create(name="Algorithms", subject="CS340")
+        Choice.objects.create(text="Quicksort", question=Question.objects.create(
+            text="Which sort?", quiz=fresh), point=2)
+        self.assertEqual(frozenset([self.quiz.id]), caching.taken_quiz_ids(self.user2.id))
+        out = StringIO()
+        call_command('explain_views', stdout=out)
+        for name in ('quizzes', 'questions', 'save_userchoice', 'take_quiz', 'autosave', 'users_report',
+                     'quiz_analytics', 'edit_question', 'choice_list'):
+            self.assertIn("== %s " % name, out.getvalue())
+        self.assertNotIn("== save_userchoice (0 queries)", out.getvalue())
+        self.assertIn("full table scans.", out.getvalue())
+        self.assertEqual(1, QuizUser.objects.filter(user=self.user2).count())
+        self.assertFalse(Draft.objects.exists())
+        self.assertEqual(frozenset([self.quiz.id]), caching.taken_quiz_ids(self.user2.id))
+
     def test_users_report_invalid(self):
         """Test that non-superusers cannot access the usersreport page and invalidAttempt is displayed."""
         self.client.login(username='dxu', password='yilun')
@@ -634,3 +821,1289 @@ class QuizSystemViewTests(TestCase):
         resp = self.client.get(reverse('users_report'))
         self.assertEqual(resp.status_code, 200)
         self.assertTemplateUsed(resp, 'invalidAttempt.html')
+
+
+def reference_score(user_id, quiz_id):
+    """The original per-question scoring loop, kept as the reference for the scoring engine."""
+    choices = Choice.objects.filter(answer__attempt__user_id=user_id)
+    point = 0
+    total = 0
+    quiz = Quiz.objects.get(id=quiz_id)
+    for question in quiz.question_set.all():
+        question_point = 0
+        question_total = 0
+        numCorrect = 0
+        numPartial = 0
+        numWrong = 0
+        selections = choices.filter(question=question.id)
+        for selection in selections:
+            if selection.point == 0:
+                numWrong = numWrong + 1
+            elif selection.point == 1:
+                numPartial = numPartial + 1
+            elif selection.point == 2:
+                numCorrect = numCorrect + 1
+        for choice in question.choice_set.all():
+            if choice.point == 2:
+                question_total = question_total + 1
+
+        if numWrong > 0:
+            question_point = 0
+        else:
+            question_point = numCorrect
+            if numPartial > 0:
+                for i in range(0, numPartial):
+                    question_point = question_point * 0.5
+        point = point + question_point
+        total = total + question_total
+    return {'score': point, 'total': total}
+
+
+class ScoringTests(TestCase):
+    """Tests for the set-based scoring engine."""
+
+    def setUp(self):
+        """Set up randomized quizzes and users who answered them."""
+        rng = random.Random(306)
+        self.users = [User.objects.create_user(
+            'student%d' % i, 'student%d@cs.brynmawr.edu' % i, 'secret') for i in range(5)]
+        self.quizzes = []
+        for i in range(4):
+            quiz = Quiz.objects.create(name="Quiz %d" % i, subject="CS306")
+            self.quizzes.append(quiz)
+            attempts = [QuizUser.objects.create(user=user, quiz=quiz) for user in self.users]
+            for j in range(rng.randint(0, 6)):
+                question = Question.objects.create(
+                    text="Question %d" % j, quiz=quiz)
+                for k in range(rng.randint(0, 5)):
+                    choice = Choice.objects.create(
+                        text="Choice %d" % k, question=question, point=rng.choice((0, 1, 2)))
+                    for attempt in attempts:
+                        if rng.random() < 0.4:
+                            Answer.objects.create(attempt=attempt, question=question, choice=choice)
+
+    def test_score_matches_reference(self):
+        """Test that the scoring engine agrees with the per-question loop on every user and quiz."""
+        for user in self.users:
+            for quiz in self.quizzes:
+                expected = reference_score(user.id, quiz.id)
+                result = scoring.score(user.id, quiz.id)
+                self.assertEqual(expected, result)
+                self.assertEqual(type(expected['score']), type(result['score']))
+
+    def test_score_query_count(self):
+        """Test that scoring takes a fixed number of queries whatever the quiz size."""
+        for quiz in self.quizzes:
+            answerkey.invalidate(quiz.id)
+            with self.assertNumQueries(2):
+                scoring.score(self.users[0].id, quiz.id)
+            with self.assertNumQueries(1):
+                scoring.score(self.users[0].id, quiz.id)
+
+    def test_answer_key_invalidated(self):
+        """Test that changing a choice's point rebuilds the quiz's answer key."""
+        quiz = self.quizzes[0]
+        question = Question.objects.create(text="What is Django?", quiz=quiz)
+        choice = Choice.objects.create(text="A web framework", question=question, point=0)
+        key = answerkey.get(quiz.id)
+        self.assertEqual((question.id, 0), key.points[choice.id])
+        self.assertRaises(AttributeError, setattr, key, 'total', 0)
+        choice.point = 2
+        choice.save()
+        key = answerkey.get(quiz.id)
+        self.assertEqual((question.id, 2), key.points[choice.id])
+        self.assertEqual(1, key.correct[question.id])
+        self.assertEqual(reference_score(self.users[0].id, quiz.id), scoring.score(self.users[0].id, quiz.id))
+
+    def test_answer_key_changed_elsewhere(self):
+        """Test that a key is rebuilt when another process moves the quiz to a new version."""
+        quiz = self.quizzes[0]
+        question = Question.objects.create(text="What is Django?", quiz=quiz)
+        choice = Choice.objects.create(text="A web framework", question=question, point=0)
+        self.assertEqual((question.id, 0), answerkey.get(quiz.id).points[choice.id])
+        # Another process updates the choice and bumps the shared version;
+        # this process's cached key is not invalidated directly.
+        Choice.objects.filter(id=choice.id).update(point=2)
+        caching.bump_quiz_version(quiz.id)
+        self.assertEqual((question.id, 2), answerkey.get(quiz.id).points[choice.id])
+
+    def test_score_many_matches_score(self):
+        """Test that batch scoring agrees with scoring each pair on its own."""
+        pairs = [(user.id, quiz.id) for user in self.users for quiz in self.quizzes]
+        results = scoring.score_many(pairs)
+        self.assertEqual(len(pairs), len(results))
+        for user_id, quiz_id in pairs:
+            self.assertEqual(scoring.score(user_id, quiz_id), results[(user_id, quiz_id)])
+
+    def test_users_report_query_count(self):
+        """Test that users_report takes the same number of queries however many attempts it shows."""
+        admin = User.objects.create_superuser(
+            'padler', 'padler@cs.brynmawr.edu', 'phillips')
+        self.client.login(username='padler', password='phillips')
+        scoring.save_result(self.users[0].id, self.quizzes[0].id)
+        with self.assertNumQueries(4):
+            resp = self.client.get(reverse('users_report'), {'size': 1})
+        self.assertEqual(1, len(resp.context['reports']))
+        for user in self.users:
+            for quiz in self.quizzes:
+                scoring.save_result(user.id, quiz.id)
+        with self.assertNumQueries(4):
+            resp = self.client.get(reverse('users_report'))
+        self.assertEqual(len(self.users) * len(self.quizzes), len(resp.context['reports']))
+
+    def test_backfill_results(self):
+        """Test that backfill_results stores live scores for attempts without a result."""
+        out = StringIO()
+        call_command('backfill_results', check=True, stdout=out)
+        self.assertEqual(len(self.users) * len(self.quizzes), QuizResult.objects.count())
+        self.assertIn("0 mismatches", out.getvalue())
+        for result in QuizResult.objects.all():
+            self.assertEqual(scoring.score(result.user_id, result.quiz_id)['score'], result.score)
+
+
+class QuestionCacheTests(TestCase):
+    """Tests for the cached question block of the quiz page."""
+
+    def setUp(self):
+        """Set up a quiz with one question and a superuser who edits it."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            'dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        self.user.is_superuser = True
+        self.user.save()
+        self.quiz = Quiz.objects.create(name="Database", subject="CS306")
+        self.question = Question.objects.create(text="What is Django?", quiz=self.quiz)
+        self.choice = Choice.objects.create(
+            text="A great python framework", question=self.question, point=2)
+        self.client.login(username='dxu', password='yilun')
+
+    def get_questions(self):
+        """Fetch the quiz page and return the response and the number of queries it took."""
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('questions', kwargs={'quiz_id': self.quiz.id}))
+        return resp, len(queries)
+
+    def test_cached_block(self):
+        """Test that the second visit reads the question block and the taken quiz ids from the cache."""
+        resp, first = self.get_questions()
+        self.assertContains(resp, "A great python framework")
+        resp, second = self.get_questions()
+        self.assertContains(resp, "A great python framework")
+        self.assertEqual(first - 3, second)
+
+    def test_choice_saved(self):
+        """Test that adding or editing a choice invalidates the cached block."""
+        self.get_questions()
+        Choice.objects.create(text="A programming language", question=self.question, point=0)
+        self.choice.text = "A web framework"
+        self.choice.save()
+        resp, queries = self.get_questions()
+        self.assertContains(resp, "A programming language")
+        self.assertContains(resp, "A web framework")
+        self.assertNotContains(resp, "A great python framework")
+
+    def test_delete_question(self):
+        """Test that deleting a question through the view invalidates the cached block."""
+        self.get_questions()
+        self.client.post(reverse('delete_question', kwargs={'quiz_id': self.quiz.id}),
+                         {'delete': self.question.id})
+        resp, queries = self.get_questions()
+        self.assertNotContains(resp, "What is Django?")
+
+    def test_content_changes(self):
+        """Test that a quiz changed inside a content_changes block moves to another version after it."""
+        with signals.content_changes():
+            with signals.content_changes():
+                Choice.objects.create(text="A programming language", question=self.question, point=0)
+            inside = caching.quiz_version(self.quiz.id)
+            self.assertEqual(inside, caching.quiz_version(self.quiz.id))
+        self.assertNotEqual(inside, caching.quiz_version(self.quiz.id))
+
+    def test_admin_bumps_after_commit(self):
+        """Test that saving a question in the admin invalidates its quiz once more after the admin's transaction."""
+        self.user.is_staff = True
+        self.user.save()
+        depths = []
+        bump = caching.bump_quiz_version
+
+        def bump_quiz_version(quiz_id):
+            """Note how deep in transactions the version is bumped."""
+            depths.append(len(connection.savepoint_ids))
+            bump(quiz_id)
+        base = len(connection.savepoint_ids)
+        caching.bump_quiz_version = bump_quiz_version
+        try:
+            resp = self.client.post(reverse('admin:quizXZ_question_change', args=(self.question.id,)), {
+                'text': "What is Django?", 'quiz': self.quiz.id,
+                'choice_set-TOTAL_FORMS': 1, 'choice_set-INITIAL_FORMS': 1,
+                'choice_set-MIN_NUM_FORMS': 0, 'choice_set-MAX_NUM_FORMS': 1000,
+                'choice_set-0-id': self.choice.id, 'choice_set-0-question': self.question.id,
+                'choice_set-0-text': "A web framework", 'choice_set-0-point': 2})
+        finally:
+            caching.bump_quiz_version = bump
+        self.assertEqual(302, resp.status_code)
+        self.assertEqual("A web framework", Choice.objects.get(id=self.choice.id).text)
+        self.assertGreater(depths[0], base)
+        self.assertEqual(base, depths[-1])
+
+    def test_file_based_cache(self):
+        """Test that the question block is cached and invalidated with the file-based backend."""
+        location = tempfile.mkdtemp()
+        try:
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': location}}):
+                resp, first = self.get_questions()
+                resp, second = self.get_questions()
+                self.assertEqual(first - 3, second)
+                Question.objects.create(text="What is SQL?", quiz=self.quiz)
+                resp, third = self.get_questions()
+                self.assertContains(resp, "What is SQL?")
+        finally:
+            shutil.rmtree(location)
+
+    def test_shared_cache_check(self):
+        """Test that a per-process default cache is reported by the system checks."""
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': tempfile.gettempdir()}}):
+            self.assertEqual([], checks.shared_cache_check(None))
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual(['quizXZ.W001'], [message.id for message in checks.shared_cache_check(None)])
+
+
+class UsersReportTests(TestCase):
+    """Tests for the paginated, filtered and exported users report."""
+
+    def setUp(self):
+        """Set up attempts of three users on two quizzes of different subjects."""
+        self.admin = User.objects.create_superuser(
+            'padler', 'padler@cs.brynmawr.edu', 'phillips')
+        self.quiz = Quiz.objects.create(name="Database", subject="CS306", difficulty=1)
+        self.quiz2 = Quiz.objects.create(name="Algorithms", subject="CS340", difficulty=2)
+        question = Question.objects.create(text="What is Django?", quiz=self.quiz)
+        choice = Choice.objects.create(text="A web framework", question=question, point=2)
+        self.users = [User.objects.create_user(
+            name, '%s@cs.brynmawr.edu' % name, 'secret') for name in ('dxu', 'tluan', 'xzhang')]
+        for user in self.users:
+            for quiz in (self.quiz, self.quiz2):
+                attempt = QuizUser.objects.create(user=user, quiz=quiz)
+                if quiz == self.quiz:
+                    Answer.objects.create(attempt=attempt, question=question, choice=choice)
+                scoring.save_result(user.id, quiz.id)
+        self.client.login(username='padler', password='phillips')
+
+    def test_keyset_pages(self):
+        """Test that following the next-page cursor visits every attempt once, in report order."""
+        seen = []
+        params = {'size': 4}
+        while True:
+            resp = self.client.get(reverse('users_report'), params)
+            self.assertLessEqual(len(resp.context['reports']), 4)
+            seen.extend(resp.context['reports'])
+            if not resp.context['next_query']:
+                break
+            params = QueryDict(resp.context['next_query'])
+        expected = [(quiz.name, user.username, 1 if quiz == self.quiz else 0, 1 if quiz == self.quiz else 0)
+                    for quiz in (self.quiz, self.quiz2) for user in self.users]
+        self.assertEqual(expected, seen)
+
+    def test_filters(self):
+        """Test that the report can be filtered by subject and difficulty."""
+        resp = self.client.get(reverse('users_report'), {'subject': 'CS306'})
+        self.assertEqual(set(["Database"]), set(row[0] for row in resp.context['reports']))
+        resp = self.client.get(reverse('users_report'), {'difficulty': 2})
+        self.assertEqual(set(["Algorithms"]), set(row[0] for row in resp.context['reports']))
+
+    def test_csv_export(self):
+        """Test that the CSV export streams every attempt matching the filters."""
+        old_size = reports.EXPORT_CHUNK_SIZE
+        reports.EXPORT_CHUNK_SIZE = 2
+        try:
+            resp = self.client.get(reverse('users_report'), {'format': 'csv', 'quiz': self.quiz.id})
+            lines = ''.join(resp.streaming_content).splitlines()
+        finally:
+            reports.EXPORT_CHUNK_SIZE = old_size
+        self.assertEqual('text/csv', resp['Content-Type'])
+        self.assertEqual('Quiz Name,User Name,Score,Total', lines[0])
+        self.assertEqual(['Database,%s,1,1' % user.username for user in self.users], lines[1:])
+
+
+class BenchmarkTests(TestCase):
+    """Tests for the benchmark suite."""
+
+    def test_run(self):
+        """Test that a small benchmark run measures every endpoint and compares against itself."""
+        results = benchmark.run({'quizzes': 3, 'questions': 2, 'choices': 3, 'users': 4, 'attempts': 2}, repeat=2)
+        for name in ('quizzes', 'questions', 'save_userchoice', 'report', 'my_report', 'users_report'):
+            self.assertIn(name, results['endpoints'])
+            self.assertGreater(results['endpoints'][name]['queries'], 0)
+            self.assertGreaterEqual(results['endpoints'][name]['memory_kb'], 0)
+        self.assertEqual([], benchmark.compare(results, results))
+        self.assertFalse(QuizUser.objects.filter(quiz=Quiz.objects.order_by('-id').first()).exists())
+
+    def test_private_cache(self):
+        """Test that a run leaves the configured cache alone."""
+        location = tempfile.mkdtemp()
+        try:
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': location}}):
+                benchmark.run({'quizzes': 2, 'questions': 2, 'choices': 2, 'users': 2, 'attempts': 1}, repeat=1)
+            self.assertEqual([], os.listdir(location))
+        finally:
+            shutil.rmtree(location)
+
+    def test_compare(self):
+        """Test that more queries, much slower responses or much more memory than the baseline are reported."""
+        baseline = {'endpoints': {'quizzes': {'p50_ms': 10, 'p95_ms': 20, 'queries': 3, 'memory_kb': 4000}}}
+        current = {'endpoints': {'quizzes': {'p50_ms': 10, 'p95_ms': 100, 'queries': 4, 'memory_kb': 9000}}}
+        self.assertEqual(3, len(benchmark.compare(current, baseline)))
+        current['endpoints']['quizzes']['memory_kb'] = 5000
+        self.assertEqual(2, len(benchmark.compare(current, baseline)))
+
+
+class GeneratorTests(TestCase):
+    """Tests for the synthetic data generator."""
+
+    def test_generate_data(self):
+        """Test that generate_data writes consistent quizzes, attempts and results."""
+        out = StringIO()
+        call_command('generate_data', quizzes=7, questions='2-4', choices='2-3', users=6,
+                     attempts='1-3', batch_size=5, seed=4, stdout=out)
+        self.assertIn("Created 7 quizzes", out.getvalue())
+        self.assertEqual(6, User.objects.filter(username__startswith='student').count())
+        for quiz in Quiz.objects.all():
+            self.assertIn(quiz.difficulty, [level for level, name in Quiz.diffLevels])
+            for question in quiz.question_set.all():
+                self.assertTrue(question.choice_set.filter(point=2).exists())
+        self.assertEqual(QuizUser.objects.count(), QuizResult.objects.count())
+        self.assertGreater(QuizUser.objects.count(), 0)
+        for result in QuizResult.objects.all():
+            self.assertEqual(reference_score(result.user_id, result.quiz_id),
+                             {'score': result.score, 'total': result.total})
+
+    def test_generate_data_again(self):
+        """Test that a second run numbers its students after the existing ones."""
+        User.objects.create_user('student3x', 'x@cs.brynmawr.edu', 'yilun')
+        for i in range(2):
+            call_command('generate_data', quizzes=1, questions='1', choices='2', users=4,
+                         attempts='1', seed=i, stdout=StringIO())
+        self.assertEqual(['student%d' % i for i in range(8)], sorted(
+            User.objects.filter(username__regex=r'^student[0-9]+$').values_list('username', flat=True),
+            key=lambda username: int(username[len('student'):])))
+
+    def test_taken_quiz_ids(self):
+        """Test that generated attempts of an existing user show up in their cached taken quiz ids."""
+        user = User.objects.create_user('dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        self.assertEqual(frozenset(), caching.taken_quiz_ids(user.id))
+        Generator(seed=2).quizzes(1, questions=(1, 1), choices=(2, 2), user_ids=[user.id], attempts=(1, 1))
+        self.assertEqual(frozenset(Quiz.objects.values_list('id', flat=True)), caching.taken_quiz_ids(user.id))
+
+    def test_seed_is_deterministic(self):
+        """Test that the same seed generates the same data."""
+        first = Generator(seed=9, batch_size=3)
+        first.quizzes(4, questions=(1, 3), choices=(2, 4))
+        points = list(Choice.objects.order_by('id').values_list('question__quiz__name', 'point'))
+        Quiz.objects.all().delete()
+        second = Generator(seed=9, batch_size=3)
+        second.quizzes(4, questions=(1, 3), choices=(2, 4))
+        self.assertEqual(points, list(Choice.objects.order_by('id').values_list('question__quiz__name', 'point')))
+
+
+class QueryStatsTests(TestCase):
+    """Tests for the request timing and query count middleware."""
+
+    def setUp(self):
+        """Set up a superuser and a student, and measure every request."""
+        view_stats.clear()
+        self.sample_rate = middleware.SAMPLE_RATE
+        middleware.SAMPLE_RATE = 1.0
+        self.admin = User.objects.create_superuser(
+            'padler', 'padler@cs.brynmawr.edu', 'phillips')
+        self.user = User.objects.create_user(
+            'dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+
+    def test_server_timing(self):
+        """Test that responses carry a Server-Timing header with the query count."""
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(reverse('quizzes'))
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertIn('queries', resp['Server-Timing'])
+        summary = dict((row['view'], row) for row in view_stats.summary())
+        self.assertEqual(1, summary['quizXZ.views.quizzes']['requests'])
+        self.assertGreater(summary['quizXZ.views.quizzes']['queries'], 0)
+
+    def test_shared_totals(self):
+        """Test that the totals are kept in the cache, where every worker process adds to the same ones."""
+        self.client.login(username='dxu', password='yilun')
+        self.client.get(reverse('quizzes'))
+        other = middleware.ViewStats()
+        other.add({'view': 'quizXZ.views.quizzes', 'flagged': True, 'total_ms': 5.5,
+                   'db_ms': 1.25, 'queries': 40, 'duplicates': 2})
+        summary = dict((row['view'], row) for row in view_stats.summary())
+        self.assertEqual(2, summary['quizXZ.views.quizzes']['requests'])
+        self.assertEqual(1, summary['quizXZ.views.quizzes']['flagged'])
+        self.assertEqual(40, summary['quizXZ.views.quizzes']['max_queries'])
+        self.assertGreater(summary['quizXZ.views.quizzes']['total_ms'], 5.5)
+        view_stats.clear()
+        self.assertEqual([], other.summary())
+
+    def tearDown(self):
+        """Restore the sample rate."""
+        middleware.SAMPLE_RATE = self.sample_rate
+
+    def test_log(self):
+        """Test that every measured request is logged as a JSON line on a configured logger."""
+        self.assertTrue(logging.getLogger('quizXZ.querystats').handlers)
+        records = []
+
+        class Logger(object):
+            """Keep the logged records."""
+
+            def info(self, message):
+                """Keep an INFO record."""
+                records.append(('info', json.loads(message)))
+
+            def warning(self, message):
+                """Keep a WARNING record."""
+                records.append(('warning', json.loads(message)))
+        logger = middleware.logger
+        middleware.logger = Logger()
+        try:
+            self.client.login(username='dxu', password='yilun')
+            self.client.get(reverse('quizzes'))
+        finally:
+            middleware.logger = logger
+        self.assertEqual(['info'], [level for level, record in records])
+        self.assertEqual('quizXZ.views.quizzes', records[0][1]['view'])
+        self.assertGreater(records[0][1]['queries'], 0)
+
+    def test_sample_rate(self):
+        """Test that requests outside the sample are not measured."""
+        middleware.SAMPLE_RATE = 0.0
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(reverse('quizzes'))
+        self.assertFalse(resp.has_header('Server-Timing'))
+        self.assertEqual([], view_stats.summary())
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_flag_repeated_queries(self):
+        """Test that a view repeating one query shape many times is flagged."""
+        middleware = QueryStatsMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        middleware.process_view(request, views.quizzes, (), {})
+        for i in range(MAX_REPEATS + 1):
+            Quiz.objects.filter(id=i).exists()
+        middleware.process_response(request, HttpResponse())
+        self.assertEqual(1, view_stats.summary()[0]['flagged'])
+
+    def test_query_stats_page(self):
+        """Test that only superusers can see the per-view summary."""
+        request = RequestFactory().get('/')
+        request.user = self.user
+        resp = views.query_stats(request)
+        self.assertIn('You are not a super user!', resp.content)
+        request.user = self.admin
+        view_stats.add({'view': 'quizXZ.views.quizzes', 'flagged': False, 'total_ms': 5.0,
+                        'db_ms': 1.0, 'queries': 3, 'duplicates': 0})
+        resp = views.query_stats(request)
+        self.assertIn('quizXZ.views.quizzes', resp.content)
+
+
+class GradingQueueTests(TestCase):
+    """Tests for grading submissions through the GradingJob queue."""
+
+    def setUp(self):
+        """Set up a quiz and switch submissions to queued grading."""
+        cache.clear()
+        self.was_async = grading.ASYNC
+        grading.ASYNC = True
+        self.user = User.objects.create_user(
+            'dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        self.quiz = Quiz.objects.create(name="Database", subject="CS306", difficulty=1)
+        self.question = Question.objects.create(text="What is Django?", quiz=self.quiz)
+        self.choice = Choice.objects.create(text="A python framework", question=self.question, point=2)
+        self.choice2 = Choice.objects.create(text="A web framework", question=self.question, point=1)
+
+    def tearDown(self):
+        """Restore the grading mode."""
+        grading.ASYNC = self.was_async
+
+    def submit(self):
+        """Submit the quiz as dxu and return the response."""
+        self.client.login(username='dxu', password='yilun')
+        return self.client.post(reverse('save_userchoice', kwargs={
+            'quiz_id': self.quiz.id}), {'userchoice': (self.choice.id, self.choice2.id)})
+
+    def test_submit_queues_job(self):
+        """Test that a submission stores the answers and a pending job but no result."""
+        self.submit()
+        self.assertTrue(QuizUser.objects.filter(user=self.user, quiz=self.quiz).exists())
+        self.assertEqual(2, Answer.objects.filter(attempt__user=self.user).count())
+        self.assertEqual(GradingJob.PENDING, GradingJob.objects.get(user=self.user, quiz=self.quiz).status)
+        self.assertFalse(QuizResult.objects.exists())
+
+    def test_worker_grades_job(self):
+        """Test that the worker stores the result and claimed jobs are not claimed again."""
+        self.submit()
+        self.assertEqual((1, 0), grading.work())
+        self.assertEqual((0, 0), grading.work())
+        job = GradingJob.objects.get(user=self.user, quiz=self.quiz)
+        self.assertEqual(GradingJob.DONE, job.status)
+        result = QuizResult.objects.get(user=self.user, quiz=self.quiz)
+        self.assertEqual((0.5, 1), (result.score, result.total))
+        self.assertEqual([], grading.claim('other'))
+
+    def test_report_grades_pending_job(self):
+        """Test that the report page grades a job the workers have not reached."""
+        resp = self.submit()
+        resp = self.client.get(resp['Location'])
+        self.assertEqual(resp.context['score'], 0.5)
+        self.assertEqual(GradingJob.DONE, GradingJob.objects.get(user=self.user, quiz=self.quiz).status)
+        self.assertTrue(QuizResult.objects.filter(user=self.user, quiz=self.quiz).exists())
+
+    def test_requeue_stale(self):
+        """Test that jobs left running by a dead worker are queued again."""
+        self.submit()
+        grading.claim('dead')
+        self.assertEqual(0, grading.requeue_stale())
+        GradingJob.objects.update(updated_at=timezone.now() - grading.STALE_AFTER * 2)
+        self.assertEqual(1, grading.requeue_stale())
+        self.assertEqual((1, 0), grading.work())
+
+    def test_retake_after_delete(self):
+        """Test that a student whose graded attempt was deleted can take the quiz again."""
+        self.submit()
+        grading.work()
+        QuizUser.objects.get(user=self.user, quiz=self.quiz).delete()
+        self.assertFalse(GradingJob.objects.exists())
+        self.assertFalse(QuizResult.objects.exists())
+        resp = self.submit()
+        self.assertRedirects(resp, reverse('report', kwargs={'user_id': self.user.id, 'quiz_id': self.quiz.id}),
+                             fetch_redirect_response=False)
+        self.assertEqual(GradingJob.PENDING, GradingJob.objects.get(user=self.user, quiz=self.quiz).status)
+
+    def test_failed_job(self):
+        """Test that a job whose grading fails is retried and then left failed."""
+        self.submit()
+        score_many = scoring.score_many
+        scoring.score_many = lambda pairs: {}
+        try:
+            for i in range(grading.MAX_TRIES):
+                self.assertEqual((0, 1), grading.work())
+        finally:
+            scoring.score_many = score_many
+        job = GradingJob.objects.get(user=self.user, quiz=self.quiz)
+        self.assertEqual((GradingJob.FAILED, grading.MAX_TRIES), (job.status, job.tries))
+        self.assertIn('KeyError', job.error)
+
+    def test_failed_job_in_batch(self):
+        """Test that one failing job leaves the rest of its batch graded and is told apart from an empty queue."""
+        self.submit()
+        other = User.objects.create_user('padler', 'padler@cs.brynmawr.edu', 'phillips')
+        grading.enqueue(other.id, self.quiz.id)
+        QuizUser.objects.create(user=other, quiz=self.quiz)
+        score_many = scoring.score_many
+
+        def broken(pairs):
+            results = score_many(pairs)
+            results.pop((self.user.id, self.quiz.id), None)
+            return results
+        scoring.score_many = broken
+        try:
+            self.assertEqual((1, 1), grading.work())
+            for i in range(grading.MAX_TRIES - 1):
+                self.assertEqual((0, 1), grading.work())
+            self.assertEqual((0, 0), grading.work())
+        finally:
+            scoring.score_many = score_many
+        self.assertEqual(GradingJob.DONE, GradingJob.objects.get(user=other, quiz=self.quiz).status)
+        self.assertEqual(GradingJob.FAILED, GradingJob.objects.get(user=self.user, quiz=self.quiz).status)
+        self.assertTrue(QuizResult.objects.filter(user=other, quiz=self.quiz).exists())
+
+
+class QuizBankTests(TestCase):
+    """Tests for importing and exporting quizzes as JSON Lines and CSV."""
+
+    def setUp(self):
+        """Set up a superuser and a small generated bank."""
+        self.admin = User.objects.create_superuser(
+            'padler', 'padler@cs.brynmawr.edu', 'phillips')
+        Generator(seed=3).quizzes(4, questions=(0, 3), choices=(0, 3))
+        Quiz.objects.create(name=u"Caf\xe9", subject=u"Fran\xe7ais", difficulty=2)
+
+    def round_trip(self, format):
+        """Export the bank, import it again and check the new quizzes export the same way."""
+        before = ''.join(bank.export_bank(format))
+        ids = list(Quiz.objects.values_list('id', flat=True))
+        created = bank.import_bank(StringIO(before), format, batch_size=2)
+        self.assertEqual(len(ids), created['quizzes'])
+        self.assertEqual(Question.objects.filter(quiz_id__in=ids).count(), created['questions'])
+        new_ids = Quiz.objects.exclude(id__in=ids).values_list('id', flat=True)
+        self.assertEqual(before, ''.join(bank.export_bank(format, new_ids)))
+
+    def test_jsonl_round_trip(self):
+        """Test that a JSON Lines export imports back to the same quizzes."""
+        self.round_trip('jsonl')
+
+    def test_csv_round_trip(self):
+        """Test that a CSV export imports back to the same quizzes."""
+        self.round_trip('csv')
+
+    def test_invalid_line(self):
+        """Test that an invalid quiz rolls back the whole import and names its line."""
+        lines = ['{"name": "Database", "questions": [{"text": "What is SQL?", "choices": []}]}\n',
+                 '\n',
+                 '{"name": "Networks", "questions": [{"text": "What is TCP?", "choices": [{"text": "A", "point": 5}]}]}\n']
+        with self.assertRaises(bank.InvalidBank) as error:
+            bank.import_bank(lines, 'jsonl', batch_size=1)
+        self.assertIn('Line 3', str(error.exception))
+        self.assertFalse(Quiz.objects.filter(name="Database").exists())
+
+    def test_import_inserts(self):
+        """Test that the questions and choices of a batch go in with one insert each and every counter is right."""
+        line = json.dumps({'name': "Quiz", 'questions': [
+            {'text': "Q%d" % i, 'choices': [{'text': "A", 'point': 2}, {'text': "B", 'point': i % 3}]}
+            for i in range(10)]}) + '\n'
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            bank.import_bank([line] * 15, 'jsonl')
+        self.assertEqual(1, len([query for query in queries if 'INSERT INTO "quizXZ_question"' in query['sql']]))
+        self.assertEqual(1, len([query for query in queries if 'INSERT INTO "quizXZ_choice"' in query['sql']]))
+        self.assertLess(len(queries), 25)
+        self.assertEqual([], counters.recount(Quiz.objects.values_list('id', flat=True), repair=False))
+        quiz = Quiz.objects.filter(name="Quiz").order_by('id').last()
+        self.assertEqual(["A", "B"], list(Choice.objects.filter(
+            question__quiz=quiz, question__text="Q9").order_by('id').values_list('text', flat=True)))
+
+    def test_upload_not_utf8(self):
+        """Test that an upload that is not UTF-8 is refused with a form error."""
+        upload = StringIO("quiz,subject,difficulty,question,choice,point\n"
+                          "Caf\xe9,CS330,1,What is TCP?,A protocol,2\n")
+        upload.name = 'networks.csv'
+        self.client.login(username='padler', password='phillips')
+        resp = self.client.post(reverse('import_quizzes'), {'bank': upload})
+        self.assertEqual("Line 2: name is not UTF-8 text.", resp.context['error'])
+        self.assertFalse(Quiz.objects.filter(subject="CS330").exists())
+
+    def test_upload(self):
+        """Test that a superuser can upload a CSV bank and students cannot."""
+        upload = StringIO("quiz,subject,difficulty,question,choice,point\n"
+                          "Networks,CS330,1,What is TCP?,A protocol,2\n"
+                          "Networks,CS330,1,What is TCP?,A cable,0\n")
+        upload.name = 'networks.csv'
+        self.client.login(username='padler', password='phillips')
+        resp = self.client.post(reverse('import_quizzes'), {'bank': upload})
+        self.assertEqual({'quizzes': 1, 'questions': 1, 'choices': 2}, resp.context['created'])
+        quiz = Quiz.objects.get(name="Networks")
+        self.assertEqual(2, Choice.objects.filter(question__quiz=quiz).count())
+        resp = self.client.get(reverse('export_quizzes'), {'format': 'csv'})
+        self.assertIn("Networks,CS330,1,What is TCP?,A cable,0", ''.join(resp.streaming_content))
+        User.objects.create_user('dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(reverse('import_quizzes'))
+        self.assertEqual(resp.context['message'], 'You are not a super user!')
+
+
+class BulkQuestionEditorTests(TestCase):
+    """Tests for creating and editing a question with all of its choices in one request."""
+
+    def setUp(self):
+        """Set up a superuser and a quiz."""
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            'padler', 'padler@cs.brynmawr.edu', 'phillips')
+        self.quiz = Quiz.objects.create(name="Database", subject="CS306")
+        self.client.login(username='padler', password='phillips')
+
+    def post(self, url, question, choices, initial=0, **extra):
+        """Post the question text and a list of choice dicts to the editor."""
+        data = {'text': question, 'quiz': self.quiz.id, 'choice_set-TOTAL_FORMS': len(choices),
+                'choice_set-INITIAL_FORMS': initial, 'choice_set-MIN_NUM_FORMS': 0,
+                'choice_set-MAX_NUM_FORMS': 1000}
+        for i, choice in enumerate(choices):
+            for field, value in choice.items():
+                data['choice_set-%d-%s' % (i, field)] = value
+        data.update(extra)
+        return self.client.post(url, data)
+
+    def test_create(self):
+        """Test that a question and its choices are created with one insert for the choices."""
+        # The test client starts each request by emptying the query log.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.post(reverse('new_question', kwargs={'quiz_id': self.quiz.id}), "What is SQL?", [
+                {'text': "A query language", 'point': 2}, {'text': "A database", 'point': 1},
+                {'text': "A snake", 'point': 0}, {'text': '', 'point': 0}], another='1')
+        inserts = [query for query in queries if 'INSERT INTO "quizXZ_choice"' in query['sql']]
+        self.assertEqual(1, len(inserts))
+        self.assertRedirects(resp, reverse('new_question', kwargs={'quiz_id': self.quiz.id}))
+        question = Question.objects.get(quiz=self.quiz)
+        self.assertEqual([("A query language", 2), ("A database", 1), ("A snake", 0)],
+                         list(question.choice_set.order_by('id').values_list('text', 'point')))
+
+    def test_edit(self):
+        """Test that choices are changed, added and deleted together and the answer key is refreshed."""
+        question = Question.objects.create(text="What is SQL?", quiz=self.quiz)
+        keep = Choice.objects.create(text="A query language", question=question, point=1)
+        drop = Choice.objects.create(text="A snake", question=question, point=0)
+        self.assertEqual(0, answerkey.get(self.quiz.id).grade([keep.id])['score'])
+        resp = self.post(reverse('edit_question', kwargs={'quiz_id': self.quiz.id, 'question_id': question.id}),
+                         "What is SQL?", [
+                             {'id': keep.id, 'text': "A query language", 'point': 2},
+                             {'id': drop.id, 'text': "A snake", 'point': 0, 'DELETE': 'on'},
+                             {'text': "A database", 'point': 0}], initial=2)
+        self.assertRedirects(resp, reverse('create_question', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual([("A query language", 2), ("A database", 0)],
+                         list(question.choice_set.order_by('id').values_list('text', 'point')))
+        self.assertEqual(1, answerkey.get(self.quiz.id).grade([keep.id])['score'])
+
+    def test_invalid(self):
+        """Test that an invalid choice shows the editor again and saves nothing."""
+        resp = self.post(reverse('new_question', kwargs={'quiz_id': self.quiz.id}), "What is SQL?", [
+            {'text': "A query language", 'point': 7}])
+        self.assertTemplateUsed(resp, 'editQuestion.html')
+        self.assertFalse(resp.context['formset'].is_valid())
+        self.assertFalse(Question.objects.exists())
+
+    def test_not_superuser(self):
+        """Test that students cannot use the editor."""
+        User.objects.create_user('dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(reverse('new_question', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual(resp.context['message'], 'You are not a super user!')
+
+
+class PurgeTests(TestCase):
+    """Tests for archiving quizzes and purging them with batched deletes."""
+
+    def setUp(self):
+        """Set up two quizzes with attempts and a superuser."""
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            'padler', 'padler@cs.brynmawr.edu', 'phillips')
+        generator = Generator(seed=5, batch_size=7)
+        user_ids = generator.users(6)
+        generator.quizzes(2, questions=(3, 3), choices=(3, 3), user_ids=user_ids, attempts=(5, 5))
+        self.quiz, self.other = Quiz.objects.order_by('id')
+        self.other_rows = self.counts(self.other.id)
+
+    def counts(self, quiz_id):
+        """Return the number of rows of each table that belong to the quiz."""
+        return [Question.objects.filter(quiz_id=quiz_id).count(),
+                Choice.objects.filter(question__quiz_id=quiz_id).count(),
+                Answer.objects.filter(attempt__quiz_id=quiz_id).count(),
+                QuizUser.objects.filter(quiz_id=quiz_id).count(),
+                QuizResult.objects.filter(quiz_id=quiz_id).count(),
+                AnswerPattern.objects.filter(question__quiz_id=quiz_id).count()]
+
+    def test_purge(self):
+        """Test that purging removes the quiz and everything under it, and nothing else."""
+        taker = QuizUser.objects.filter(quiz=self.quiz).first().user_id
+        self.assertIn(self.quiz.id, caching.taken_quiz_ids(taker))
+        deleted = purge.purge(self.quiz.id, batch_size=4)
+        self.assertEqual(1, deleted['quizzes'])
+        self.assertEqual(5, deleted['attempts'])
+        self.assertFalse(Quiz.objects.filter(id=self.quiz.id).exists())
+        self.assertEqual([0, 0, 0, 0, 0, 0], self.counts(self.quiz.id))
+        self.assertEqual(self.other_rows, self.counts(self.other.id))
+        self.assertNotIn(self.quiz.id, caching.taken_quiz_ids(taker))
+
+    def test_archive(self):
+        """Test that an archived quiz is hidden from students but keeps its history."""
+        student = User.objects.create_user('dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        purge.archive(self.quiz.id)
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(reverse('quizzes'))
+        self.assertEqual([self.other], list(resp.context['quizzes']))
+        resp = self.client.get(reverse('questions', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual(404, resp.status_code)
+        self.assertEqual(5, QuizUser.objects.filter(quiz=self.quiz).count())
+
+    def test_delete_quiz_async(self):
+        """Test that with QUIZ_PURGE_ASYNC the view archives and the command purges."""
+        was_async = purge.ASYNC
+        purge.ASYNC = True
+        try:
+            self.client.login(username='padler', password='phillips')
+            self.client.post(reverse('delete_quiz'), {'delete': self.quiz.id})
+        finally:
+            purge.ASYNC = was_async
+        self.assertTrue(Quiz.objects.get(id=self.quiz.id).archived)
+        out = StringIO()
+        call_command('purge_quizzes', batch_size=3, stdout=out)
+        self.assertIn("Purged 1 quizzes.", out.getvalue())
+        self.assertEqual([self.other], list(Quiz.objects.all()))
+
+    def test_purge_query_count(self):
+        """Test that the number of queries of a purge does not grow with the size of the quiz."""
+        Generator(seed=6).quizzes(1, questions=(8, 8), choices=(4, 4), picks=(2, 2),
+                                  user_ids=User.objects.values_list('id', flat=True), attempts=(7, 7))
+        bigger = Quiz.objects.order_by('-id').first()
+        reset_queries()
+        with CaptureQueriesContext(connection) as small:
+            purge.purge(self.quiz.id)
+        with CaptureQueriesContext(connection) as big:
+            purge.purge(bigger.id)
+        self.assertEqual(len(small), len(big))
+
+
+class AnalyticsTests(TestCase):
+    """Tests for the per-quiz analytics computed with GROUP BY aggregates."""
+
+    def setUp(self):
+        """Set up generated quizzes with attempts and a superuser."""
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            'padler', 'padler@cs.brynmawr.edu', 'phillips')
+        generator = Generator(seed=8)
+        user_ids = generator.users(12)
+        generator.quizzes(2, questions=(3, 5), choices=(2, 4), user_ids=user_ids, attempts=(9, 9), picks=(0, 2))
+        self.quiz = Quiz.objects.order_by('id').first()
+
+    def assert_matches_answers(self):
+        """Assert that the per-question analytics agree with counting the answers of every attempt."""
+        stats = analytics.quiz_stats(self.quiz.id)
+        key = answerkey.get(self.quiz.id)
+        attempts = QuizUser.objects.filter(quiz=self.quiz).count()
+        self.assertEqual(attempts, stats['attempts'])
+        for question in stats['questions']:
+            full = 0
+            points = 0
+            for attempt in QuizUser.objects.filter(quiz=self.quiz):
+                selected = Answer.objects.filter(attempt=attempt, question_id=question['id']).values_list(
+                    'choice__point', flat=True)
+                tally = [list(selected).count(point) for point in (2, 1, 0)]
+                points += answerkey.question_score(*tally)
+                if tally[1:] == [0, 0] and tally[0] == key.correct[question['id']] and selected:
+                    full += 1
+            self.assertAlmostEqual(100.0 * full / attempts, question['percent_correct'])
+            self.assertAlmostEqual(points / float(attempts), question['mean_points'])
+            for choice in question['choices']:
+                self.assertEqual(Answer.objects.filter(choice_id=choice['id']).count(), choice['picks'])
+        return stats
+
+    def test_matches_answers(self):
+        """Test that the aggregates agree with counting the answers of every attempt."""
+        stats = self.assert_matches_answers()
+        self.assertEqual(9, stats['attempts'])
+        scores = sorted(QuizResult.objects.filter(quiz=self.quiz).values_list('score', flat=True))
+        self.assertAlmostEqual(sum(scores) / len(scores), stats['mean'])
+        self.assertAlmostEqual((scores[3] + scores[4]) / 2.0 if len(scores) % 2 == 0 else scores[4], stats['median'])
+        self.assertEqual(9, sum(bin['count'] for bin in stats['histogram']))
+
+    def test_patterns_follow_changes(self):
+        """Test that the answer patterns follow submitted and deleted attempts, deleted choices and new points."""
+        questions = list(Question.objects.filter(quiz=self.quiz).order_by('id'))
+        first = list(questions[0].choice_set.order_by('id'))
+        second = list(questions[1].choice_set.order_by('id'))
+        both = AnswerPattern.objects.filter(question=questions[0], choices=patterns.pattern([first[0].id, first[1].id]))
+        before = sum(both.values_list('attempts', flat=True))
+        for username in ('dxu', 'xzhang'):
+            submission.submit(User.objects.create_user(username, '', 'yilun'), self.quiz,
+                              [first[0].id, first[1].id, second[0].id])
+        self.assertEqual(before + 2, both.get().attempts)
+        self.assert_matches_answers()
+        QuizUser.objects.filter(user__username='dxu').delete()
+        self.assert_matches_answers()
+        first[1].delete()
+        self.assert_matches_answers()
+        second[0].point = 1 if second[0].point == 2 else 2
+        second[0].save()
+        self.assert_matches_answers()
+        stored = set(AnswerPattern.objects.filter(attempts__gt=0).values_list('question_id', 'choices', 'attempts'))
+        patterns.rebuild(question.id for question in questions)
+        self.assertEqual(stored, set(AnswerPattern.objects.values_list('question_id', 'choices', 'attempts')))
+
+    def test_query_count(self):
+        """Test that the number of queries does not grow with the number of attempts."""
+        answerkey.get(self.quiz.id)
+        with CaptureQueriesContext(connection) as few:
+            analytics.quiz_stats(self.quiz.id)
+        for user_id in Generator(seed=9).users(5, 'extra'):
+            attempt = QuizUser.objects.create(user_id=user_id, quiz=self.quiz)
+            choice = Choice.objects.filter(question__quiz=self.quiz).first()
+            Answer.objects.create(attempt=attempt, question_id=choice.question_id, choice=choice)
+        answerkey.get(self.quiz.id)
+        with CaptureQueriesContext(connection) as many:
+            analytics.quiz_stats(self.quiz.id)
+        self.assertEqual(len(few), len(many))
+
+    def test_view(self):
+        """Test that the superuser gets the page and the JSON, and students get neither."""
+        self.client.login(username='padler', password='phillips')
+        resp = self.client.get(reverse('quiz_analytics', kwargs={'quiz_id': self.quiz.id}))
+        self.assertTemplateUsed(resp, 'quizAnalytics.html')
+        resp = self.client.get(reverse('quiz_analytics', kwargs={'quiz_id': self.quiz.id}), {'format': 'json'})
+        data = json.loads(resp.content)
+        self.assertEqual(9, data['attempts'])
+        self.assertEqual(self.quiz.name, data['quiz_name'])
+        User.objects.create_user('dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        self.client.login(username='dxu', password='yilun')
+        resp = self.client.get(reverse('quiz_analytics', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual(resp.context['message'], 'You are not a super user!')
+
+
+class RegradeTests(TestCase):
+    """Tests for re-grading the stored results of a quiz after its choice points change."""
+
+    def setUp(self):
+        """Set up generated quizzes with stored results, then change the points of some choices."""
+        cache.clear()
+        generator = Generator(seed=11)
+        user_ids = generator.users(15)
+        generator.quizzes(2, questions=(3, 5), choices=(2, 4), user_ids=user_ids, attempts=(12, 12), picks=(0, 3))
+        self.quiz, self.other = Quiz.objects.order_by('id')
+        for choice in Choice.objects.filter(question__quiz=self.quiz).order_by('id')[::3]:
+            choice.point = (choice.point + 1) % 3
+            choice.save()
+
+    def live_scores(self, quiz_id):
+        """Return the live score of every attempt at the quiz, by user id."""
+        pairs = QuizUser.objects.filter(quiz_id=quiz_id).values_list('user_id', 'quiz_id')
+        return dict((user_id, result['score']) for (user_id, quiz_id), result in scoring.score_many(pairs).items())
+
+    def stored_scores(self, quiz_id):
+        """Return the stored score of every attempt at the quiz, by user id."""
+        return dict(QuizResult.objects.filter(quiz_id=quiz_id).values_list('user_id', 'score'))
+
+    def test_regrade(self):
+        """Test that re-grading stores the live scores and leaves other quizzes alone."""
+        other = self.stored_scores(self.other.id)
+        self.assertNotEqual(self.live_scores(self.quiz.id), self.stored_scores(self.quiz.id))
+        counts = regrade.regrade(self.quiz.id, batch_size=7)
+        self.assertEqual(12, counts['attempts'])
+        self.assertEqual(self.live_scores(self.quiz.id), self.stored_scores(self.quiz.id))
+        total = answerkey.get(self.quiz.id).total
+        self.assertFalse(QuizResult.objects.filter(quiz=self.quiz).exclude(total=total).exists())
+        self.assertEqual(other, self.stored_scores(self.other.id))
+        self.assertEqual(0, regrade.regrade(self.quiz.id)['updated'])
+
+    def test_missing_results(self):
+        """Test that attempts without a stored result get one."""
+        QuizResult.objects.filter(quiz=self.quiz).delete()
+        counts = regrade.regrade(self.quiz.id)
+        self.assertEqual(12, counts['created'])
+        self.assertEqual(self.live_scores(self.quiz.id), self.stored_scores(self.quiz.id))
+
+    @skipUnless(regrade.numpy, "NumPy is not installed")
+    def test_grade_arrays(self):
+        """Test that the NumPy grader gives the same scores as the answer key."""
+        key = answerkey.get(self.quiz.id)
+        attempt_ids = list(QuizUser.objects.filter(quiz=self.quiz).order_by('id').values_list('id', flat=True))
+        rows = regrade.selections(self.quiz.id)
+        self.assertEqual(regrade.grade_lists(key, attempt_ids, rows), regrade.grade_arrays(key, attempt_ids, rows))
+
+    @skipUnless(regrade.numpy, "NumPy is not installed")
+    def test_grade_arrays_unknown_attempts(self):
+        """Test that answers of attempts missing from attempt_ids are left out by both graders."""
+        key = answerkey.get(self.quiz.id)
+        attempt_ids = list(QuizUser.objects.filter(quiz=self.quiz).order_by('id').values_list('id', flat=True))
+        rows = regrade.selections(self.quiz.id, batch_size=5)
+        scores = dict(zip(attempt_ids, regrade.grade_lists(key, attempt_ids, rows)))
+        known = attempt_ids[1:6] + attempt_ids[7:-1]
+        expected = [scores[attempt_id] for attempt_id in known]
+        self.assertEqual(expected, regrade.grade_lists(key, known, rows))
+        self.assertEqual(expected, regrade.grade_arrays(key, known, rows))
+
+    def test_command(self):
+        """Test that the regrade_quizzes command re-grades the given quizzes."""
+        out = StringIO()
+        call_command('regrade_quizzes', quiz=[self.quiz.id], stdout=out)
+        self.assertIn("Re-graded 1 quizzes.", out.getvalue())
+        self.assertEqual(self.live_scores(self.quiz.id), self.stored_scores(self.quiz.id))
+
+
+class GradebookTests(TestCase):
+    """Tests for grading every attempt offline for the gradebook."""
+
+    def setUp(self):
+        """Set up generated quizzes with attempts."""
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        generator = Generator(seed=12)
+        user_ids = generator.users(10)
+        generator.quizzes(4, questions=(2, 4), choices=(2, 4), user_ids=user_ids, attempts=(3, 8), picks=(0, 3))
+
+    def tearDown(self):
+        """Remove the written files."""
+        shutil.rmtree(self.directory)
+
+    def test_tasks(self):
+        """Test that every quiz lands in exactly one task and tasks stay near the task size."""
+        quiz_ids = list(Quiz.objects.values_list('id', flat=True))
+        counts = gradebook.attempt_counts(quiz_ids)
+        self.assertEqual(dict((quiz_id, QuizUser.objects.filter(quiz_id=quiz_id).count()) for quiz_id in quiz_ids),
+                         counts)
+        tasks = list(gradebook.tasks(counts, task_size=10))
+        self.assertEqual(sorted(quiz_ids), sorted(sum(tasks, [])))
+        for task in tasks:
+            if len(task) > 1:
+                self.assertLessEqual(QuizUser.objects.filter(quiz_id__in=task).count(), 10)
+
+    def test_command(self):
+        """Test that the CSV has one row per attempt with the live score."""
+        output = '%s/gradebook.csv' % self.directory
+        out = StringIO()
+        call_command('grade_report', output=output, processes=1, task_size=10, stdout=out)
+        self.assertIn("Wrote %d rows" % QuizUser.objects.count(), out.getvalue())
+        with open(output) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(gradebook.COLUMNS, rows[0])
+        live = scoring.score_many(QuizUser.objects.values_list('user_id', 'quiz_id'))
+        self.assertEqual(QuizUser.objects.count(), len(rows) - 1)
+        for quiz_id, name, user_id, username, point, total in rows[1:]:
+            result = live[(int(user_id), int(quiz_id))]
+            self.assertAlmostEqual(result['score'], float(point))
+            self.assertEqual(result['total'], int(total))
+            self.assertEqual(User.objects.get(id=user_id).username, username)
+            self.assertEqual(Quiz.objects.get(id=quiz_id).name, name)
+
+
+class PagedQuizTests(TestCase):
+    """Tests for taking a quiz a page of questions at a time with the answers kept in a draft."""
+
+    def setUp(self):
+        """Set up a student and a generated quiz of 12 questions shown 5 to a page."""
+        cache.clear()
+        self.per_page = views.QUESTIONS_PER_PAGE
+        views.QUESTIONS_PER_PAGE = 5
+        self.user = User.objects.create_user('dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        Generator(seed=13).quizzes(2, questions=(12, 12), choices=(3, 3))
+        self.quiz, self.other = Quiz.objects.order_by('id')
+        self.client.login(username='dxu', password='yilun')
+
+    def tearDown(self):
+        """Restore the page size."""
+        views.QUESTIONS_PER_PAGE = self.per_page
+
+    def choices(self, page):
+        """Return the choice ids of the questions on a page, in page order."""
+        questions = list(Question.objects.filter(quiz=self.quiz).order_by('id'))[(page - 1) * 5:page * 5]
+        return list(Choice.objects.filter(question__in=questions).order_by('question_id', 'id').values_list(
+            'id', flat=True))
+
+    def post(self, page, selections, button='next'):
+        """Post the selections made on a page and press a button."""
+        return self.client.post(reverse('take_quiz', kwargs={'quiz_id': self.quiz.id}), {
+            'page': page, 'userchoice': selections, button: button})
+
+    def test_pages(self):
+        """Test that each page shows its questions with the draft's selections checked."""
+        resp = self.client.get(reverse('take_quiz', kwargs={'quiz_id': self.quiz.id}))
+        self.assertTemplateUsed(resp, 'takeQuiz.html')
+        self.assertEqual(5, len(resp.context['page'].object_list))
+        first = self.choices(1)
+        resp = self.post(1, first[:2])
+        self.assertRedirects(resp, reverse('take_quiz', kwargs={'quiz_id': self.quiz.id}) + '?page=2')
+        self.post(2, self.choices(2)[:1], 'previous')
+        resp = self.client.get(reverse('take_quiz', kwargs={'quiz_id': self.quiz.id}), {'page': 1})
+        self.assertEqual(set(first[:2] + self.choices(2)[:1]), resp.context['selected'])
+        self.assertContains(resp, 'value="%d" checked' % first[0])
+        self.post(1, first[1:3])
+        self.assertEqual(set(first[1:3] + self.choices(2)[:1]), drafts.selections(self.user.id, self.quiz.id))
+
+    def test_finish(self):
+        """Test that finishing submits the whole draft as the attempt and removes the draft."""
+        self.post(1, self.choices(1)[:2])
+        self.post(2, self.choices(2)[1:2])
+        resp = self.post(3, self.choices(3)[:1], 'finish')
+        self.assertRedirects(resp, reverse('report', kwargs={'user_id': self.user.id, 'quiz_id': self.quiz.id}))
+        selected = set(self.choices(1)[:2] + self.choices(2)[1:2] + self.choices(3)[:1])
+        self.assertEqual(selected, set(Answer.objects.filter(attempt__user=self.user).values_list(
+            'choice_id', flat=True)))
+        self.assertEqual(answerkey.get(self.quiz.id).grade(selected)['score'],
+                         QuizResult.objects.get(user=self.user, quiz=self.quiz).score)
+        self.assertFalse(Draft.objects.exists())
+        resp = self.client.get(reverse('take_quiz', kwargs={'quiz_id': self.quiz.id}))
+        self.assertEqual(resp.context['message'], 'You have taken this quiz before!!!')
+
+    def test_choice_deleted(self):
+        """Test that a choice deleted from the quiz after it was saved in the draft is left out of the attempt."""
+        deleted, kept = self.choices(1)[:2]
+        self.post(1, [deleted, kept])
+        Choice.objects.filter(id=deleted).delete()
+        resp = self.post(2, self.choices(2)[:1], 'finish')
+        self.assertRedirects(resp, reverse('report', kwargs={'user_id': self.user.id, 'quiz_id': self.quiz.id}))
+        self.assertEqual(set([kept] + self.choices(2)[:1]), set(Answer.objects.filter(
+            attempt__user=self.user).values_list('choice_id', flat=True)))
+
+    def test_invalid(self):
+        """Test that choices from another page or quiz and an empty draft are refused."""
+        other = Choice.objects.filter(question__quiz=self.other).first().id
+        for page, selections in ((1, self.choices(2)[:1]), (1, [other]), (1, ['x'])):
+            resp = self.post(page, selections)
+            self.assertEqual(resp.context['message'], 'Invalid Input!')
+        resp = self.post(1, [], 'finish')
+        self.assertEqual(resp.context['message'], 'Invalid Input!')
+        self.assertFalse(QuizUser.objects.filter(user=self.user).exists())
+
+    def test_query_count(self):
+        """Test that showing a page takes the same number of queries however long the quiz is."""
+        url = reverse('take_quiz', kwargs={'quiz_id': self.quiz.id})
+        self.client.get(url)
+        reset_queries()
+        with CaptureQueriesContext(connection) as short:
+            self.client.get(url, {'page': 2})
+        Generator(seed=14).bulk_create(Question, [Question(quiz=self.quiz, text="Extra") for i in range(40)])
+        reset_queries()
+        with CaptureQueriesContext(connection) as long:
+            self.client.get(url, {'page': 2})
+        self.assertEqual(len(short), len(long))
+
+    def test_autosave(self):
+        """Test that autosaves apply changes to the draft and only write when it changed."""
+        url = reverse('autosave', kwargs={'quiz_id': self.quiz.id})
+        first, second = self.choices(1)[:2]
+        resp = self.client.post(url, json.dumps({'add': [first, second]}), content_type='application/json')
+        self.assertEqual({'choices': [first, second], 'saved': True}, json.loads(resp.content))
+        resp = self.client.post(url, json.dumps({'add': [second], 'remove': [first]}),
+                                content_type='application/json')
+        self.assertEqual({'choices': [second], 'saved': True}, json.loads(resp.content))
+        self.assertEqual('%d' % second, Draft.objects.get(user=self.user, quiz=self.quiz).choices)
+        updated = Draft.objects.get().updated_at
+        resp = self.client.post(url, json.dumps({'add': [second]}), content_type='application/json')
+        self.assertFalse(json.loads(resp.content)['saved'])
+        self.assertEqual(updated, Draft.objects.get().updated_at)
+        self.assertEqual([second], json.loads(self.client.get(url).content)['choices'])
+
+        resp = self.post(2, self.choices(2)[:1], 'finish')
+        self.assertEqual({second, self.choices(2)[0]}, set(Answer.objects.filter(
+            attempt__user=self.user).values_list('choice_id', flat=True)))
+        self.assertFalse(Draft.objects.exists())
+        resp = self.client.post(url, json.dumps({'add': [first]}), content_type='application/json')
+        self.assertEqual(409, resp.status_code)
+
+    def test_autosave_invalid(self):
+        """Test that malformed changes and choices of other quizzes are refused without writing."""
+        url = reverse('autosave', kwargs={'quiz_id': self.quiz.id})
+        other = Choice.objects.filter(question__quiz=self.other).first().id
+        for body in ('not json', '[1]', json.dumps({'add': ['x']}), json.dumps({'add': [other]})):
+            resp = self.client.post(url, body, content_type='application/json')
+            self.assertEqual(400, resp.status_code)
+        self.assertFalse(Draft.objects.exists())
+
+    def test_autosave_query_count(self):
+        """Test that an autosave that changes nothing makes no writes."""
+        url = reverse('autosave', kwargs={'quiz_id': self.quiz.id})
+        body = json.dumps({'add': self.choices(1)[:1]})
+        self.client.post(url, body, content_type='application/json')
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, body, content_type='application/json')
+        quiz_queries = [query['sql'] for query in queries.captured_queries if 'quizXZ_' in query['sql']]
+        self.assertEqual(2, len(quiz_queries))
+        self.assertIn('FROM "quizXZ_quiz"', quiz_queries[0])
+        self.assertIn('SELECT "quizXZ_draft"."choices"', quiz_queries[1])
+
+    def test_autosave_archived(self):
+        """Test that autosaves to a missing or archived quiz are refused without writing a draft."""
+        body = json.dumps({'add': self.choices(1)[:1]})
+        Quiz.objects.filter(id=self.quiz.id).update(archived=True)
+        resp = self.client.post(reverse('autosave', kwargs={'quiz_id': self.quiz.id}), body,
+                                content_type='application/json')
+        self.assertEqual(404, resp.status_code)
+        resp = self.client.post(reverse('autosave', kwargs={'quiz_id': self.other.id + 100}), body,
+                                content_type='application/json')
+        self.assertEqual(404, resp.status_code)
+        self.assertFalse(Draft.objects.exists())
+
+
+class CounterTests(TestCase):
+    """Tests for the question, choice and attempt counters stored on quizzes and questions."""
+
+    def setUp(self):
+        """Set up a student and a quiz with a question of three choices."""
+        cache.clear()
+        self.user = User.objects.create_user('dxu', 'dxu@cs.brynmawr.edu', 'yilun')
+        self.quiz = Quiz.objects.create(name="Quiz 1", subject="Databases")
+        self.question = Question.objects.create(text="What is SQL?", quiz=self.quiz)
+        self.choices = [Choice.objects.create(text="Choice %d" % point, question=self.question, point=point)
+                        for point in (2, 1, 2)]
+
+    def counts(self):
+        """Return the stored counters of the quiz and the question."""
+        quiz = Quiz.objects.get(id=self.quiz.id)
+        question = Question.objects.get(id=self.question.id)
+        return ((quiz.num_questions, quiz.num_attempts, quiz.max_total),
+                (question.num_choices, question.num_correct))
+
+    def test_signals(self):
+        """Test that creating, changing and deleting rows keeps the counters right."""
+        self.assertEqual(((1, 0, 2), (3, 2)), self.counts())
+        attempt = QuizUser.objects.create(user=self.user, quiz=self.quiz)
+        self.assertEqual(((1, 1, 2), (3, 2)), self.counts())
+        self.choices[0].point = 0
+        self.choices[0].save()
+        self.assertEqual(((1, 1, 1), (3, 1)), self.counts())
+        self.choices[1].delete()
+        self.assertEqual(((1, 1, 1), (2, 1)), self.counts())
+        other = Question.objects.create(text="What is a join?", quiz=self.quiz)
+        Choice.objects.create(text="Correct", question=other, point=2)
+        self.assertEqual(((2, 1, 2), (2, 1)), self.counts())
+        other.delete()
+        attempt.delete()
+        self.assertEqual(((1, 0, 1), (2, 1)), self.counts())
+        self.assertEqual([], counters.recount([self.quiz.id], repair=False))
+
+    def test_stale_save(self):
+        """Test that saving a quiz or question read before its counters changed keeps the new counts."""
+        quiz = Quiz.objects.get(id=self.quiz.id)
+        question = Question.objects.get(id=self.question.id)
+        QuizUser.objects.create(user=self.user, quiz=self.quiz)
+        Choice.objects.create(text="Choice 0", question=self.question, point=2)
+        quiz.name = "Quiz 2"
+        quiz.save()
+        question.text = "What is a database?"
+        question.save()
+        self.assertEqual(((1, 1, 3), (4, 3)), self.counts())
+        self.assertEqual("Quiz 2", Quiz.objects.get(id=self.quiz.id).name)
+        self.assertEqual("What is a database?", Question.objects.get(id=self.question.id).text)
+
+    def test_moved_question(self):
+        """Test that a question moved to another quiz is counted on the new quiz only."""
+        quiz = Quiz.objects.create(name="Quiz 2")
+        self.question.quiz = quiz
+        self.question.save()
+        self.assertEqual((0, 0, 0), self.counts()[0])
+        quiz = Quiz.objects.get(id=quiz.id)
+        self.assertEqual((1, 2), (quiz.num_questions, quiz.max_total))
+
+    def test_bulk_paths(self):
+        """Test that generated, imported and bulk edited quizzes get the right counters."""
+        user_ids = Generator(seed=15).users(6)
+        Generator(seed=15).quizzes(3, questions=(2, 4), choices=(2, 4), user_ids=user_ids, attempts=(2, 5))
+        bank.import_bank(StringIO(json.dumps({'name': 'Imported', 'questions': [
+            {'text': 'Q', 'choices': [{'text': 'A', 'point': 2}, {'text': 'B', 'point': 2}]}]})))
+        User.objects.create_superuser('padler', 'padler@cs.brynmawr.edu', 'phillips')
+        self.client.login(username='padler', password='phillips')
+        self.client.post(reverse('edit_question', kwargs={'quiz_id': self.quiz.id, 'question_id': self.question.id}), {
+            'text': "What is SQL?", 'choice_set-TOTAL_FORMS': 4, 'choice_set-INITIAL_FORMS': 3,
+            'choice_set-MIN_NUM_FORMS': 0, 'choice_set-MAX_NUM_FORMS': 1000,
+            'choice_set-0-id': self.choices[0].id, 'choice_set-0-text': "Choice 2", 'choice_set-0-point': 0,
+            'choice_set-1-id': self.choices[1].id, 'choice_set-1-text': "Choice 1", 'choice_set-1-point': 1,
+            'choice_set-1-DELETE': 'on',
+            'choice_set-2-id': self.choices[2].id, 'choice_set-2-text': "Choice 2", 'choice_set-2-point': 2,
+            'choice_set-3-text': "New", 'choice_set-3-point': 2})
+        self.assertEqual(((1, 0, 2), (3, 2)), self.counts())
+        self.assertEqual(2, Quiz.objects.get(name='Imported').max_total)
+        self.assertEqual(5, Quiz.objects.count())
+        self.assertEqual([], counters.recount(Quiz.objects.values_list('id', flat=True), repair=False))
+
+    def test_command(self):
+        """Test that check_counters reports wrong counters and repairs them with --repair."""
+        Quiz.objects.filter(id=self.quiz.id).update(num_questions=7)
+        Question.objects.filter(id=self.question.id).update(num_correct=0)
+        out = StringIO()
+        call_command('check_counters', stdout=out)
+        self.assertIn("num_questions 7 should be 1", out.getvalue())
+        self.assertIn("num_correct 0 should be 2", out.getvalue())
+        self.assertIn("2 rows wrong.", out.getvalue())
+        self.assertEqual(((7, 0, 2), (3, 0)), self.counts())
+        AnswerPattern.objects.create(question=self.question, choices='1', attempts=4)
+        call_command('check_counters', repair=True, stdout=StringIO())
+        self.assertEqual(((1, 0, 2), (3, 2)), self.counts())
+        self.assertFalse(AnswerPattern.objects.exists())
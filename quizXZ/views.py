@@ -1,15 +1,52 @@
 """views.py for the quiz system."""
-from django.http import HttpResponseRedirect, HttpResponse
+import json
+
+from django.http import HttpResponseRedirect, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.http import urlencode
 
 from models import Quiz, Question, Choice, QuizUser
 from django.contrib.auth.models import User
 
-from forms import LoginForm, SignupForm, QuizForm, QuestionForm, ChoiceForm
+from forms import LoginForm, SignupForm, QuizForm, QuestionForm, ChoiceForm, ChoiceFormSet, QuizBankForm
+from answerkey import CHUNK_SIZE
+import analytics
+import answerkey
+import bank
+import caching
+import counters
+import drafts
+import grading
+from middleware import view_stats
+import reports
+import purge
+import scoring
+import signals
+import submission
+
+# Number of questions or choices shown per page in the authoring lists.
+PAGE_SIZE = 50
+
+# Number of questions shown per page when a quiz is taken a page at a time.
+QUESTIONS_PER_PAGE = 20
+
+
+def paginate(request, queryset):
+    """Return the page of the queryset named by the 'page' GET parameter."""
+    paginator = Paginator(queryset, PAGE_SIZE)
+    try:
+        return paginator.page(request.GET.get('page'))
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
 
 
 def main(request):
@@ -82,20 +119,27 @@ def homepage(request):
 @login_required(login_url='/login/')
 def quizzes(request):
     """Pass in the quizzes list of untaken quizzes and render quizzes.html."""
-    quizzes = Quiz.objects.exclude(users=request.user)
-    return render(request, 'quizzes.html', {'quizzes': quizzes})
+    taken = caching.taken_quiz_ids(request.user.id)
+    # Keep the id list within the database's limit on query parameters.
+    if len(taken) <= CHUNK_SIZE:
+        quizzes = Quiz.objects.filter(archived=False).exclude(id__in=taken)
+    else:
+        quizzes = Quiz.objects.filter(archived=False).exclude(users=request.user)
+    return render(request, 'quizzes.html', {'quizzes': quizzes, 'questions_per_page': QUESTIONS_PER_PAGE})
 
 
 @login_required(login_url='/login/')
 def questions(request, quiz_id):
     """Check whether the quiz has taken by the user before and display the quiz questions."""
-    if request.user.quiz_set.filter(id=quiz_id).exists():
+    if int(quiz_id) in caching.taken_quiz_ids(request.user.id):
         return render(request, 'invalidAttempt.html', {'message': 'You have taken this quiz before!!!'})
     else:
-        quiz = get_object_or_404(Quiz, id=quiz_id)
+        quiz = get_object_or_404(Quiz, id=quiz_id, archived=False)
         return render(request, 'questions.html', {
             'title': 'Quizzes',
             'quiz': quiz,
+            'question_block': caching.rendered_questions(quiz),
+            'autosave_interval': drafts.AUTOSAVE_INTERVAL,
         })
 
 
@@ -103,19 +147,15 @@ def questions(request, quiz_id):
 def save_userchoice(request, quiz_id):
     """Check whether the quiz has taken by the user before and save the user answers(userchoice)."""
     if request.method == 'POST':
-        if request.user.quiz_set.filter(id=quiz_id).exists():
+        if int(quiz_id) in caching.taken_quiz_ids(request.user.id):
             return render(request, 'invalidAttempt.html', {'message': 'You have taken this quiz before!!!'})
         else:
             if 'userchoice' in request.POST and request.POST['userchoice'].isdigit():
-                quiz = get_object_or_404(Quiz, id=quiz_id)
-                quizuser = QuizUser.objects.create(
-                    quiz=quiz, user=request.user)
-                quizuser.save()
-                selections = request.POST.getlist('userchoice')
-                for selection in selections:
-                    choice = get_object_or_404(Choice, id=selection)
-                    choice.users.add(request.user)
-                    choice.save()
+                quiz = get_object_or_404(Quiz, id=quiz_id, archived=False)
+                try:
+                    submission.submit(request.user, quiz, request.POST.getlist('userchoice'))
+                except submission.InvalidSubmission as e:
+                    return render(request, 'invalidAttempt.html', {'message': str(e)})
                 return HttpResponseRedirect(reverse('report', kwargs={'user_id': request.user.id, 'quiz_id': quiz_id}))
             else:
                 return render(request, 'invalidAttempt.html', {'message': 'Invalid Input!'})
@@ -123,41 +163,142 @@ def save_userchoice(request, quiz_id):
         return render(request, 'invalidAttempt.html', {'message': 'Form resubmission!'})
 
 
+@login_required(login_url='/login/')
+def take_quiz(request, quiz_id):
+    """Display the quiz QUESTIONS_PER_PAGE questions at a time, keeping the answers so far in a draft.
+
+    GET shows the page named by the 'page' parameter with the draft's
+    selections checked. POST stores the selections made on the posted page
+    in the draft and shows the previous or next page, or with 'finish'
+    submits the whole draft through the same checks as save_userchoice.
+    """
+    if int(quiz_id) in caching.taken_quiz_ids(request.user.id):
+        return render(request, 'invalidAttempt.html', {'message': 'You have taken this quiz before!!!'})
+    quiz = get_object_or_404(Quiz, id=quiz_id, archived=False)
+    questions = Question.objects.filter(quiz_id=quiz.id).order_by('id').prefetch_related(
+        Prefetch('choice_set', queryset=Choice.objects.order_by('id')))
+    paginator = Paginator(questions, QUESTIONS_PER_PAGE)
+    params = request.POST if request.method == 'POST' else request.GET
+    try:
+        page = paginator.page(params.get('page'))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    if request.method == 'POST':
+        page_choices = set(choice.id for question in page for choice in question.choice_set.all())
+        selections = request.POST.getlist('userchoice')
+        if not all(selection.isdigit() and int(selection) in page_choices for selection in selections):
+            return render(request, 'invalidAttempt.html', {'message': 'Invalid Input!'})
+        selected = drafts.save_page(request.user.id, quiz.id, page_choices, [int(s) for s in selections])
+        if 'finish' in request.POST:
+            # Choices deleted from the quiz since they were saved stay in the draft; leave them out.
+            selected = selected.intersection(answerkey.get(quiz.id).points)
+            if not selected:
+                return render(request, 'invalidAttempt.html', {'message': 'Invalid Input!'})
+            try:
+                submission.submit(request.user, quiz, selected)
+            except submission.InvalidSubmission as e:
+                return render(request, 'invalidAttempt.html', {'message': str(e)})
+            return HttpResponseRedirect(reverse('report', kwargs={'user_id': request.user.id, 'quiz_id': quiz.id}))
+        number = page.number
+        if 'previous' in request.POST and page.has_previous():
+            number = page.previous_page_number()
+        elif 'next' in request.POST and page.has_next():
+            number = page.next_page_number()
+        return HttpResponseRedirect('%s?page=%d' % (reverse('take_quiz', kwargs={'quiz_id': quiz.id}), number))
+
+    return render(request, 'takeQuiz.html', {
+        'title': 'Quizzes',
+        'quiz': quiz,
+        'page': page,
+        'selected': drafts.selections(request.user.id, quiz.id),
+        'autosave_interval': drafts.AUTOSAVE_INTERVAL,
+    })
+
+
+@login_required(login_url='/login/')
+def autosave(request, quiz_id):
+    """Return the user's draft of the quiz as JSON, or on POST apply a change to it.
+
+    The POST body is a JSON object whose 'add' and 'remove' lists hold the
+    choice ids checked and unchecked since the last autosave. The response
+    holds the draft's choice ids and whether it had to be written.
+    """
+    if int(quiz_id) in caching.taken_quiz_ids(request.user.id):
+        return JsonResponse({'error': 'You have taken this quiz before!!!'}, status=409)
+    quiz = get_object_or_404(Quiz, id=quiz_id, archived=False)
+    if request.method != 'POST':
+        return JsonResponse({'choices': sorted(drafts.selections(request.user.id, quiz.id))})
+    try:
+        change = json.loads(request.body)
+        add = set(int(choice_id) for choice_id in change.get('add', []))
+        remove = set(int(choice_id) for choice_id in change.get('remove', []))
+    except (AttributeError, TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid Input!'}, status=400)
+    key = answerkey.get(quiz.id)
+    if not all(choice_id in key for choice_id in add):
+        return JsonResponse({'error': 'Invalid Input!'}, status=400)
+    draft, saved = drafts.apply(request.user.id, quiz.id, add, remove)
+    return JsonResponse({'choices': sorted(draft), 'saved': saved})
+
+
 @login_required(login_url='/login/')
 def my_report(request):
     """Display the scoreboard for the current user."""
-    quizzes = Quiz.objects.filter(users=request.user)
+    quizusers = list(QuizUser.objects.filter(
+        user=request.user).select_related('quiz').order_by('quiz__id'))
+    results = scoring.stored_scores((qu.user_id, qu.quiz_id) for qu in quizusers)
     quiznames = []
     scores = []
     totals = []
-    for quiz in quizzes:
-        quiznames.append(quiz.name)
-        point = score(request.user.id, quiz.id).get('score')
-        scores.append(point)
-        total = score(request.user.id, quiz.id).get('total')
-        totals.append(total)
+    for qu in quizusers:
+        result = results[(qu.user_id, qu.quiz_id)]
+        quiznames.append(qu.quiz.name)
+        scores.append(result.get('score'))
+        totals.append(result.get('total'))
     return render(request, 'myreport.html', {'reports': zip(quiznames, scores, totals)})
 
 
 @login_required(login_url='/login/')
 def users_report(request):
-    """Display the scoreboard to the superuser."""
+    """Display the scoreboard to the superuser a page at a time, or export it as CSV.
+
+    GET parameters: quiz, subject and difficulty filter the attempts, size is
+    the page size, after is the cursor of the page to show and format=csv
+    streams the whole filtered report as a CSV file.
+    """
+    if request.user.is_superuser:
+        filters = reports.get_filters(request.GET)
+        if request.GET.get('format') == 'csv':
+            response = StreamingHttpResponse(reports.export_csv(filters), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="usersreport.csv"'
+            return response
+        size = reports.get_page_size(request.GET)
+        rows, next_cursor = reports.page(filters, request.GET.get('after'), size)
+        params = dict(filters, size=size)
+        next_query = urlencode(dict(params, after=next_cursor)) if next_cursor else None
+        return render(request, 'usersreport.html', {
+            'reports': rows,
+            'filters': filters,
+            'size': size,
+            'next_query': next_query,
+            'csv_query': urlencode(dict(filters, format='csv')),
+        })
+    else:
+        return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
+
+
+@login_required(login_url='/login/')
+def quiz_analytics(request, quiz_id):
+    """Display the per-question and score statistics of a quiz to the superuser, or return them as JSON with format=json."""
     if request.user.is_superuser:
-        quiznames = []
-        usernames = []
-        scores = []
-        totals = []
-        quizzes = Quiz.objects.order_by('name')
-        quizzes = quizzes.exclude(users__id=None)
-        for quiz in quizzes:
-            for user in quiz.users.all():
-                quiznames.append(quiz.name)
-                usernames.append(user.username)
-                point = score(user.id, quiz.id).get('score')
-                scores.append(point)
-                total = score(user.id, quiz.id).get('total')
-                totals.append(total)
-        return render(request, 'usersreport.html', {'reports': zip(quiznames, usernames, scores, totals)})
+        quiz = get_object_or_404(Quiz, id=quiz_id)
+        stats = analytics.cached_stats(quiz.id)
+        if request.GET.get('format') == 'json':
+            return JsonResponse(dict(stats, quiz_name=quiz.name))
+        return render(request, 'quizAnalytics.html', {'quiz': quiz, 'stats': stats})
     else:
         return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
 
@@ -165,48 +306,19 @@ def users_report(request):
 @login_required(login_url='/login/')
 def report(request, user_id, quiz_id):
     """Render report.html to display the report page for the quiz."""
-    point = score(user_id, quiz_id).get('score')
-    total = score(user_id, quiz_id).get('total')
     user = get_object_or_404(User, id=user_id)
     quiz = get_object_or_404(Quiz, id=quiz_id)
+    if grading.ASYNC:
+        grading.finish(user.id, quiz.id)
+    result = scoring.stored_scores([(user.id, quiz.id)])[(user.id, quiz.id)]
+    point = result.get('score')
+    total = result.get('total')
     return render(request, 'report.html', {'score': point, 'total': total, 'quiz_name': quiz.name, 'user_name': user.username})
 
 
 def score(user_id, quiz_id):
     """Pass in the user_id and quiz_id and calculate user's score for the particular quiz."""
-    user = get_object_or_404(User, id=user_id)
-    choices = user.choice_set.all()
-    point = 0
-    total = 0
-    quiz = get_object_or_404(Quiz, id=quiz_id)
-    for question in quiz.question_set.all():
-        question_point = 0
-        question_total = 0
-        numCorrect = 0
-        numPartial = 0
-        numWrong = 0
-        selections = choices.filter(question=question.id)
-        for selection in selections:
-            if selection.point == 0:
-                numWrong = numWrong + 1
-            elif selection.point == 1:
-                numPartial = numPartial + 1
-            elif selection.point == 2:
-                numCorrect = numCorrect + 1
-        for choice in question.choice_set.all():
-            if choice.point == 2:
-                question_total = question_total + 1
-
-        if numWrong > 0:
-            question_point = 0
-        else:
-            question_point = numCorrect
-            if numPartial > 0:
-                for i in range(0, numPartial):
-                    question_point = question_point * 0.5
-        point = point + question_point
-        total = total + question_total
-    return {'score': point, 'total': total}
+    return scoring.score(user_id, quiz_id)
 
 
 @login_required(login_url='/login/')
@@ -214,7 +326,7 @@ def create_quiz(request):
     """For superuser to create new quizzes."""
     if(request.user.is_superuser):
         form = QuizForm()
-        quizzes = Quiz.objects.order_by('name')
+        quizzes = Quiz.objects.filter(archived=False).order_by('name')
         return render(request, 'createQuiz.html', {'form': form, 'lists': quizzes})
     else:
         return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
@@ -226,19 +338,71 @@ def create_question(request, quiz_id):
     if(request.user.is_superuser):
         quiz = get_object_or_404(Quiz, id=quiz_id)
         form = QuestionForm(initial={'quiz': quiz})
-        questions = Question.objects.order_by('text')
+        questions = paginate(request, Question.objects.filter(
+            quiz_id=quiz.id).order_by('text', 'id'))
         return render(request, 'createQuestion.html', {'form': form, 'quizID': int(quiz_id), 'quiz_name': quiz, 'lists': questions})
     else:
         return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
 
 
+@login_required(login_url='/login/')
+def edit_question(request, quiz_id, question_id=None):
+    """For superuser to create or edit a question together with all of its choices in one form."""
+    if(request.user.is_superuser):
+        quiz = get_object_or_404(Quiz, id=quiz_id)
+        if question_id is None:
+            question = Question(quiz=quiz)
+        else:
+            question = get_object_or_404(Question, id=question_id, quiz_id=quiz.id)
+        if request.method == 'POST':
+            form = QuestionForm(request.POST, instance=question)
+            formset = ChoiceFormSet(request.POST, instance=question, queryset=Choice.objects.order_by('id'))
+            if form.is_valid() and formset.is_valid():
+                save_question(quiz, form, formset)
+                if 'another' in request.POST:
+                    return HttpResponseRedirect(reverse('new_question', kwargs={'quiz_id': quiz.id}))
+                return HttpResponseRedirect(reverse('create_question', kwargs={'quiz_id': quiz.id}))
+        else:
+            form = QuestionForm(instance=question, initial={'quiz': quiz})
+            formset = ChoiceFormSet(instance=question, queryset=Choice.objects.order_by('id'))
+        return render(request, 'editQuestion.html', {'form': form, 'formset': formset, 'quizID': quiz.id, 'quiz_name': quiz, 'question': question})
+    else:
+        return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
+
+
+def save_question(quiz, form, formset):
+    """Save a question and its choices from the bulk editor in one transaction.
+
+    New choices are inserted with one bulk_create, changed choices are
+    updated with one UPDATE each for just the fields that changed, and
+    deleted choices are removed with one DELETE.
+    """
+    with transaction.atomic():
+        question = form.save(commit=False)
+        question.quiz = quiz
+        question.save()
+        formset.save(commit=False)
+        for choice in formset.new_objects:
+            choice.question_id = question.id
+        Choice.objects.bulk_create(formset.new_objects)
+        for choice, fields in formset.changed_objects:
+            Choice.objects.filter(id=choice.id).update(**dict((field, getattr(choice, field)) for field in fields))
+        if formset.deleted_objects:
+            Choice.objects.filter(id__in=[choice.id for choice in formset.deleted_objects]).delete()
+    # bulk_create and update send no post_save signals.
+    signals.quiz_content_changed(quiz.id)
+    counters.recount([quiz.id])
+    return question
+
+
 @login_required(login_url='/login/')
 def create_choice(request, quiz_id, question_id):
     """For superuser to create new choices."""
     if(request.user.is_superuser):
         question = get_object_or_404(Question, id=question_id)
         form = ChoiceForm(initial={'question': question})
-        choices = Choice.objects.order_by('text')
+        choices = paginate(request, Choice.objects.filter(
+            question_id=question.id).order_by('text', 'id'))
         return render(request, 'createChoice.html', {'form': form, 'quizID': int(quiz_id), 'questionID': int(question_id), 'question_name': question, 'lists': choices})
     else:
         return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
@@ -260,10 +424,16 @@ def add_quiz(request):
 @login_required(login_url='/login/')
 @require_http_methods(["POST"])
 def delete_quiz(request):
-    """Delete the quiz that superuser created."""
+    """Delete the quiz that superuser created.
+
+    The quiz is archived at once and its history is then removed in batches,
+    here or, with QUIZ_PURGE_ASYNC, by the purge_quizzes command.
+    """
     if 'delete' in request.POST and request.POST['delete'].isdigit():
         delete_quiz = get_object_or_404(Quiz, pk=request.POST['delete'])
-        delete_quiz.delete()
+        purge.archive(delete_quiz.id)
+        if not purge.ASYNC:
+            purge.purge(delete_quiz.id)
         return HttpResponseRedirect('/quiz_list/')
     else:
         return render(request, 'invalidAttempt.html', {'message': 'Invalid input!'})
@@ -289,7 +459,8 @@ def delete_question(request, quiz_id):
     if 'delete' in request.POST and request.POST['delete'].isdigit():
         delete_question = get_object_or_404(
             Question, pk=request.POST['delete'])
-        delete_question.delete()
+        with signals.content_changes():
+            delete_question.delete()
         return HttpResponseRedirect(reverse('question_list', kwargs={'quiz_id': quiz_id}))
     else:
         return render(request, 'invalidAttempt.html', {'message': 'Invalid input!'})
@@ -318,17 +489,52 @@ def delete_choice(request, quiz_id, question_id):
     """Delete the choice that superuser created."""
     if 'delete' in request.POST and request.POST['delete'].isdigit():
         delete_choice = get_object_or_404(Choice, pk=request.POST['delete'])
-        delete_choice.delete()
+        with signals.content_changes():
+            delete_choice.delete()
         return HttpResponseRedirect(reverse('choice_list', kwargs={'question_id': question_id, 'quiz_id': quiz_id}))
     else:
         return render(request, 'invalidAttempt.html', {'message': 'Invalid input!'})
 
 
+@login_required(login_url='/login/')
+def import_quizzes(request):
+    """For superuser to upload a JSON Lines or CSV file of quizzes with their questions and choices."""
+    if(request.user.is_superuser):
+        if request.method == 'POST':
+            form = QuizBankForm(request.POST, request.FILES)
+            if form.is_valid():
+                upload = form.cleaned_data['bank']
+                format = form.cleaned_data['format'] or bank.guess_format(upload.name)
+                try:
+                    created = bank.import_bank(upload, format)
+                except bank.InvalidBank as e:
+                    return render(request, 'quizBank.html', {'form': form, 'error': str(e)})
+                return render(request, 'quizBank.html', {'form': QuizBankForm(), 'created': created})
+        else:
+            form = QuizBankForm()
+        return render(request, 'quizBank.html', {'form': form})
+    else:
+        return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
+
+
+@login_required(login_url='/login/')
+def export_quizzes(request):
+    """For superuser to download every quiz with its questions and choices, as JSON Lines or with format=csv as CSV."""
+    if(request.user.is_superuser):
+        format = 'csv' if request.GET.get('format') == 'csv' else 'jsonl'
+        response = StreamingHttpResponse(bank.export_bank(format), content_type={
+            'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}[format])
+        response['Content-Disposition'] = 'attachment; filename="quizzes.%s"' % format
+        return response
+    else:
+        return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
+
+
 @login_required(login_url='/login/')
 def quiz_list(request):
     """Display the list of quizzes in the database."""
     if(request.user.is_superuser):
-        quizzes = Quiz.objects.order_by('name')
+        quizzes = Quiz.objects.filter(archived=False).order_by('name')
         return render(request, 'quizList.html', {'lists': quizzes})
     else:
         return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
@@ -338,7 +544,8 @@ def quiz_list(request):
 def question_list(request, quiz_id):
     """Display the list of questions in the database."""
     if(request.user.is_superuser):
-        questions = Question.objects.order_by('text')
+        questions = paginate(request, Question.objects.filter(
+            quiz_id=quiz_id).order_by('text', 'id'))
         return render(request, 'questionList.html', {'quizID': int(quiz_id), 'lists': questions})
     else:
         return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
@@ -348,7 +555,17 @@ def question_list(request, quiz_id):
 def choice_list(request, quiz_id, question_id):
     """Display the list of choices in the database."""
     if(request.user.is_superuser):
-        choices = Choice.objects.order_by('text')
+        choices = paginate(request, Choice.objects.filter(
+            question_id=question_id).order_by('text', 'id'))
         return render(request, 'choiceList.html', {'quizID': int(quiz_id), 'questionID': int(question_id), 'lists': choices})
     else:
         return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
+
+
+@login_required(login_url='/login/')
+def query_stats(request):
+    """Display the per-view request timings and query counts to the superuser."""
+    if(request.user.is_superuser):
+        return render(request, 'queryStats.html', {'stats': view_stats.summary()})
+    else:
+        return render(request, 'invalidAttempt.html', {'message': 'You are not a super user!'})
@@ -50,8 +50,51 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'quizXZ.middleware.QueryStatsMiddleware',
 )
 
+# Requests running more queries than this, or repeating one query shape more
+# than QUERY_STATS_MAX_REPEATS times, are flagged by QueryStatsMiddleware.
+QUERY_STATS_MAX_QUERIES = 30
+QUERY_STATS_MAX_REPEATS = 10
+
+# Fraction of requests whose queries QueryStatsMiddleware records. Recording
+# slows every query down, so measure all requests only while debugging.
+QUERY_STATS_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+
+# QueryStatsMiddleware logs one JSON line per measured request on the
+# quizXZ.querystats logger, at WARNING for flagged views and INFO otherwise.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'querystats': {
+            'format': '%(asctime)s %(levelname)s %(message)s',
+        },
+    },
+    'handlers': {
+        'querystats': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'querystats',
+        },
+    },
+    'loggers': {
+        'quizXZ.querystats': {
+            'handlers': ['querystats'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# When True a submission only saves the answers and queues a GradingJob,
+# which "python manage.py grade_worker" grades in the background.
+GRADING_ASYNC = False
+
+# When True deleting a quiz only archives it, and "python manage.py
+# purge_quizzes" removes it with its history later.
+QUIZ_PURGE_ASYNC = False
+
 ROOT_URLCONF = 'jango.urls'
 
 TEMPLATES = [
@@ -95,6 +138,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+# The rendered quiz questions and the content version of every quiz are
+# cached here. A change to a quiz moves it to a new version, which is how
+# the other worker processes learn that their cached questions and answer
+# keys are stale, so this cache must be shared by every process that serves
+# the site. Use memcached in production; the file cache needs no server.
+# LocMemCache keeps one store per process and is only safe with a single
+# process (the quizXZ.W001 check warns about it). The tests and the benchmark
+# command use a cache of their own (PRIVATE_CACHES in quizXZ/caching.py).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(PROJECT_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
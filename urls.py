@@ -32,12 +32,22 @@ urlpatterns = [
         views.delete_question, name='delete_question'),
     url(r'^(?P<quiz_id>\d+)/(?P<question_id>\d+)/delete_choice/$',
         views.delete_choice, name='delete_choice'),
+    url(r'^(?P<quiz_id>\d+)/new_question/$',
+        views.edit_question, name='new_question'),
+    url(r'^(?P<quiz_id>\d+)/(?P<question_id>\d+)/edit_question/$',
+        views.edit_question, name='edit_question'),
+    url(r'^import_quizzes/$', views.import_quizzes, name='import_quizzes'),
+    url(r'^export_quizzes/$', views.export_quizzes, name='export_quizzes'),
 
     url(r'^quizzes/$', views.quizzes, name='quizzes'),
     url(r'^(?P<quiz_id>\d+)/questions/$', views.questions, name='questions'),
     url(r'^(?P<quiz_id>\d+)/save_userchoice/$',
         views.save_userchoice, name='save_userchoice'),
+    url(r'^(?P<quiz_id>\d+)/take/$', views.take_quiz, name='take_quiz'),
+    url(r'^(?P<quiz_id>\d+)/autosave/$', views.autosave, name='autosave'),
     url(r'^users/report/$', views.users_report, name='users_report'),
     url(r'^my/report/$', views.my_report, name='my_report'),
     url(r'^(?P<user_id>\d+)/(?P<quiz_id>\d+)/report/$', views.report, name='report'),
+    url(r'^(?P<quiz_id>\d+)/analytics/$', views.quiz_analytics, name='quiz_analytics'),
+    url(r'^query_stats/$', views.query_stats, name='query_stats'),
 ]